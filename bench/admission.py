@@ -0,0 +1,181 @@
+"""Legitimate users' latency while one client floods the KDC, with and without admission control.
+
+Each phase forks a KDC (AS + TGS, threaded engine, fake DB) with the phase's admission
+settings. --users paced principals then run AS -> TGS flows from 127.0.0.1 while an abusive
+process (source 127.0.0.2) sends --abuse-rate AS_REQs and TGS_REQs per second for one
+principal from --abusers threads (open loop: it keeps sending whatever the replies say). Phases:
+  baseline            no abuser, admission on
+  abuse, no limits    abuser, admission off
+  abuse, admission    abuser, per-principal/per-source buckets and a concurrency limit
+
+    python -m bench.admission --users 8 --flow-rate 5 --abusers 16 --abuse-rate 1500 --seconds 5
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import threading
+import time
+from collections import Counter
+
+import client
+import kdc
+from bench.fake_db import FakeDatabase
+from bench.loadgen import HOST, free_port, wait_for_port
+from utils import kerberos_db, eventlog
+from utils.admission import Admission
+from utils.crypto import send_json, recv_json
+from utils.ticket_cache import TicketCache
+
+ABUSER_HOST = "127.0.0.2"
+
+
+def fork_kdc(epoch, as_port, tgs_port, limits):
+    pid = os.fork()
+    if pid:
+        return pid
+    kdc.log = lambda *a: None
+    eventlog.configure(path=os.devnull)
+    kdc.admission = Admission(**limits) if limits else Admission()
+    threading.Thread(target=kdc.run_as, args=(HOST, as_port, epoch, 1024), daemon=True).start()
+    threading.Thread(target=kdc.run_tgs, args=(HOST, tgs_port, epoch, 1024), daemon=True).start()
+    while True:
+        time.sleep(3600)
+
+
+def fork_abuser(epoch, as_port, tgs_port, threads, rate, seconds):
+    """Returns (pid, pipe the child reports its reply counts on)."""
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid:
+        os.close(w)
+        return pid, r
+    os.close(r)
+    client.cache = TicketCache(path=None)
+    Kc_tgs, tgt, _, _ = client.as_req(HOST, as_port, "mallory", "mallorypw", "tgs1", HOST, epoch, force=True)
+    deadline = time.perf_counter() + seconds
+    replies = Counter()
+    lock = threading.Lock()
+
+    def flood(i):
+        next_at = time.perf_counter()
+        while next_at < deadline:
+            time.sleep(max(0.0, next_at - time.perf_counter()))
+            next_at += threads / rate
+            if i % 2:
+                req, port = {"type": "AS_REQ", "IDc": "mallory", "IDtgs": "tgs1", "TS1": 0}, as_port
+            else:
+                # Stale authenticator, so admitted requests cost a full TGT decryption, then fail
+                auth = client.encrypt_obj({"IDc": "mallory", "ADc": HOST, "TS3": -1}, Kc_tgs)
+                req, port = {"type": "TGS_REQ", "IDv": "svc0", "Tickettgs": tgt, "Authenticatorc": auth}, tgs_port
+            try:
+                s = socket.create_connection((HOST, port), source_address=(ABUSER_HOST, 0))
+                send_json(s, req)
+                rep = recv_json(s)
+                s.close()
+                outcome = rep.get("reason", rep.get("type"))
+            except OSError:
+                outcome = "connection error"
+            with lock:
+                replies[outcome] += 1
+
+    pool = [threading.Thread(target=flood, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    os.write(w, json.dumps(dict(replies)).encode())
+    os._exit(0)
+
+
+def legit(args, epoch, as_port, tgs_port):
+    client.cache = TicketCache(path=None)
+    lat = {"AS": [], "TGS": []}
+    errors = []
+    deadline = time.perf_counter() + args.seconds
+
+    def user(i):
+        name, pw = f"user{i}", f"pw{i}"
+        next_at = time.perf_counter()
+        while next_at < deadline:
+            time.sleep(max(0.0, next_at - time.perf_counter()))
+            next_at += 1.0 / args.flow_rate
+            try:
+                t0 = time.perf_counter()
+                Kc_tgs, tgt, _, _ = client.as_req(HOST, as_port, name, pw, "tgs1", HOST, epoch, force=True)
+                t1 = time.perf_counter()
+                client.tgs_req(HOST, tgs_port, f"svc{i % 4}", tgt, Kc_tgs, name, HOST, epoch, force=True)
+                t2 = time.perf_counter()
+            except Exception as e:
+                errors.append(e)
+                continue
+            lat["AS"].append(t1 - t0)
+            lat["TGS"].append(t2 - t1)
+
+    pool = [threading.Thread(target=user, args=(i,)) for i in range(args.users)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return lat, errors
+
+
+def pct(samples, p):
+    if not samples:
+        return 0.0
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(len(s) * p / 100))] * 1000
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=8, help="Legitimate principals, one thread each")
+    ap.add_argument("--flow-rate", type=float, default=5.0, help="AS -> TGS flows/s per legitimate user")
+    ap.add_argument("--abusers", type=int, default=16, help="Threads in the abusive process")
+    ap.add_argument("--abuse-rate", type=float, default=1500.0, help="Abusive requests/s offered")
+    ap.add_argument("--seconds", type=float, default=5.0)
+    ap.add_argument("--principal-rate", type=float, default=20.0)
+    ap.add_argument("--source-rate", type=float, default=200.0)
+    ap.add_argument("--max-concurrent", type=int, default=64)
+    args = ap.parse_args()
+
+    db = FakeDatabase()
+    kerberos_db.set_database(db)
+    kerberos_db.add_tgs("tgs1", "bench_tgs_key", lifetime_tgt=10, lifetime_st=5)
+    kerberos_db.add_client("mallory", "mallorypw")
+    for i in range(args.users):
+        kerberos_db.add_client(f"user{i}", f"pw{i}")
+    for i in range(4):
+        kerberos_db.add_server(f"svc{i}", f"svckey{i}", 0)
+    eventlog.configure(path=os.devnull)
+
+    limits = {"principal_rate": args.principal_rate, "principal_burst": 2 * args.principal_rate,
+              "source_rate": args.source_rate, "source_burst": 2 * args.source_rate,
+              "max_concurrent": args.max_concurrent}
+    phases = [("baseline", limits, False), ("abuse, no limits", None, True), ("abuse, admission", limits, True)]
+    epoch = int(time.time())
+    for label, phase_limits, abuse in phases:
+        as_port, tgs_port = free_port(), free_port()
+        kdc_pid = fork_kdc(epoch, as_port, tgs_port, phase_limits)
+        wait_for_port(as_port)
+        wait_for_port(tgs_port)
+        abuser = fork_abuser(epoch, as_port, tgs_port, args.abusers, args.abuse_rate, args.seconds) if abuse else None
+        lat, errors = legit(args, epoch, as_port, tgs_port)
+        replies = {}
+        if abuser:
+            os.waitpid(abuser[0], 0)
+            with os.fdopen(abuser[1]) as f:
+                replies = json.loads(f.read() or "{}")
+        os.kill(kdc_pid, signal.SIGKILL)
+        os.waitpid(kdc_pid, 0)
+        flows = len(lat["TGS"])
+        print(f"{label:18s} flows={flows:5d} errors={len(errors):3d}  "
+              f"AS p50={pct(lat['AS'], 50):6.1f}ms p99={pct(lat['AS'], 99):7.1f}ms  "
+              f"TGS p50={pct(lat['TGS'], 50):6.1f}ms p99={pct(lat['TGS'], 99):7.1f}ms")
+        if replies:
+            print(f"{'':18s} abuser replies: {replies}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""AP_REQ throughput when the same clients present the same service tickets repeatedly.
+
+Starts one application server in-process, hands --clients principals a service ticket each
+(built directly with the server key, no KDC needed), then each client thread sends
+--requests-per-client APP_REQs over a keep-alive connection with fresh authenticators.
+Runs once with the verified-ticket cache and once without it, and also times
+server.process_app_req alone (no sockets, no client work in the same interpreter), which
+is where the saved ticket decryption shows up most clearly. Run from the repo root:
+
+    python -m bench.ap_repeat --clients 32 --requests-per-client 500
+"""
+import argparse
+import os
+import secrets
+import threading
+import time
+
+import client
+import server
+from bench.loadgen import HOST, free_port, wait_for_port
+from utils import eventlog
+from utils.crypto import encrypt_obj
+from utils.mux import MuxConnection
+from utils.verified_tickets import VerifiedTicketCache
+
+SERVICE, SERVICE_KEY = "benchsvc", "benchsvc_key"
+
+
+def issue_tickets(n, lifetime):
+    tickets = []
+    for i in range(n):
+        Kc_v = f"session{i}"
+        ticket = encrypt_obj({"Kc_v": Kc_v, "IDc": f"user{i}", "ADc": HOST, "IDv": SERVICE,
+                              "TS4": 0, "Lifetime4": lifetime}, SERVICE_KEY)
+        tickets.append((f"user{i}", Kc_v, ticket))
+    return tickets
+
+
+def run(port, tickets, per_client, epoch):
+    barrier = threading.Barrier(len(tickets) + 1)
+    errors = []
+
+    def worker(name, Kc_v, ticket):
+        conn = MuxConnection(HOST, port)
+        barrier.wait()
+        try:
+            for _ in range(per_client):
+                client.app_req(HOST, port, ticket, Kc_v, name, HOST, "bench", epoch, conn=conn)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=worker, args=t) for t in tickets]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    t0 = time.perf_counter()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - t0, errors
+
+
+def server_cpu(tickets, per_client, epoch):
+    """Seconds per process_app_req call over pre-built requests, and how many were refused."""
+    reqs = []
+    for name, Kc_v, ticket in tickets:
+        for _ in range(per_client):
+            auth = encrypt_obj({"IDc": name, "ADc": HOST, "TS5": 0, "nonce": secrets.token_hex(8)}, Kc_v)
+            reqs.append({"type": "APP_REQ", "Ticketv": ticket, "Authenticatorc": auth,
+                         "Message": encrypt_obj({"msg": "bench", "TS5": 0}, Kc_v)})
+    refused = 0
+    t0 = time.perf_counter()
+    for req in reqs:
+        refused += server.process_app_req(req, (HOST, 0), SERVICE, SERVICE_KEY, epoch)["type"] != "APP_REP"
+    return (time.perf_counter() - t0) / len(reqs), refused
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--clients", type=int, default=32)
+    ap.add_argument("--requests-per-client", type=int, default=500)
+    ap.add_argument("--lifetime", type=int, default=5, help="Service ticket lifetime in minutes")
+    args = ap.parse_args()
+
+    eventlog.configure(path=os.devnull)
+    server.log = lambda *a: None
+    epoch = int(time.time())
+    port = free_port()
+    threading.Thread(target=server.run_server, args=(SERVICE, SERVICE_KEY, port, epoch), daemon=True).start()
+    wait_for_port(port)
+
+    tickets = issue_tickets(args.clients, args.lifetime)
+    total = args.clients * args.requests_per_client
+    for label, size in (("no ticket cache", 0), ("ticket cache", 65536)):
+        server.ticket_cache = VerifiedTicketCache(size)
+        elapsed, errors = run(port, tickets, args.requests_per_client, epoch)
+        print(f"{label:16s} {total / elapsed:9,.0f} AP/s  ({total} requests, {elapsed:.2f}s, "
+              f"errors={len(errors)}, cache={server.ticket_cache.stats()})")
+        server.ticket_cache = VerifiedTicketCache(size)
+        per_req, refused = server_cpu(tickets, args.requests_per_client, epoch)
+        print(f"{'':16s} {per_req * 1e6:9.1f} us/request in process_app_req (refused={refused})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Fetch service tickets for many services: sequential tgs_req vs KerberosClient.get_service_tickets.
+
+Needs a running KDC and the services registered in the auth DB. Run from the repo root:
+
+    python -m bench.batch_tickets --services ftpServer mailServer
+
+Both sides fetch one ticket per distinct service (get_service_tickets drops duplicates).
+"""
+import argparse
+import time
+from client import (KerberosClient, as_req, tgs_req, CLIENT_NAME, CLIENT_PASSWORD, CLIENT_AD, TGS_ID,
+                    AS_HOST, AS_PORT, TGS_HOST, TGS_PORT)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--services", nargs="+", required=True)
+    ap.add_argument("--pool-size", type=int, default=2)
+    ap.add_argument("--initial-wall-clock", type=int, default=None)
+    args = ap.parse_args()
+
+    epoch = args.initial_wall_clock
+    if epoch is None:
+        with open("epoch.txt") as f:
+            epoch = int(f.read().strip())
+    services = list(dict.fromkeys(args.services))
+    as_port, tgs_port = int(AS_PORT), int(TGS_PORT)
+
+    Kc_tgs, tgt, _, _ = as_req(AS_HOST, as_port, CLIENT_NAME, CLIENT_PASSWORD, TGS_ID, CLIENT_AD, epoch)
+
+    t0 = time.perf_counter()
+    seq_errors = 0
+    for svc in services:
+        try:
+            tgs_req(TGS_HOST, tgs_port, svc, tgt, Kc_tgs, CLIENT_NAME, CLIENT_AD, epoch, force=True)
+        except Exception:
+            seq_errors += 1
+    sequential = time.perf_counter() - t0
+
+    kc = KerberosClient(CLIENT_NAME, CLIENT_PASSWORD, epoch, pool_size=args.pool_size)
+    try:
+        kc.get_tgt()  # warm the pooled connections
+        t0 = time.perf_counter()
+        tickets, errors = kc.get_service_tickets(services, force=True)
+        batched = time.perf_counter() - t0
+    finally:
+        kc.close()
+
+    n = len(services)
+    print(f"{n} TGS requests, one per service")
+    print(f"sequential : {sequential * 1000:8.1f} ms total  {n / sequential:8.1f} req/s  errors={seq_errors}")
+    print(f"batched    : {batched * 1000:8.1f} ms total  {n / batched:8.1f} req/s  errors={len(errors)}")
+    print(f"speedup    : {sequential / batched:8.2f}x")
+    for svc, e in sorted(errors.items()):
+        print(f"  {svc}: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""Hours of ticket churn for thousands of principals in seconds, on a virtual clock.
+
+The KDC runs in-process on a fake DB and client._exchange is routed straight to its handlers,
+so every AS/TGS request goes through the real client cache, single-flight and renewal code and
+the real KDC checks, with no sockets. A VirtualClock with rate 0 (utils/clock.py) only moves
+when the simulator steps it, --step virtual seconds at a time through --hours. Each principal
+has its own ticket cache (as if on its own host), logs in at a random moment within
+--login-spread minutes (0 = everyone at once, the storm case), then:
+  - uses each of --services at random, --use-rate times per virtual minute; a ticket comes
+    from the cache or is fetched inline while the user waits (an inline miss)
+  - with --renew, runs renew_tickets every --renew-interval (+ up to --jitter) virtual seconds,
+    --refresh-ahead minutes before TS + Lifetime
+Reports KDC requests per virtual minute (mean, p99, the peak minutes and a sparkline), inline
+misses, renewals and errors. The same --seed gives the same run.
+
+    python -m bench.clock_sim --principals 2000 --hours 3 --login-spread 0 --renew
+"""
+import argparse
+import heapq
+import os
+import random
+import time
+from collections import Counter
+
+import client
+import kdc
+from bench.fake_db import FakeDatabase
+from bench.loadgen import HOST
+from utils import kerberos_db, eventlog, clock
+from utils.clock import VirtualClock
+from utils.replay_cache import ReplayCache
+from utils.ticket_cache import TicketCache
+
+AS_PORT, TGS_PORT = 1, 2  # routing keys for the in-process exchange, never bound
+SPARK = " .:-=+*#%@"
+
+
+def route(epoch, load):
+    """client._exchange replacement: hands requests to the KDC handlers, counted per virtual minute."""
+    handlers = {AS_PORT: ("AS", kdc.process_as_req), TGS_PORT: ("TGS", kdc.process_tgs_req)}
+
+    def exchange(host, port, req, conn=None):
+        exchange_name, process = handlers[port]
+        load[int((clock.now() - epoch) // 60)][exchange_name] += 1
+        return process(req, (HOST, 0), epoch)
+    return exchange
+
+
+def sparkline(values, width):
+    """values squeezed into width columns (max per column), scaled to SPARK."""
+    if not values:
+        return ""
+    per = max(1, -(-len(values) // width))
+    cols = [max(values[i:i + per]) for i in range(0, len(values), per)]
+    top = max(cols) or 1
+    return "".join(SPARK[min(len(SPARK) - 1, round(v / top * (len(SPARK) - 1)))] for v in cols)
+
+
+def simulate(args):
+    rng = random.Random(args.seed)
+    epoch = int(time.time()) // 60 * 60
+    vclock = clock.use(VirtualClock(start=epoch, rate=0))
+    kdc.replay_cache = ReplayCache(window=args.tgt_lifetime + 1)
+    load = [Counter() for _ in range(int(args.hours * 60) + 2)]
+    client._exchange = route(epoch, load)
+
+    names = [f"user{i}" for i in range(args.principals)]
+    services = [f"svc{i}" for i in range(args.services)]
+    caches = [TicketCache(path=None, l1_size=4 * (args.services + 1), stripes=1) for _ in names]
+
+    # (virtual seconds since the epoch, tiebreak, principal, action, service)
+    events = []
+    seq = 0
+
+    def schedule(at, i, action, svc=None):
+        nonlocal seq
+        seq += 1
+        heapq.heappush(events, (at, seq, i, action, svc))
+
+    for i in range(args.principals):
+        login = rng.uniform(0, args.login_spread * 60)
+        for svc in services:
+            schedule(login, i, "use", svc)  # everyone needs their tickets when they log in
+        if args.renew:
+            schedule(login + args.renew_interval + rng.uniform(0, args.jitter), i, "renew")
+
+    end = args.hours * 3600
+    errors = Counter()
+    started = time.perf_counter()
+    t = 0.0
+    while t <= end:
+        vclock.set(epoch + t)
+        while events and events[0][0] <= t:
+            at, _, i, action, svc = heapq.heappop(events)
+            client.cache = caches[i]
+            name, pw = names[i], f"pw{i}"
+            if action == "use":
+                try:
+                    Kc_tgs, tgt, _, _ = client.as_req(HOST, AS_PORT, name, pw, "tgs1", HOST, epoch)
+                    client.tgs_req(HOST, TGS_PORT, svc, tgt, Kc_tgs, name, HOST, epoch)
+                except Exception as e:
+                    errors[str(e)[:80]] += 1
+                schedule(at + rng.expovariate(args.use_rate / 60.0), i, "use", svc)
+            else:
+                client.renew_tickets(name, pw, epoch, args.refresh_ahead, as_host=HOST, as_port=AS_PORT,
+                                     tgs_host=HOST, tgs_port=TGS_PORT, adc=HOST)
+                schedule(at + args.renew_interval + rng.uniform(0, args.jitter), i, "renew")
+        t += args.step
+    elapsed = time.perf_counter() - started
+
+    stats = Counter()
+    for c in caches:
+        client.cache = c
+        stats.update(client.renewal_stats())
+    return load[:int(args.hours * 60) + 1], stats, errors, elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--principals", type=int, default=1000)
+    ap.add_argument("--services", type=int, default=2, help="Services each principal uses")
+    ap.add_argument("--hours", type=float, default=2.0, help="Virtual time to simulate")
+    ap.add_argument("--step", type=float, default=15.0, help="Virtual seconds per clock step")
+    ap.add_argument("--login-spread", type=float, default=0.0,
+                    help="Minutes over which principals first log in (0 = all at once)")
+    ap.add_argument("--use-rate", type=float, default=0.2, help="Uses of each service per principal per virtual minute")
+    ap.add_argument("--renew", action="store_true", help="Run renew_tickets per principal, like client.py --renew")
+    ap.add_argument("--refresh-ahead", type=int, default=1)
+    ap.add_argument("--renew-interval", type=float, default=30.0, help="Virtual seconds between renewal scans")
+    ap.add_argument("--jitter", type=float, default=15.0, help="Random extra virtual seconds per renewal scan")
+    ap.add_argument("--tgt-lifetime", type=int, default=10, help="Minutes")
+    ap.add_argument("--sgt-lifetime", type=int, default=5, help="Minutes")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    kerberos_db.set_database(FakeDatabase())
+    kerberos_db.add_tgs("tgs1", "bench_tgs_key", lifetime_tgt=args.tgt_lifetime, lifetime_st=args.sgt_lifetime)
+    for i in range(args.principals):
+        kerberos_db.add_client(f"user{i}", f"pw{i}")
+    for i in range(args.services):
+        kerberos_db.add_server(f"svc{i}", f"svckey{i}", 0)
+    eventlog.configure(path=os.devnull, sample={"AS": 0, "TGS": 0})  # errors are still logged
+    client.log = lambda *a: None  # renewal failures are counted in renewal_errors
+
+    load, stats, errors, elapsed = simulate(args)
+    per_minute = [m["AS"] + m["TGS"] for m in load]
+    ranked = sorted(per_minute)
+    total_as = sum(m["AS"] for m in load)
+    total_tgs = sum(m["TGS"] for m in load)
+    print(f"{args.principals} principals x {args.services} services, {args.hours:g}h virtual in {elapsed:.1f}s "
+          f"({args.hours * 3600 / elapsed:,.0f}x), TGT {args.tgt_lifetime}m / SGT {args.sgt_lifetime}m, "
+          f"login spread {args.login_spread:g}m, renewal {'on' if args.renew else 'off'}")
+    print(f"  KDC requests     AS={total_as:,}  TGS={total_tgs:,}  "
+          f"({(total_as + total_tgs) / elapsed:,.0f}/s of simulation)")
+    print(f"  per minute       mean={sum(per_minute) / len(per_minute):,.0f}  "
+          f"p99={ranked[int(len(ranked) * 0.99) - 1]:,}  max={ranked[-1]:,}")
+    peaks = sorted(range(len(per_minute)), key=lambda m: -per_minute[m])[:5]
+    print("  peak minutes     " + "  ".join(f"m{m}: AS={load[m]['AS']} TGS={load[m]['TGS']}" for m in sorted(peaks)))
+    print(f"  inline misses    TGT={stats['inline_miss_tgt']:,}  SGT={stats['inline_miss_sgt']:,}  "
+          f"(users waiting on the KDC)")
+    print(f"  renewed          TGT={stats['renewed_tgt']:,}  SGT={stats['renewed_sgt']:,}  "
+          f"errors={stats['renewal_errors']}")
+    print(f"  request errors   {sum(errors.values())}" + (f"  {dict(errors.most_common(3))}" if errors else ""))
+    print(f"  load/minute      |{sparkline(per_minute, 100)}|")
+
+
+if __name__ == "__main__":
+    main()
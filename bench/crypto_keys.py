@@ -0,0 +1,78 @@
+"""Microbenchmark encrypt_obj/decrypt_obj with and without the key schedule cache.
+
+Message shapes mirror the AS, TGS and AP exchanges. Run from the repo root:
+
+    python -m bench.crypto_keys --seconds 1
+"""
+import argparse
+import time
+from utils.crypto import encrypt_obj, decrypt_obj, set_key_cache_size, KeyHandle
+
+KTGS = "22csb0c14_22csb0a05_kerberos_v4_tgs"
+KC = "22csb0a05_sk2202"
+KV = "fileserverkey"
+
+TGT = {"Kc_tgs": "Kc_tgs::Sai_Kartik::12", "IDc": "Sai_Kartik", "ADc": "127.0.0.1",
+       "IDtgs": "tgs1", "TS2": 12, "Lifetime2": 10}
+TICKETV = {"Kc_v": "Kc_v::Sai_Kartik::ftpServer::12", "IDc": "Sai_Kartik", "ADc": "127.0.0.1",
+           "IDv": "ftpServer", "TS4": 12, "Lifetime4": 5}
+
+
+def as_exchange(k):
+    # AS: build TGT under Ktgs, wrap it for the client
+    t = encrypt_obj(TGT, k["ktgs"])
+    rep = encrypt_obj({"Kc_tgs": TGT["Kc_tgs"], "IDtgs": "tgs1", "TS2": 12, "Lifetime2": 10, "Tickettgs": t}, k["kc"])
+    decrypt_obj(rep, k["kc"])
+
+
+def tgs_exchange(k):
+    # TGS: decrypt TGT + authenticator, issue ticket under Kv, wrap under Kc_tgs
+    tgt = encrypt_obj(TGT, k["ktgs"])
+    auth = encrypt_obj({"IDc": "Sai_Kartik", "ADc": "127.0.0.1", "TS3": 12}, TGT["Kc_tgs"])
+    decrypt_obj(tgt, k["ktgs"])
+    decrypt_obj(auth, TGT["Kc_tgs"])
+    tv = encrypt_obj(TICKETV, k["kv"])
+    encrypt_obj({"Kc_v": TICKETV["Kc_v"], "IDv": "ftpServer", "TS4": 12, "Lifetime4": 5, "Ticketv": tv},
+                TGT["Kc_tgs"])
+
+
+def ap_exchange(k):
+    # AP: decrypt ticket, authenticator and message, encrypt the ACK
+    tv = encrypt_obj(TICKETV, k["kv"])
+    decrypt_obj(tv, k["kv"])
+    decrypt_obj(encrypt_obj({"IDc": "Sai_Kartik", "ADc": "127.0.0.1", "TS5": 12}, TICKETV["Kc_v"]), TICKETV["Kc_v"])
+    decrypt_obj(encrypt_obj({"msg": "Hello file", "TS5": 12}, TICKETV["Kc_v"]), TICKETV["Kc_v"])
+    encrypt_obj({"ack": "Hello Sai_Kartik, message received by ftpServer.", "TS5+1": 13}, TICKETV["Kc_v"])
+
+
+def ops_per_sec(fn, keys, seconds):
+    n, t0 = 0, time.perf_counter()
+    while time.perf_counter() - t0 < seconds:
+        fn(keys)
+        n += 1
+    return n / (time.perf_counter() - t0)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seconds", type=float, default=1.0)
+    args = ap.parse_args()
+
+    plain = {"ktgs": KTGS, "kc": KC, "kv": KV}
+    handles = {name: KeyHandle(pw) for name, pw in plain.items()}
+    modes = [
+        ("uncached", 0, plain),
+        ("lru cache", 256, plain),
+        ("KeyHandle", 256, handles),
+    ]
+    print(f"{'exchange':<8} " + " ".join(f"{m:>12}" for m, _, _ in modes) + "   (exchanges/sec)")
+    for name, fn in (("AS", as_exchange), ("TGS", tgs_exchange), ("AP", ap_exchange)):
+        row = []
+        for _, size, keys in modes:
+            set_key_cache_size(size)
+            row.append(ops_per_sec(fn, keys, args.seconds))
+        print(f"{name:<8} " + " ".join(f"{r:>12.0f}" for r in row))
+
+
+if __name__ == "__main__":
+    main()
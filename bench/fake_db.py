@@ -0,0 +1,46 @@
+"""In-process stand-in for the Mongo collections used by utils/kerberos_db."""
+import threading
+
+
+class FakeCollection:
+    def __init__(self):
+        self._docs = []
+        self._index = {}   # (field, value) -> doc, for the name/idtgs lookups
+        self._lock = threading.Lock()
+
+    def insert_one(self, doc):
+        with self._lock:
+            doc = dict(doc, _id=len(self._docs) + 1)
+            self._docs.append(doc)
+            for field in ("name", "idtgs"):
+                if field in doc:
+                    self._index.setdefault((field, doc[field]), doc)
+
+    def insert_many(self, docs, ordered=True):
+        for doc in docs:
+            self.insert_one(doc)
+
+    def find_one(self, filter=None, projection=None, sort=None):
+        with self._lock:
+            if not filter:
+                if not self._docs:
+                    return None
+                return self._docs[-1] if sort else self._docs[0]
+            (field, value), = filter.items()
+            doc = self._index.get((field, value))
+            if doc is None and field not in ("name", "idtgs"):
+                doc = next((d for d in self._docs if d.get(field) == value), None)
+            return dict(doc) if doc else None
+
+    def estimated_document_count(self):
+        return len(self._docs)
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.clients = FakeCollection()
+        self.servers = FakeCollection()
+        self.tgs = FakeCollection()
+
+    def __getitem__(self, name):
+        return getattr(self, name)
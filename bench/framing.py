@@ -0,0 +1,158 @@
+"""Copies and allocations per framed message: the previous framing vs recv_into/sendmsg.
+
+For each body size, over a local socketpair with a reader thread on the other end:
+  recv   peak bytes allocated while receiving one raw frame (tracemalloc), as a multiple of
+         the body size, and frames/s
+  send   the same for framing + sending one message (json.dumps/wire.pack included)
+The previous implementation is reproduced below (recv into a growing bytearray, then copy it to
+bytes; header + packed body concatenated before sendall). Also checks that a header claiming
+a 2 GB body is refused before anything is allocated.
+
+    python -m bench.framing --sizes 256 16384 1048576 --wire json
+"""
+import argparse
+import json
+import socket
+import struct
+import threading
+import time
+import tracemalloc
+
+from utils import wire
+from utils.crypto import _json_default, _parse_header, recv_raw_frame, send_json, set_max_frame
+from utils.wire import WIRE_JSON, WIRE_BINARY
+
+
+# ---------- previous framing, for comparison ----------
+def _recvall_copy(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("Connection closed during recv")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def old_recv_raw_frame(sock):
+    hdr = _recvall_copy(sock, 4)
+    wire_version, n = _parse_header(hdr)
+    return hdr, _recvall_copy(sock, n), wire_version
+
+
+def old_frame(obj, wire_version=WIRE_JSON):
+    if wire_version == WIRE_JSON:
+        data = json.dumps(obj, default=_json_default).encode('utf-8')
+        return struct.pack('!I', len(data)) + data
+    data = wire.pack(obj)
+    return bytes([0x80 | wire_version]) + len(data).to_bytes(3, 'big') + data
+
+
+def old_send_json(sock, obj, wire_version=WIRE_JSON):
+    sock.sendall(old_frame(obj, wire_version))
+
+
+# ---------- measurement ----------
+def message(size, wire_version):
+    return {"type": "SESSION_DATA", "seq": 1, "data": b"x" * size if wire_version == WIRE_BINARY else "x" * size}
+
+
+def drain(sock, stop):
+    """Reads and discards everything into one fixed buffer (allocates nothing per read)."""
+    view = memoryview(bytearray(1 << 20))
+    while not stop.is_set():
+        try:
+            if not sock.recv_into(view):
+                return
+        except OSError:
+            return
+
+
+def feed(sock, frame, count):
+    for _ in range(count):
+        sock.sendall(frame)
+
+
+def measure(op, count, traced=20):
+    """(peak extra bytes over `traced` calls under tracemalloc, calls/s over `count` untraced calls)."""
+    op()  # warm up
+    t0 = time.perf_counter()
+    for _ in range(count):
+        op()
+    rate = count / (time.perf_counter() - t0)
+    tracemalloc.start()
+    peak = 0
+    for _ in range(traced):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        op()
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    return peak, rate
+
+
+def measure_recv(recv, frame, count):
+    a, b = socket.socketpair()
+    threading.Thread(target=feed, args=(a, frame, count + 21), daemon=True).start()
+    result = measure(lambda: recv(b), count)
+    a.close()
+    b.close()
+    return result
+
+
+def measure_send(send, msg, wire_version, count):
+    a, b = socket.socketpair()
+    stop = threading.Event()
+    threading.Thread(target=drain, args=(b, stop), daemon=True).start()
+    result = measure(lambda: send(a, msg, wire_version), count)
+    stop.set()
+    a.close()
+    b.close()
+    return result
+
+
+def bogus_header():
+    """A 2 GB length header: refused before the body is read or allocated?"""
+    a, b = socket.socketpair()
+    a.sendall(struct.pack("!I", 0x7FFFFFFF))
+    tracemalloc.start()
+    try:
+        recv_raw_frame(b)
+        outcome = "accepted"
+    except ValueError as e:
+        outcome = str(e)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    a.close()
+    b.close()
+    return outcome, peak
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[256, 16384, 1048576], help="Body sizes in bytes")
+    ap.add_argument("--count", type=int, default=2000, help="Messages per throughput measurement")
+    ap.add_argument("--wire", choices=["json", "binary"], default="json")
+    args = ap.parse_args()
+
+    wire_version = WIRE_BINARY if args.wire == "binary" else WIRE_JSON
+    set_max_frame(max(args.sizes) * 2 + 1024)
+    print(f"{args.wire} frames; peak = most extra bytes allocated during one call / frame body size")
+    for size in args.sizes:
+        msg = message(size, wire_version)
+        frame = old_frame(msg, wire_version)
+        body = len(frame) - 4
+        count = max(20, min(args.count, (64 << 20) // body))
+        for label, recv in (("old", old_recv_raw_frame), ("new", recv_raw_frame)):
+            peak, rate = measure_recv(recv, frame, count)
+            print(f"  {body:>9,}B  recv {label}  peak {peak / body:5.2f}x  {rate:10,.0f} frames/s")
+        for label, send in (("old", old_send_json), ("new", send_json)):
+            peak, rate = measure_send(send, msg, wire_version, count)
+            print(f"  {body:>9,}B  send {label}  peak {peak / body:5.2f}x  {rate:10,.0f} frames/s")
+
+    outcome, peak = bogus_header()
+    print(f"2 GB length header: {outcome} (peak {peak:,} bytes allocated)")
+
+
+if __name__ == "__main__":
+    main()
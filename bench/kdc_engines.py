@@ -0,0 +1,94 @@
+"""Compare the threaded and asyncio KDC engines on AS_REQ throughput and latency.
+
+Needs the Mongo auth DB populated by setup_db.py. Run from the repo root:
+
+    python -m bench.kdc_engines --requests 5000 --concurrency 200
+"""
+import argparse
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.crypto import send_json, recv_json
+
+
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(len(s) * p / 100))]
+
+
+def wait_for_port(host, port, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"KDC did not come up on {host}:{port}")
+
+
+def one_as_req(host, port, client_name, idtgs):
+    t0 = time.perf_counter()
+    s = socket.create_connection((host, port))
+    try:
+        send_json(s, {"type": "AS_REQ", "IDc": client_name, "IDtgs": idtgs, "TS1": 0})
+        rep = recv_json(s)
+    finally:
+        s.close()
+    return time.perf_counter() - t0, rep.get("type") == "AS_REP"
+
+
+def run_load(host, port, requests, concurrency, client_name, idtgs):
+    latencies, errors = [], 0
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futs = [pool.submit(one_as_req, host, port, client_name, idtgs) for _ in range(requests)]
+        for f in futs:
+            try:
+                dt, ok = f.result()
+                latencies.append(dt)
+                errors += not ok
+            except OSError:
+                errors += 1
+    elapsed = time.perf_counter() - t0
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "errors": errors,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--as-port", type=int, default=16000)
+    ap.add_argument("--tgs-port", type=int, default=16001)
+    ap.add_argument("--requests", type=int, default=2000)
+    ap.add_argument("--concurrency", type=int, default=100)
+    ap.add_argument("--client", default="Sai_Kartik")
+    ap.add_argument("--idtgs", default="tgs1")
+    ap.add_argument("--engines", nargs="+", default=["threaded", "asyncio"])
+    args = ap.parse_args()
+
+    print(f"{'engine':<10} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'errors':>8}")
+    for engine in args.engines:
+        kdc = subprocess.Popen([sys.executable, "kdc.py", "--engine", engine, "--host", args.host,
+                                "--as-port", str(args.as_port), "--tgs-port", str(args.tgs_port),
+                                "--initial-wall-clock", str(int(time.time()))],
+                               stdout=subprocess.DEVNULL)
+        try:
+            wait_for_port(args.host, args.as_port)
+            r = run_load(args.host, args.as_port, args.requests, args.concurrency, args.client, args.idtgs)
+            print(f"{engine:<10} {r['rps']:>10.1f} {r['p50_ms']:>10.2f} {r['p99_ms']:>10.2f} {r['errors']:>8}")
+        finally:
+            kdc.terminate()
+            kdc.wait()
+
+
+if __name__ == "__main__":
+    main()
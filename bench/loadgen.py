@@ -0,0 +1,219 @@
+"""Load generator for the full AS -> TGS -> AP flow.
+
+Starts the KDC (AS + TGS) and N application servers in this process against an in-memory
+fake of utils/kerberos_db, then drives simulated principals through client.py's as_req /
+tgs_req / app_req. Run from the repo root:
+
+    python -m bench.loadgen --principals 5000 --servers 4 --requests 20000 --concurrency 64 \\
+        --sgt-hit-ratio 0.8 --json results.json
+"""
+import argparse
+import json
+import random
+import socket
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import client
+import kdc
+import server
+from bench.fake_db import FakeDatabase
+from utils import kerberos_db, metrics, eventlog
+from utils.crypto import now_minutes
+from utils.ticket_cache import TicketCache, tgt_key, sgt_key
+
+HOST = "127.0.0.1"
+BUCKETS_MS = [0.25, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, float("inf")]
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {"AS": [], "TGS": [], "AP": []}
+        self.errors = Counter()
+        self.cache_hits = Counter()
+
+    def ok(self, exchange, seconds):
+        with self._lock:
+            self.latencies[exchange].append(seconds * 1000)
+
+    def hit(self, kind):
+        with self._lock:
+            self.cache_hits[kind] += 1
+
+    def error(self, exchange, exc):
+        with self._lock:
+            self.errors[f"{exchange}: {exc}"[:160]] += 1
+
+
+def histogram(samples):
+    if not samples:
+        return {"count": 0}
+    s = sorted(samples)
+    pct = lambda p: round(s[min(len(s) - 1, int(len(s) * p / 100))], 3)
+    counts, i = [], 0
+    for bound in BUCKETS_MS:
+        n = 0
+        while i < len(s) and s[i] <= bound:
+            n += 1
+            i += 1
+        counts.append(n)
+    return {
+        "count": len(s),
+        "mean_ms": round(sum(s) / len(s), 3),
+        "p50_ms": pct(50), "p90_ms": pct(90), "p99_ms": pct(99), "max_ms": round(s[-1], 3),
+        "buckets_ms": {("+inf" if b == float("inf") else str(b)): c for b, c in zip(BUCKETS_MS, counts)},
+    }
+
+
+def free_port():
+    s = socket.socket()
+    s.bind((HOST, 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def wait_for_port(port, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection((HOST, port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.02)
+    raise RuntimeError(f"nothing listening on {HOST}:{port}")
+
+
+def start_system(args, epoch):
+    kerberos_db.set_database(FakeDatabase())
+    kerberos_db.add_tgs("tgs1", "bench_tgs_key", lifetime_tgt=args.tgt_lifetime, lifetime_st=args.sgt_lifetime)
+    for i in range(args.principals):
+        kerberos_db.add_client(f"user{i}", f"pw{i}")
+
+    as_port, tgs_port = free_port(), free_port()
+    threading.Thread(target=kdc.run_as, args=(HOST, as_port, epoch), daemon=True).start()
+    threading.Thread(target=kdc.run_tgs, args=(HOST, tgs_port, epoch), daemon=True).start()
+
+    services = {}
+    for j in range(args.servers):
+        name, port = f"svc{j}", free_port()
+        kerberos_db.add_server(name, f"svckey{j}", port)
+        threading.Thread(target=server.run_server, args=(name, f"svckey{j}", port, epoch, HOST),
+                         daemon=True).start()
+        services[name] = port
+
+    for port in [as_port, tgs_port, *services.values()]:
+        wait_for_port(port)
+    return as_port, tgs_port, services
+
+
+def one_flow(args, epoch, as_port, tgs_port, services, rec, rng):
+    i = rng.randrange(args.principals)
+    name, pw = f"user{i}", f"pw{i}"
+    svc = rng.choice(list(services))
+    nowm = now_minutes(epoch)
+
+    tgt = client.cache.get(tgt_key(name))
+    if tgt and nowm <= tgt["TS2"] + tgt["Lifetime2"]:
+        rec.hit("tgt")
+        Kc_tgs, Tickettgs = tgt["Kc_tgs"], tgt["Tickettgs"]
+    else:
+        t0 = time.perf_counter()
+        try:
+            Kc_tgs, Tickettgs, _, _ = client.as_req(HOST, as_port, name, pw, "tgs1", HOST, epoch, force=True)
+        except Exception as e:
+            return rec.error("AS", e)
+        rec.ok("AS", time.perf_counter() - t0)
+
+    sgt = client.cache.get(sgt_key(name, svc))
+    if sgt and nowm <= sgt["TS4"] + sgt["Lifetime4"] and rng.random() < args.sgt_hit_ratio:
+        rec.hit("sgt")
+        Kc_v, Ticketv = sgt["Kc_v"], sgt["Ticketv"]
+    else:
+        t0 = time.perf_counter()
+        try:
+            Kc_v, Ticketv, _, _ = client.tgs_req(HOST, tgs_port, svc, Tickettgs, Kc_tgs, name, HOST, epoch,
+                                                 force=True)
+        except Exception as e:
+            return rec.error("TGS", e)
+        rec.ok("TGS", time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    try:
+        client.app_req(HOST, services[svc], Ticketv, Kc_v, name, HOST, "bench", epoch)
+    except Exception as e:
+        return rec.error("AP", e)
+    rec.ok("AP", time.perf_counter() - t0)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--principals", type=int, default=1000)
+    ap.add_argument("--servers", type=int, default=2)
+    ap.add_argument("--requests", type=int, default=5000, help="Full client flows to run")
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--sgt-hit-ratio", type=float, default=0.8,
+                    help="Probability a flow reuses a valid cached service ticket")
+    ap.add_argument("--tgt-lifetime", type=int, default=10, help="Minutes")
+    ap.add_argument("--sgt-lifetime", type=int, default=5, help="Minutes")
+    ap.add_argument("--l1-size", type=int, default=None,
+                    help="In-memory ticket cache entries (default: every principal's TGT and service tickets)")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--quiet", action="store_true", help="Silence per-request log lines")
+    ap.add_argument("--event-log", default=None, help="Write request events to this file instead of stdout")
+    ap.add_argument("--metrics-port", type=int, default=0,
+                    help="Enable stage instrumentation and serve /metrics here (to measure its overhead)")
+    ap.add_argument("--json", default=None, help="Write results to this file instead of stdout")
+    args = ap.parse_args()
+
+    if args.quiet:
+        for mod in (kdc, server):
+            mod.log = lambda *a: None
+        eventlog.configure(sample={"AS": 0, "TGS": 0, "AP": 0})
+    elif args.event_log:
+        eventlog.configure(path=args.event_log)
+
+    if args.metrics_port:
+        metrics.start_http_server(args.metrics_port)
+
+    epoch = int(time.time())
+    l1_size = args.l1_size or args.principals * (args.servers + 1)
+    client.cache = TicketCache(path=None, l1_size=l1_size)
+    as_port, tgs_port, services = start_system(args, epoch)
+
+    rec = Recorder()
+    rngs = threading.local()
+
+    def task(_):
+        if not hasattr(rngs, "rng"):
+            rngs.rng = random.Random(args.seed + threading.get_ident())
+        one_flow(args, epoch, as_port, tgs_port, services, rec, rngs.rng)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(task, range(args.requests)))
+    elapsed = time.perf_counter() - t0
+
+    result = {
+        "config": vars(args),
+        "elapsed_s": round(elapsed, 3),
+        "flows_per_s": round(args.requests / elapsed, 1),
+        "exchanges": {ex: dict(histogram(lat), per_s=round(len(lat) / elapsed, 1))
+                      for ex, lat in rec.latencies.items()},
+        "cache_hits": dict(rec.cache_hits),
+        "ticket_cache": client.cache.stats(),
+        "errors": dict(rec.errors.most_common()),
+        "error_total": sum(rec.errors.values()),
+    }
+    out = json.dumps(result, indent=2)
+    if args.json:
+        with open(args.json, "w") as f:
+            f.write(out)
+    print(out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Principal lookup latency and open time per store backend.
+
+Fills a SQLite store with N clients, snapshots it, and times get_client() on random names
+straight against each backend (no principal cache in front). The in-process Mongo fake is
+included as a zero-network baseline; pass --mongo URI to also measure a real Mongo server.
+
+    python -m bench.principal_store --principals 100000 --lookups 50000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from bench.fake_db import FakeDatabase
+from utils.principal_store import MongoStore, SQLiteStore, SnapshotStore, write_snapshot
+
+
+def fill(store, n):
+    store.bulk("tgs", [{"idtgs": "tgs1", "ktgs": "k", "default_lifetime_tgt": 10, "default_lifetime_st": 5}])
+    batch = []
+    for i in range(n):
+        batch.append({"name": f"user{i}", "password": f"pw{i}"})
+        if len(batch) == 10000:
+            store.bulk("client", batch)
+            batch = []
+    if batch:
+        store.bulk("client", batch)
+
+
+def time_lookups(store, n, lookups, seed):
+    rng = random.Random(seed)
+    names = [f"user{rng.randrange(n)}" for _ in range(lookups)]
+    samples = []
+    for name in names:
+        t0 = time.perf_counter()
+        doc = store.get_client(name)
+        samples.append(time.perf_counter() - t0)
+        assert doc is not None and doc["name"] == name
+    samples.sort()
+    pct = lambda p: samples[min(len(samples) - 1, int(len(samples) * p / 100))] * 1e6
+    return f"mean={sum(samples) / len(samples) * 1e6:7.1f}us  p50={pct(50):7.1f}us  p99={pct(99):7.1f}us"
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--principals", type=int, default=100000)
+    ap.add_argument("--lookups", type=int, default=50000)
+    ap.add_argument("--mongo", default=None, help="Also benchmark this Mongo URI (its kerberos_bench db is overwritten)")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    sqlite_path, snap_path = os.path.join(tmp, "principals.db"), os.path.join(tmp, "principals.snap")
+
+    t0 = time.perf_counter()
+    sqlite_store = SQLiteStore(sqlite_path)
+    fill(sqlite_store, args.principals)
+    print(f"fill sqlite:   {args.principals} principals in {time.perf_counter() - t0:.2f}s")
+    t0 = time.perf_counter()
+    write_snapshot(snap_path, sqlite_store)
+    print(f"snapshot:      written in {time.perf_counter() - t0:.2f}s, {os.path.getsize(snap_path) / 1e6:.1f} MB")
+
+    fake = MongoStore(db=FakeDatabase())
+    for doc in sqlite_store.iter_all("client"):
+        fake.insert("client", doc)
+    stores = {"mongo-fake": lambda: fake,
+              "sqlite": lambda: SQLiteStore(sqlite_path),
+              "snapshot": lambda: SnapshotStore(snap_path)}
+    if args.mongo:
+        mongo = MongoStore(args.mongo, database="kerberos_bench")
+        mongo.db.clients.drop()
+        mongo.ensure_indexes()
+        fill(mongo, args.principals)
+        stores["mongo"] = lambda: MongoStore(args.mongo, database="kerberos_bench")
+
+    print()
+    for name, opener in stores.items():
+        t0 = time.perf_counter()
+        store = opener()
+        store.get_client("user0")  # first lookup pays connection setup
+        opened = (time.perf_counter() - t0) * 1000
+        print(f"{name:12s} open+first={opened:8.2f}ms  {time_lookups(store, args.principals, args.lookups, args.seed)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Concurrent cold-cache callers vs. KDC requests actually sent.
+
+Starts the KDC in-process on a fake DB, then --callers threads (spread over --processes forked
+processes sharing one diskcache directory) ask for the same TGT and service ticket at once.
+With single-flight coalescing the KDC sees exactly one AS and one TGS request; the script
+exits non-zero otherwise.
+
+    python -m bench.single_flight --callers 100 --processes 4
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import client
+import kdc
+from bench.fake_db import FakeDatabase
+from bench.loadgen import HOST, free_port, wait_for_port
+from utils import kerberos_db, eventlog
+
+CLIENT, PASSWORD, SERVICE = "alice", "alicepw", "svc"
+
+
+def run_callers(n, epoch, as_port, tgs_port):
+    barrier = threading.Barrier(n)
+    errors = []
+
+    def caller():
+        barrier.wait()
+        try:
+            Kc_tgs, tgt, _, _ = client.as_req(HOST, as_port, CLIENT, PASSWORD, "tgs1", HOST, epoch)
+            client.tgs_req(HOST, tgs_port, SERVICE, tgt, Kc_tgs, CLIENT, HOST, epoch)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=caller) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return errors
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--callers", type=int, default=100, help="Total concurrent callers")
+    ap.add_argument("--processes", type=int, default=1, help="Forked client processes sharing the ticket cache")
+    args = ap.parse_args()
+
+    kerberos_db.set_database(FakeDatabase())
+    kerberos_db.add_client(CLIENT, PASSWORD)
+    kerberos_db.add_server(SERVICE, "svckey", 0)
+    kerberos_db.add_tgs("tgs1", "bench_tgs_key", lifetime_tgt=10, lifetime_st=5)
+    eventlog.configure(path=os.devnull)
+
+    counts = {"AS": 0, "TGS": 0}
+    lock = threading.Lock()
+
+    def counted(exchange, process):
+        def wrapper(*a, **kw):
+            with lock:
+                counts[exchange] += 1
+            time.sleep(0.05)  # a slow KDC widens the window for duplicate fetches
+            return process(*a, **kw)
+        return wrapper
+
+    kdc.process_as_req = counted("AS", kdc.process_as_req)
+    kdc.process_tgs_req = counted("TGS", kdc.process_tgs_req)
+
+    epoch = int(time.time())
+    as_port, tgs_port = free_port(), free_port()
+    threading.Thread(target=kdc.run_as, args=(HOST, as_port, epoch), daemon=True).start()
+    threading.Thread(target=kdc.run_tgs, args=(HOST, tgs_port, epoch), daemon=True).start()
+    wait_for_port(as_port)
+    wait_for_port(tgs_port)
+
+    cache_dir = tempfile.mkdtemp()
+    client.CACHE_DIR = cache_dir
+    per_process = args.callers // args.processes
+
+    t0 = time.perf_counter()
+    pids = []
+    for _ in range(args.processes - 1):
+        pid = os.fork()
+        if pid == 0:
+            client.cache = None  # each process opens its own handle on the shared directory
+            errors = run_callers(per_process, epoch, as_port, tgs_port)
+            os._exit(1 if errors else 0)
+        pids.append(pid)
+    errors = run_callers(args.callers - per_process * (args.processes - 1), epoch, as_port, tgs_port)
+    failed = sum(os.waitpid(pid, 0)[1] != 0 for pid in pids)
+    elapsed = time.perf_counter() - t0
+
+    print(f"{args.callers} callers in {args.processes} process(es), {elapsed * 1000:.0f}ms")
+    print(f"KDC requests: AS={counts['AS']} TGS={counts['TGS']}  (caller errors: {len(errors)}, "
+          f"failed processes: {failed})")
+    print(f"client stats: {client.renewal_stats()}")
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    if counts != {"AS": 1, "TGS": 1} or errors or failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Startup time of each entry point, measured in fresh interpreters.
+
+Reports the median of --runs for:
+  import client / server / kdc      bare module import
+  server ready                      process start until its port accepts connections
+  kdc ready [--warmup]              process start until the TGS port accepts connections, against a
+                                    SQLite store of --principals clients (so no Mongo is needed)
+
+    python -m bench.startup --runs 5 --principals 20000
+"""
+import argparse
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.loadgen import HOST, free_port
+from utils.principal_store import SQLiteStore
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def time_import(module):
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], cwd=REPO, check=True)
+    return time.perf_counter() - t0
+
+
+def time_ready(argv, port, env=None, timeout=30.0):
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, *argv], cwd=REPO, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                socket.create_connection((HOST, port), timeout=0.5).close()
+                return time.perf_counter() - t0
+            except OSError:
+                if proc.poll() is not None:
+                    raise RuntimeError(f"{argv[0]} exited with {proc.returncode}")
+                if time.perf_counter() - t0 > timeout:
+                    raise RuntimeError(f"{argv[0]} not ready after {timeout}s")
+                time.sleep(0.002)
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--principals", type=int, default=20000)
+    args = ap.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "principals.db")
+    store = SQLiteStore(db_path)
+    store.bulk("tgs", [{"idtgs": "tgs1", "ktgs": "bench_tgs_key", "default_lifetime_tgt": 10,
+                        "default_lifetime_st": 5}])
+    store.bulk("server", [{"name": f"svc{i}", "password": f"svckey{i}", "port": 0} for i in range(50)])
+    store.bulk("client", [{"name": f"user{i}", "password": f"pw{i}"} for i in range(args.principals)])
+    epoch = str(int(time.time()))
+
+    def kdc(warmup):
+        as_port, tgs_port = free_port(), free_port()
+        argv = ["kdc.py", "--store", f"sqlite:{db_path}", "--as-port", str(as_port), "--tgs-port", str(tgs_port),
+                "--initial-wall-clock", epoch, "--event-log", os.devnull]
+        return time_ready(argv + (["--warmup"] if warmup else []), tgs_port)
+
+    def server():
+        port = free_port()
+        env = dict(os.environ, BENCHSVC_PASSWORD="svckey", BENCHSVC_PORT=str(port))
+        return time_ready(["server.py", "--server", "benchsvc", "--initial-wall-clock", epoch,
+                           "--event-log", os.devnull], port, env)
+
+    cases = {
+        "import client": lambda: time_import("client"),
+        "import server": lambda: time_import("server"),
+        "import kdc": lambda: time_import("kdc"),
+        "server ready": server,
+        "kdc ready": lambda: kdc(False),
+        "kdc ready --warmup": lambda: kdc(True),
+    }
+    for name, fn in cases.items():
+        samples = [fn() for _ in range(args.runs)]
+        print(f"{name:20s} median={statistics.median(samples) * 1000:8.1f}ms  min={min(samples) * 1000:8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Service tickets/s for a batch job: N individual TGS_REQs vs TGS_BATCH_REQs.
+
+--principals clients each hold a TGT and need tickets for --services services, --tickets in
+total. Measured two ways:
+  kdc only   process_tgs_req called per ticket vs process_tgs_batch_req per --batch-size
+             tickets, in this process: the KDC's own CPU cost per ticket
+  end to end against a forked KDC (threaded engine, fake DB): tgs_req from --threads threads
+             over one-shot connections, the same over pooled keep-alive connections, and
+             tgs_batch_req (one connection per batch)
+
+    python -m bench.tgs_batch --tickets 4000 --batch-size 500 --wire binary
+"""
+import argparse
+import os
+import secrets
+import signal
+import threading
+import time
+
+import client
+import kdc
+from bench.fake_db import FakeDatabase
+from bench.loadgen import HOST, free_port, wait_for_port
+from utils import kerberos_db, eventlog
+from utils.crypto import encrypt_obj, now_minutes
+from utils.mux import ConnectionPool
+from utils.replay_cache import ReplayCache
+from utils.ticket_cache import TicketCache
+from utils.wire import WIRE_JSON, WIRE_BINARY
+
+
+def fork_kdc(epoch, as_port, tgs_port, max_batch):
+    pid = os.fork()
+    if pid:
+        return pid
+    kdc.log = lambda *a: None
+    eventlog.configure(path=os.devnull)  # the parent's writer thread didn't survive the fork
+    kdc.MAX_BATCH = max_batch
+    threading.Thread(target=kdc.run_as, args=(HOST, as_port, epoch, 1024), daemon=True).start()
+    threading.Thread(target=kdc.run_tgs, args=(HOST, tgs_port, epoch, 1024), daemon=True).start()
+    while True:
+        time.sleep(3600)
+
+
+def work(tgts, services, n):
+    """n (service, tickettgs, Kc_tgs, client_name) items, cycling over principals and services."""
+    return [(services[i % len(services)], *tgts[(i // len(services)) % len(tgts)]) for i in range(n)]
+
+
+def tgs_request(item, epoch, binary):
+    svc, tgt, Kc_tgs, name = item
+    auth = encrypt_obj({"IDc": name, "ADc": HOST, "TS3": now_minutes(epoch), "nonce": secrets.token_hex(8)},
+                       Kc_tgs, binary)
+    return {"IDv": svc, "Tickettgs": tgt, "Authenticatorc": auth}
+
+
+def kdc_only(items, epoch, batch_size, wire_version):
+    """Tickets/s through process_tgs_req and process_tgs_batch_req, requests built beforehand."""
+    binary = wire_version == WIRE_BINARY
+    addr = (HOST, 0)
+    rates = []
+    for batched in (False, True):
+        kdc.replay_cache = ReplayCache()
+        reqs = [tgs_request(item, epoch, binary) for item in items]
+        ok = 0
+        t0 = time.perf_counter()
+        if batched:
+            for start in range(0, len(reqs), batch_size):
+                rep = kdc.process_tgs_batch_req({"type": "TGS_BATCH_REQ", "Items": reqs[start:start + batch_size]},
+                                                addr, epoch, wire_version)
+                ok += sum("data" in r for r in rep["Items"])
+        else:
+            for req in reqs:
+                ok += kdc.process_tgs_req({"type": "TGS_REQ", **req}, addr, epoch, wire_version)["type"] == "TGS_REP"
+        rates.append((ok / (time.perf_counter() - t0), len(items) - ok))
+    return rates
+
+
+def individual(items, epoch, threads, tgs_port, pool=None):
+    errors = []
+    def worker(k):
+        for svc, tgt, Kc_tgs, name in items[k::threads]:
+            try:
+                client.tgs_req(HOST, tgs_port, svc, tgt, Kc_tgs, name, HOST, epoch,
+                               conn=pool.get() if pool else None, force=True)
+            except Exception as e:
+                errors.append(e)
+
+    t0 = time.perf_counter()
+    pool_threads = [threading.Thread(target=worker, args=(k,)) for k in range(threads)]
+    for t in pool_threads:
+        t.start()
+    for t in pool_threads:
+        t.join()
+    return (len(items) - len(errors)) / (time.perf_counter() - t0), len(errors)
+
+
+def batched(items, epoch, batch_size, tgs_port):
+    t0 = time.perf_counter()
+    results = client.tgs_batch_req(HOST, tgs_port, items, HOST, epoch, batch_size=batch_size)
+    errors = sum(isinstance(r, Exception) for r in results)
+    return (len(items) - errors) / (time.perf_counter() - t0), errors
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--principals", type=int, default=50)
+    ap.add_argument("--services", type=int, default=20)
+    ap.add_argument("--tickets", type=int, default=4000, help="Service tickets per measurement")
+    ap.add_argument("--batch-size", type=int, default=500)
+    ap.add_argument("--threads", type=int, default=8, help="Client threads for the individual requests")
+    ap.add_argument("--pool-size", type=int, default=2, help="Keep-alive connections for the pooled run")
+    ap.add_argument("--wire", choices=["json", "binary"], default="json")
+    args = ap.parse_args()
+
+    kerberos_db.set_database(FakeDatabase())
+    kerberos_db.add_tgs("tgs1", "bench_tgs_key", lifetime_tgt=10, lifetime_st=5)
+    for i in range(args.principals):
+        kerberos_db.add_client(f"user{i}", f"pw{i}")
+    services = [f"svc{i}" for i in range(args.services)]
+    for i, svc in enumerate(services):
+        kerberos_db.add_server(svc, f"svckey{i}", 0)
+    eventlog.configure(path=os.devnull)
+
+    wire_version = WIRE_BINARY if args.wire == "binary" else WIRE_JSON
+    client.WIRE_VERSION = wire_version
+    client.cache = TicketCache(path=None)
+    epoch = int(time.time())
+    as_port, tgs_port = free_port(), free_port()
+    pid = fork_kdc(epoch, as_port, tgs_port, max(args.batch_size, kdc.MAX_BATCH))
+    try:
+        wait_for_port(as_port)
+        wait_for_port(tgs_port)
+        tgts = []
+        for i in range(args.principals):
+            Kc_tgs, tgt, _, _ = client.as_req(HOST, as_port, f"user{i}", f"pw{i}", "tgs1", HOST, epoch, force=True)
+            tgts.append((tgt, Kc_tgs, f"user{i}"))
+        items = work(tgts, services, args.tickets)
+
+        print(f"{args.tickets} tickets, {args.principals} principals x {args.services} services, "
+              f"batch size {args.batch_size}, {args.wire} wire")
+        (single, single_err), (batch, batch_err) = kdc_only(items, epoch, args.batch_size, wire_version)
+        print(f"  kdc only     process_tgs_req       {single:9,.0f} tickets/s  errors={single_err}")
+        print(f"               process_tgs_batch_req {batch:9,.0f} tickets/s  errors={batch_err}  "
+              f"({batch / single:.1f}x)")
+
+        rate, errors = individual(items, epoch, args.threads, tgs_port)
+        print(f"  end to end   tgs_req, one-shot     {rate:9,.0f} tickets/s  errors={errors}")
+        pool = ConnectionPool(HOST, tgs_port, args.pool_size)
+        rate, errors = individual(items, epoch, args.threads, tgs_port, pool)
+        pool.close()
+        print(f"               tgs_req, keep-alive   {rate:9,.0f} tickets/s  errors={errors}")
+        batch, errors = batched(items, epoch, args.batch_size, tgs_port)
+        print(f"               tgs_batch_req         {batch:9,.0f} tickets/s  errors={errors}  "
+              f"({batch / rate:.1f}x keep-alive)")
+    finally:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""TGS replica scaling and failover, all local processes.
+
+Builds a SQLite store of --principals clients, writes a tgs+server snapshot for the replicas,
+then starts one AS (kdc.py --role as) and --replicas TGS replicas (kdc.py --role tgs, each on
+its own port, serving the snapshot and sharing one replay file). With TGTs fetched once up front:
+  scaling    TGS_REQ/s for 1..N replicas through client.use_tgs_replicas, and for N replicas
+             through lb.py, driven by --load-procs forked client processes
+  failover   steady load over all replicas while one is SIGKILLed: caller errors (should be 0)
+             and the worst request latency around the kill, via the client balancer and lb.py
+
+Throughput can only scale with free cores: replicas, lb.py and the load processes share them.
+
+    python -m bench.tgs_replicas --replicas 4 --load-procs 4 --seconds 3
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import client
+from bench.loadgen import HOST, free_port, wait_for_port
+from bench.startup import REPO
+from utils.principal_store import SQLiteStore, write_snapshot
+from utils.ticket_cache import TicketCache
+
+SERVICES = 20
+
+
+def start(argv, port):
+    proc = subprocess.Popen([sys.executable, *argv], cwd=REPO, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+    wait_for_port(port, timeout=30.0)
+    return proc
+
+
+def stop(proc, sig=signal.SIGTERM):
+    if proc.poll() is None:
+        proc.send_signal(sig)
+        try:
+            proc.wait(5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+
+def drive(tgts, epoch, seconds, threads, tgs_port, replicas, out, on_result=None):
+    """Send force-refreshed TGS_REQs for `seconds` from `threads` threads; returns (ok, errors)."""
+    client.cache = TicketCache(path=None)
+    if replicas:
+        client.use_tgs_replicas(replicas, check_interval=0.2)
+    deadline = time.perf_counter() + seconds
+    counts = [0, 0]
+    lock = threading.Lock()
+
+    def worker(i):
+        n = 0
+        while time.perf_counter() < deadline:
+            name, Kc_tgs, tgt = tgts[(i * 7919 + n) % len(tgts)]
+            svc = f"svc{n % SERVICES}"
+            n += 1
+            t0 = time.perf_counter()
+            try:
+                client.tgs_req(HOST, tgs_port, svc, tgt, Kc_tgs, name, HOST, epoch, force=True)
+                ok = True
+            except Exception:
+                ok = False
+            if on_result:
+                on_result(t0, time.perf_counter() - t0, ok)
+            with lock:
+                counts[0 if ok else 1] += 1
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    if replicas:
+        client.use_tgs_replicas(None)
+    if out is not None:
+        out.put(tuple(counts))
+    return tuple(counts)
+
+
+def throughput(args, tgts, epoch, tgs_port, replicas):
+    ctx = multiprocessing.get_context("fork")
+    out = ctx.Queue()
+    procs = [ctx.Process(target=drive, args=(tgts, epoch, args.seconds, args.threads, tgs_port, replicas, out))
+             for _ in range(args.load_procs)]
+    for p in procs:
+        p.start()
+    results = [out.get() for _ in procs]
+    for p in procs:
+        p.join()
+    ok = sum(r[0] for r in results)
+    errors = sum(r[1] for r in results)
+    return ok / args.seconds, errors
+
+
+def failover(args, tgts, epoch, tgs_port, replicas, victim):
+    samples = []
+    lock = threading.Lock()
+
+    def record(t0, latency, ok):
+        with lock:
+            samples.append((t0, latency, ok))
+
+    killed_at = []
+
+    def killer():
+        time.sleep(args.seconds / 2)
+        killed_at.append(time.perf_counter())
+        victim.kill()
+
+    threading.Thread(target=killer, daemon=True).start()
+    drive(tgts, epoch, args.seconds, args.threads, tgs_port, replicas, None, record)
+    kill = killed_at[0]
+    before = [lat for t0, lat, ok in samples if t0 < kill - 0.1 and ok]
+    around = [lat for t0, lat, ok in samples if kill - 0.1 <= t0 <= kill + 1.0]
+    errors = sum(not ok for _, _, ok in samples)
+    return statistics.median(before) if before else 0.0, max(around, default=0.0), errors, len(samples)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--replicas", type=int, default=4)
+    ap.add_argument("--principals", type=int, default=200)
+    ap.add_argument("--load-procs", type=int, default=4, help="Forked client processes generating load")
+    ap.add_argument("--threads", type=int, default=8, help="Threads per load process")
+    ap.add_argument("--seconds", type=float, default=3.0, help="Duration of each measurement")
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    db_path, snap_path = os.path.join(tmp, "principals.db"), os.path.join(tmp, "tgs-keys.snap")
+    store = SQLiteStore(db_path)
+    store.bulk("tgs", [{"idtgs": "tgs1", "ktgs": "bench_tgs_key", "default_lifetime_tgt": 10,
+                        "default_lifetime_st": 5}])
+    store.bulk("server", [{"name": f"svc{i}", "password": f"svckey{i}", "port": 0} for i in range(SERVICES)])
+    store.bulk("client", [{"name": f"user{i}", "password": f"pw{i}"} for i in range(args.principals)])
+    print(f"snapshot for replicas: {write_snapshot(snap_path, store, kinds=('tgs', 'server'))}")
+
+    epoch = int(time.time())
+    # The load reuses a few hundred TGTs thousands of times a second, so no per-TGT rate limit
+    common = ["--initial-wall-clock", str(epoch), "--event-log", os.devnull, "--principal-rate", "0"]
+    procs = []
+    try:
+        as_port = free_port()
+        procs.append(start(["kdc.py", "--role", "as", "--as-port", str(as_port), "--store", f"sqlite:{db_path}",
+                            *common], as_port))
+        replica_ports = [free_port() for _ in range(args.replicas)]
+        def replica(port):
+            proc = start(["kdc.py", "--role", "tgs", "--tgs-port", str(port), "--store", f"snapshot:{snap_path}",
+                          "--replay-file", os.path.join(tmp, "replay.bin"), "--warmup", *common], port)
+            procs.append(proc)
+            return proc
+
+        replicas = [replica(p) for p in replica_ports]
+        lb_port = free_port()
+        lb = start(["lb.py", "--port", str(lb_port), "--check-interval", "0.2",
+                    *[a for p in replica_ports for a in ("--backend", f"{HOST}:{p}")]], lb_port)
+        procs.append(lb)
+
+        client.cache = TicketCache(path=None)
+        tgts = []
+        for i in range(args.principals):
+            Kc_tgs, tgt, _, _ = client.as_req(HOST, as_port, f"user{i}", f"pw{i}", "tgs1", HOST, epoch, force=True)
+            tgts.append((f"user{i}", Kc_tgs, tgt))
+
+        print(f"scaling ({args.load_procs} load processes x {args.threads} threads, {os.cpu_count()} CPUs):")
+        for n in range(1, args.replicas + 1):
+            endpoints = [(HOST, p) for p in replica_ports[:n]]
+            rate, errors = throughput(args, tgts, epoch, 0, endpoints)
+            print(f"  client balancer, {n} replica(s)  {rate:9,.0f} TGS/s  errors={errors}")
+        rate, errors = throughput(args, tgts, epoch, lb_port, None)
+        print(f"  lb.py, {args.replicas} replica(s)           {rate:9,.0f} TGS/s  errors={errors}")
+
+        print("failover (one replica SIGKILLed mid-run):")
+        endpoints = [(HOST, p) for p in replica_ports]
+        p50, worst, errors, total = failover(args, tgts, epoch, 0, endpoints, replicas[0])
+        print(f"  client balancer  p50 before={p50 * 1000:.1f}ms  worst around kill={worst * 1000:.1f}ms  "
+              f"errors={errors}/{total}")
+        if args.replicas > 1:
+            replicas[0] = replica(replica_ports[0])  # back to full strength before the lb.py run
+            time.sleep(0.5)                          # let lb.py's health checks see it again
+            p50, worst, errors, total = failover(args, tgts, epoch, lb_port, None, replicas[1])
+            print(f"  lb.py            p50 before={p50 * 1000:.1f}ms  worst around kill={worst * 1000:.1f}ms  "
+                  f"errors={errors}/{total}")
+    finally:
+        for proc in procs:
+            stop(proc)
+
+
+if __name__ == "__main__":
+    main()
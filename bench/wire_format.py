@@ -0,0 +1,84 @@
+"""Bytes on the wire and CPU per exchange for the JSON and binary encodings (no network).
+
+Builds the same messages kdc.py/server.py/client.py send, frames them, parses them back and
+decrypts every layer the receiver would. Run from the repo root:
+
+    python -m bench.wire_format --iterations 2000
+"""
+import argparse
+import time
+from utils.crypto import encrypt_obj, decrypt_obj, _frame, _parse_header, _parse_body
+from utils.wire import WIRE_JSON, WIRE_BINARY
+
+KTGS, KC, KV = "22csb0c14_22csb0a05_kerberos_v4_tgs", "22csb0a05_sk2202", "fileserverkey"
+KC_TGS = "Kc_tgs::Sai_Kartik::12"
+KC_V = "Kc_v::Sai_Kartik::ftpServer::12"
+
+
+def roundtrip(msg, wire_version):
+    frame = _frame(msg, wire_version)
+    version, n = _parse_header(frame[:4])
+    return len(frame), _parse_body(frame[4:4 + n], version)
+
+
+def exchange(wire_version):
+    """One AS + TGS + AP exchange; returns bytes per message."""
+    b = wire_version == WIRE_BINARY
+    sizes = {}
+
+    sizes["AS_REQ"], _ = roundtrip({"type": "AS_REQ", "IDc": "Sai_Kartik", "IDtgs": "tgs1", "TS1": 12}, wire_version)
+    tgt = encrypt_obj({"Kc_tgs": KC_TGS, "IDc": "Sai_Kartik", "ADc": "127.0.0.1", "IDtgs": "tgs1",
+                       "TS2": 12, "Lifetime2": 10}, KTGS, b)
+    data = encrypt_obj({"Kc_tgs": KC_TGS, "IDtgs": "tgs1", "TS2": 12, "Lifetime2": 10, "Tickettgs": tgt}, KC, b)
+    sizes["AS_REP"], rep = roundtrip({"type": "AS_REP", "data": data}, wire_version)
+    tgt = decrypt_obj(rep["data"], KC)["Tickettgs"]
+
+    auth = encrypt_obj({"IDc": "Sai_Kartik", "ADc": "127.0.0.1", "TS3": 12}, KC_TGS, b)
+    sizes["TGS_REQ"], req = roundtrip({"type": "TGS_REQ", "IDv": "ftpServer", "Tickettgs": tgt,
+                                       "Authenticatorc": auth}, wire_version)
+    decrypt_obj(req["Tickettgs"], KTGS)
+    decrypt_obj(req["Authenticatorc"], KC_TGS)
+    tv = encrypt_obj({"Kc_v": KC_V, "IDc": "Sai_Kartik", "ADc": "127.0.0.1", "IDv": "ftpServer",
+                      "TS4": 12, "Lifetime4": 5}, KV, b)
+    data = encrypt_obj({"Kc_v": KC_V, "IDv": "ftpServer", "TS4": 12, "Lifetime4": 5, "Ticketv": tv}, KC_TGS, b)
+    sizes["TGS_REP"], rep = roundtrip({"type": "TGS_REP", "data": data}, wire_version)
+    tv = decrypt_obj(rep["data"], KC_TGS)["Ticketv"]
+
+    auth = encrypt_obj({"IDc": "Sai_Kartik", "ADc": "127.0.0.1", "TS5": 12}, KC_V, b)
+    msg = encrypt_obj({"msg": "Hello file", "TS5": 12}, KC_V, b)
+    sizes["APP_REQ"], req = roundtrip({"type": "APP_REQ", "Ticketv": tv, "Authenticatorc": auth,
+                                       "Message": msg}, wire_version)
+    decrypt_obj(req["Ticketv"], KV)
+    decrypt_obj(req["Authenticatorc"], KC_V)
+    decrypt_obj(req["Message"], KC_V)
+    ack = encrypt_obj({"ack": "Hello Sai_Kartik, message received by ftpServer.", "TS5+1": 13}, KC_V, b)
+    sizes["APP_REP"], rep = roundtrip({"type": "APP_REP", "data": ack}, wire_version)
+    decrypt_obj(rep["data"], KC_V)
+    return sizes
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--iterations", type=int, default=2000)
+    args = ap.parse_args()
+
+    results = {}
+    for name, version in (("json", WIRE_JSON), ("binary", WIRE_BINARY)):
+        sizes = exchange(version)
+        t0 = time.perf_counter()
+        for _ in range(args.iterations):
+            exchange(version)
+        results[name] = (sizes, (time.perf_counter() - t0) / args.iterations * 1e6)
+
+    js, bs = results["json"][0], results["binary"][0]
+    print(f"{'message':<10} {'json B':>8} {'binary B':>9} {'saved':>7}")
+    for msg in js:
+        print(f"{msg:<10} {js[msg]:>8} {bs[msg]:>9} {1 - bs[msg] / js[msg]:>7.0%}")
+    tj, tb = sum(js.values()), sum(bs.values())
+    print(f"{'total':<10} {tj:>8} {tb:>9} {1 - tb / tj:>7.0%}")
+    uj, ub = results["json"][1], results["binary"][1]
+    print(f"CPU per full exchange: json {uj:.1f} us, binary {ub:.1f} us ({1 - ub / uj:.0%} less)")
+
+
+if __name__ == "__main__":
+    main()
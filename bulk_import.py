@@ -0,0 +1,76 @@
+import argparse
+import csv
+import json
+import sys
+import time
+from utils.kerberos_db import bulk_import, ensure_indexes, use_store
+
+# Streaming principal import. Rows are read one at a time from CSV (with a header) or JSONL
+# and written in chunks, so a million-principal file never sits in memory. Columns:
+#   client: name, password
+#   server: name, password (or key), port
+#   tgs:    idtgs, ktgs, lifetime_tgt, lifetime_st
+
+
+def to_doc(kind: str, row: dict) -> dict:
+    if kind == "client":
+        return {"name": row["name"], "password": row["password"]}
+    if kind == "server":
+        return {"name": row["name"], "password": row.get("password") or row["key"], "port": int(row["port"])}
+    return {
+        "idtgs": row["idtgs"],
+        "ktgs": row["ktgs"],
+        "default_lifetime_tgt": int(row["lifetime_tgt"]),
+        "default_lifetime_st": int(row["lifetime_st"]),
+    }
+
+
+def read_rows(f, fmt: str):
+    if fmt == "csv":
+        yield from csv.DictReader(f)
+    else:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Bulk-load principals into the Kerberos database")
+    ap.add_argument("kind", choices=["client", "server", "tgs"])
+    ap.add_argument("file", help="CSV or JSONL file ('-' = stdin)")
+    ap.add_argument("--format", choices=["csv", "jsonl"], default=None,
+                    help="Defaults to the file extension (.csv, otherwise JSONL)")
+    ap.add_argument("--chunk-size", type=int, default=5000, help="Rows per bulk write")
+    ap.add_argument("--insert", action="store_true",
+                    help="Plain insert_many instead of upserts (faster; fails on existing names)")
+    ap.add_argument("--store", default=None, help="Target store URL (default $KERBEROS_STORE or local Mongo)")
+    ap.add_argument("--no-indexes", action="store_true", help="Skip creating the unique lookup indexes")
+    args = ap.parse_args()
+
+    if args.store:
+        use_store(args.store)
+    fmt = args.format or ("csv" if args.file.endswith(".csv") else "jsonl")
+    if not args.no_indexes:
+        ensure_indexes()
+
+    t0 = time.perf_counter()
+
+    def progress(n):
+        elapsed = time.perf_counter() - t0
+        print(f"\r[IMPORT] {n} rows  {n / elapsed:,.0f} rows/s", end="", file=sys.stderr, flush=True)
+
+    f = sys.stdin if args.file == "-" else open(args.file, newline="", encoding="utf-8")
+    try:
+        docs = (to_doc(args.kind, row) for row in read_rows(f, fmt))
+        total = bulk_import(args.kind, docs, args.chunk_size, upsert=not args.insert, progress=progress)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+    elapsed = time.perf_counter() - t0
+    print(file=sys.stderr)
+    print(f"[IMPORT] {total} {args.kind} rows in {elapsed:.2f}s ({total / max(elapsed, 1e-9):,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
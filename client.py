@@ -1,9 +1,19 @@
 import socket
 import argparse
+import contextlib
+import random
+import secrets
+import threading
 from dotenv import load_dotenv
 import os
-from utils.crypto import encrypt_obj, decrypt_obj, send_json, recv_json, now_minutes, log
-from diskcache import Cache
+from utils.crypto import (encrypt_obj, decrypt_obj, encrypt_many, decrypt_many, send_json, recv_json,
+                          now_minutes, log)
+from utils.wire import WIRE_JSON, WIRE_BINARY
+from utils.mux import ConnectionPool
+from utils.balancer import Balancer
+from utils.session import AppSession, DEFAULT_WINDOW, DEFAULT_CHUNK
+from utils.ticket_cache import TicketCache, tgt_key, sgt_key, ticket_expire
+from utils import clock
 
 # --- Load client config ---
 load_dotenv()
@@ -14,87 +24,249 @@ AS_HOST = os.getenv("AS_HOST", "127.0.0.1")
 AS_PORT = os.getenv("AS_PORT", 6000)
 TGS_HOST = os.getenv("TGS_HOST", "127.0.0.1")
 TGS_PORT = int(os.getenv("TGS_PORT", 6001))
+# Optional TGS replicas ("host:port,host:port"); when set, TGS_REQs go through a Balancer
+TGS_REPLICAS = os.getenv("KERBEROS_TGS_REPLICAS")
 TGS_ID = os.getenv("TGS_ID", "tgs1")
 CLIENT_AD = os.getenv("CLIENT_AD", "127.0.0.1")
+# Frame/ticket encoding for requests we send: "json" (default) or "binary"
+WIRE_VERSION = WIRE_BINARY if os.getenv("KERBEROS_WIRE", "json") == "binary" else WIRE_JSON
 
 # --- Cache for TGTs / Service Tickets(SGTs) ---
-cache = Cache("./kerberos_cache")
+# In-memory L1 in front of the on-disk diskcache L2 (utils/ticket_cache.py). Opened on first
+# use (ticket_cache() or client.cache), so invocations that never touch it don't pay for
+# diskcache/sqlite; callers may also assign client.cache = TicketCache(...) or their own object.
+CACHE_DIR = os.getenv("KERBEROS_CACHE_DIR", "./kerberos_cache")
+L1_SIZE = int(os.getenv("KERBEROS_L1_SIZE", 4096))
+
+
+def ticket_cache():
+    cache = globals().get("cache")
+    if cache is None:
+        cache = globals()["cache"] = TicketCache(CACHE_DIR, L1_SIZE)
+    return cache
+
+
+def __getattr__(name):
+    if name == "cache":
+        return ticket_cache()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Renewal/miss counters live in the ticket cache itself (diskcache incr is atomic across
+# processes), so `client.py --stats` sees what every client process on the host did
+_STATS = ("renewed_tgt", "renewed_sgt", "renewal_errors", "inline_miss_tgt", "inline_miss_sgt", "coalesced")
+
+
+def _count(name):
+    ticket_cache().incr(("stats", name))
+
+
+def renewal_stats():
+    c = ticket_cache()
+    return {name: c.counter(("stats", name)) for name in _STATS}
+
+# --- Transport: one-shot connection, or a shared keep-alive MuxConnection ---
+
+
+def _exchange(host, port, req, conn=None):
+    if conn is not None:
+        return conn.request(req, wire_version=WIRE_VERSION)
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.connect((host, port))
+    try:
+        send_json(s, req, WIRE_VERSION)
+        return recv_json(s)
+    finally:
+        s.close()
+
+
+# --- TGS replicas: least-outstanding routing with failover (utils/balancer.py) ---
+tgs_balancer = None
+
+
+def use_tgs_replicas(endpoints, check_interval=1.0):
+    """Route one-shot TGS_REQs over these replicas instead of tgs_host/tgs_port; None turns it off."""
+    global tgs_balancer
+    if tgs_balancer is not None:
+        tgs_balancer.close()
+    tgs_balancer = Balancer(endpoints, check_interval).start() if endpoints else None
+    return tgs_balancer
+
+
+def _tgs_exchange(host, port, req, conn=None):
+    if conn is None and tgs_balancer is not None:
+        return tgs_balancer.request(req, WIRE_VERSION)
+    return _exchange(host, port, req, conn)
+
+# --- Single-flight: one KDC fetch per ticket at a time, host-wide ---
+# Callers that miss the cache together queue on a per-key lock (and, with a diskcache store,
+# a cross-process diskcache Lock); the first one fetches, the rest find its ticket in the cache.
+_flights = {}  # cache key -> [threading.Lock, waiters]
+_flights_guard = threading.Lock()
+
+
+def _process_lock(c, key):
+    shared = getattr(c, "l2", None)
+    if shared is None:  # no on-disk tier: nothing to coordinate with outside this process
+        return contextlib.nullcontext()
+    from diskcache import Lock
+    return Lock(shared, ("lock",) + key, expire=30)  # expire frees the lock if its holder dies
+
+
+def _single_flight(key, valid, fetch, kind):
+    with _flights_guard:
+        flight = _flights.setdefault(key, [threading.Lock(), 0])
+        flight[1] += 1
+    try:
+        with flight[0]:
+            c = ticket_cache()
+            cached = c.get(key, default=None)
+            if valid(cached):
+                _count("coalesced")
+                return cached
+            with _process_lock(c, key):
+                cached = c.get(key, default=None)
+                if valid(cached):
+                    _count("coalesced")
+                    return cached
+                _count(f"inline_miss_{kind}")  # this caller waits for the KDC round trip
+                return fetch()
+    finally:
+        with _flights_guard:
+            flight[1] -= 1
+            if flight[1] == 0:
+                del _flights[key]
 
 # --- AS request ---
 
 
-def as_req(as_host, as_port, client_name, client_pass, idtgs, adc, initial_epoch):
-    cached = cache.get(f"tgt_{client_name}", default=None)
+def as_req(as_host, as_port, client_name, client_pass, idtgs, adc, initial_epoch, conn=None, force=False):
+    key = tgt_key(client_name)
     nowm = now_minutes(initial_epoch)
 
-    if cached and (nowm <= cached["TS2"] + cached["Lifetime2"]):
-        return cached["Kc_tgs"], cached["Tickettgs"], cached["Lifetime2"], cached["TS2"]
+    def valid(t):
+        return t is not None and nowm <= t["TS2"] + t["Lifetime2"]
 
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.connect((as_host, as_port))
-    TS1 = nowm
-    send_json(s, {"type": "AS_REQ", "IDc": client_name,
-              "IDtgs": idtgs, "TS1": TS1})
-    rep = recv_json(s)
-    s.close()
-
-    if rep.get("type") != "AS_REP":
-        raise RuntimeError(f"AS error: {rep}")
-
-    plain = decrypt_obj(rep["data"], client_pass)
-    cache.set(f"tgt_{client_name}", plain)
+    def fetch():
+        TS1 = nowm
+        rep = _exchange(as_host, as_port, {"type": "AS_REQ", "IDc": client_name,
+                                           "IDtgs": idtgs, "TS1": TS1}, conn)
+
+        if rep.get("type") != "AS_REP":
+            raise RuntimeError(f"AS error: {rep}")
+
+        plain = decrypt_obj(rep["data"], client_pass)
+        ticket_cache().set(key, plain, expire=ticket_expire(initial_epoch, plain["TS2"], plain["Lifetime2"]))
+        return plain
+
+    if force:
+        plain = fetch()
+    else:
+        plain = ticket_cache().get(key, default=None)
+        if not valid(plain):
+            plain = _single_flight(key, valid, fetch, "tgt")
     return plain["Kc_tgs"], plain["Tickettgs"], plain["Lifetime2"], plain["TS2"]
 
 # --- TGS request ---
 
 
-def tgs_req(tgs_host, tgs_port, service, tickettgs, Kc_tgs, client_name, adc, initial_epoch):
-    key = f"sgt:{service}{client_name}"
-    cached = cache.get(key, default=None)
+def tgs_req(tgs_host, tgs_port, service, tickettgs, Kc_tgs, client_name, adc, initial_epoch, conn=None,
+            force=False):
+    key = sgt_key(client_name, service)
     nowm = now_minutes(initial_epoch)
 
-    if cached and (nowm <= cached["TS4"] + cached["Lifetime4"]):
-        return cached["Kc_v"], cached["Ticketv"], cached["Lifetime4"], cached["TS4"]
-
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.connect((tgs_host, tgs_port))
-    TS3 = nowm
-    authenticator_c = encrypt_obj(
-        {"IDc": client_name, "ADc": adc, "TS3": TS3}, Kc_tgs)
-
-    send_json(s, {
-        "type": "TGS_REQ",
-        "IDv": service,
-        "Tickettgs": tickettgs,
-        "Authenticatorc": authenticator_c
-    })
-    rep = recv_json(s)
-    s.close()
-
-    if rep.get("type") != "TGS_REP":
-        raise RuntimeError(f"TGS error: {rep}")
-
-    plain = decrypt_obj(rep["data"], Kc_tgs)
-    cache.set(key, plain)
+    def valid(t):
+        return t is not None and nowm <= t["TS4"] + t["Lifetime4"]
+
+    def fetch():
+        TS3 = nowm
+        authenticator_c = encrypt_obj(
+            {"IDc": client_name, "ADc": adc, "TS3": TS3, "nonce": secrets.token_hex(8)}, Kc_tgs,
+            WIRE_VERSION == WIRE_BINARY)
+
+        rep = _tgs_exchange(tgs_host, tgs_port, {
+            "type": "TGS_REQ",
+            "IDv": service,
+            "Tickettgs": tickettgs,
+            "Authenticatorc": authenticator_c
+        }, conn)
+
+        if rep.get("type") != "TGS_REP":
+            raise RuntimeError(f"TGS error: {rep}")
+
+        plain = decrypt_obj(rep["data"], Kc_tgs)
+        ticket_cache().set(key, plain, expire=ticket_expire(initial_epoch, plain["TS4"], plain["Lifetime4"]))
+        return plain
+
+    if force:
+        plain = fetch()
+    else:
+        plain = ticket_cache().get(key, default=None)
+        if not valid(plain):
+            plain = _single_flight(key, valid, fetch, "sgt")
     return plain["Kc_v"], plain["Ticketv"], plain["Lifetime4"], plain["TS4"]
 
+# --- Batched TGS requests: many service tickets per round trip (TGS_BATCH_REQ) ---
+BATCH_SIZE = 1000  # items per request; the KDC refuses batches over its --max-batch
+
+
+def tgs_batch_req(tgs_host, tgs_port, items, adc, initial_epoch, conn=None, batch_size=BATCH_SIZE):
+    """items: (service, tickettgs, Kc_tgs, client_name) tuples, for one or many principals.
+
+    Always asks the KDC (like force=True) and caches what it gets. Returns, in order, each
+    item's (Kc_v, Ticketv, Lifetime4, TS4) or the exception it failed with.
+    """
+    results = []
+    binary = WIRE_VERSION == WIRE_BINARY
+    for start in range(0, len(items), batch_size):
+        chunk = items[start:start + batch_size]
+        nowm = now_minutes(initial_epoch)
+        by_session_key = {}  # Kc_tgs -> chunk indexes; authenticators under one key are encrypted together
+        for i, (_, _, Kc_tgs, _) in enumerate(chunk):
+            by_session_key.setdefault(Kc_tgs, []).append(i)
+        auths = [None] * len(chunk)
+        for Kc_tgs, idxs in by_session_key.items():
+            plain = [{"IDc": chunk[i][3], "ADc": adc, "TS3": nowm, "nonce": secrets.token_hex(8)} for i in idxs]
+            for i, auth in zip(idxs, encrypt_many(plain, Kc_tgs, binary)):
+                auths[i] = auth
+
+        rep = _tgs_exchange(tgs_host, tgs_port, {
+            "type": "TGS_BATCH_REQ",
+            "Items": [{"IDv": svc, "Tickettgs": tgt, "Authenticatorc": auths[i]}
+                      for i, (svc, tgt, _, _) in enumerate(chunk)]
+        }, conn)
+        if rep.get("type") != "TGS_BATCH_REP":
+            raise RuntimeError(f"TGS error: {rep}")
+
+        out = [None] * len(chunk)
+        for Kc_tgs, idxs in by_session_key.items():
+            ok = [i for i in idxs if "data" in rep["Items"][i]]
+            for i in idxs:
+                if "data" not in rep["Items"][i]:
+                    out[i] = RuntimeError(f"TGS error: {rep['Items'][i].get('reason')}")
+            for i, plain in zip(ok, decrypt_many([rep["Items"][i]["data"] for i in ok], Kc_tgs)):
+                if isinstance(plain, Exception):
+                    out[i] = plain
+                    continue
+                ticket_cache().set(sgt_key(chunk[i][3], chunk[i][0]), plain,
+                                   expire=ticket_expire(initial_epoch, plain["TS4"], plain["Lifetime4"]))
+                out[i] = (plain["Kc_v"], plain["Ticketv"], plain["Lifetime4"], plain["TS4"])
+        results.extend(out)
+    return results
+
 # --- Application request ---
 
 
-def app_req(server_host, server_port, Ticketv, Kc_v, client_name, adc, message, initial_epoch):
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.connect((server_host, server_port))
-
+def _app_request(Ticketv, Kc_v, client_name, adc, message, initial_epoch):
     TS5 = now_minutes(initial_epoch)
+    binary = WIRE_VERSION == WIRE_BINARY
     Authenticatorc = encrypt_obj(
-        {"IDc": client_name, "ADc": adc, "TS5": TS5}, Kc_v)
-    enc_msg = encrypt_obj({"msg": message, "TS5": TS5}, Kc_v)
+        {"IDc": client_name, "ADc": adc, "TS5": TS5, "nonce": secrets.token_hex(8)}, Kc_v, binary)
+    enc_msg = encrypt_obj({"msg": message, "TS5": TS5}, Kc_v, binary)
+    return {"type": "APP_REQ", "Ticketv": Ticketv, "Authenticatorc": Authenticatorc, "Message": enc_msg}, TS5
 
-    send_json(s, {"type": "APP_REQ", "Ticketv": Ticketv,
-              "Authenticatorc": Authenticatorc, "Message": enc_msg})
-    rep = recv_json(s)
-    s.close()
 
+def _app_reply(rep, Kc_v, TS5):
     if rep.get("type") != "APP_REP":
         raise RuntimeError(f"APP error: {rep}")
 
@@ -107,6 +279,180 @@ def app_req(server_host, server_port, Ticketv, Kc_v, client_name, adc, message,
 
     return data
 
+
+def app_req(server_host, server_port, Ticketv, Kc_v, client_name, adc, message, initial_epoch, conn=None):
+    req, TS5 = _app_request(Ticketv, Kc_v, client_name, adc, message, initial_epoch)
+    rep = _exchange(server_host, server_port, req, conn)
+    return _app_reply(rep, Kc_v, TS5)
+
+
+def open_session(server_host, server_port, Ticketv, Kc_v, client_name, adc, message, initial_epoch,
+                 window=DEFAULT_WINDOW):
+    """AP exchange that keeps its connection open; returns (first reply, AppSession)."""
+    req, TS5 = _app_request(Ticketv, Kc_v, client_name, adc, message, initial_epoch)
+    req["Session"] = {"window": window}
+    s = socket.create_connection((server_host, server_port))
+    try:
+        send_json(s, req, WIRE_VERSION)
+        rep = recv_json(s)
+        data = _app_reply(rep, Kc_v, TS5)
+        if "session" not in rep:
+            raise RuntimeError("server does not support sessions")
+    except Exception:
+        s.close()
+        raise
+    return data, AppSession(s, Kc_v, WIRE_VERSION, rep["session"]["window"])
+
+# --- Reusable client with pooled keep-alive connections ---
+
+
+class KerberosClient:
+    """Client principal bound to pooled AS/TGS connections, for gateways fetching many tickets."""
+
+    def __init__(self, client_name, client_pass, initial_epoch, as_host=AS_HOST, as_port=AS_PORT,
+                 tgs_host=TGS_HOST, tgs_port=TGS_PORT, idtgs=TGS_ID, adc=CLIENT_AD, pool_size=2):
+        self.client_name = client_name
+        self.client_pass = client_pass
+        self.initial_epoch = initial_epoch
+        self.idtgs = idtgs
+        self.adc = adc
+        self.as_pool = ConnectionPool(as_host, int(as_port), pool_size)
+        self.tgs_pool = ConnectionPool(tgs_host, int(tgs_port), pool_size)
+
+    def get_tgt(self, force=False):
+        return as_req(None, None, self.client_name, self.client_pass, self.idtgs, self.adc,
+                      self.initial_epoch, conn=self.as_pool.get(), force=force)
+
+    def get_service_ticket(self, service, force=False):
+        Kc_tgs, tgt, _, _ = self.get_tgt()
+        return tgs_req(None, None, service, tgt, Kc_tgs, self.client_name, self.adc,
+                       self.initial_epoch, conn=self.tgs_pool.get(), force=force)
+
+    def get_service_tickets(self, services, force=False, max_concurrency=32, batch=False):
+        """Fetch tickets for all services concurrently over the pooled TGS connections, or with
+        batch=True as TGS_BATCH_REQs for the ones not already cached.
+
+        Returns (tickets, errors): service -> (Kc_v, Ticketv, Lifetime4, TS4), and service -> exception.
+        """
+        Kc_tgs, tgt, _, _ = self.get_tgt()
+        tickets, errors = {}, {}
+        services = list(dict.fromkeys(services))  # one request per service, even if listed twice
+        if not services:
+            return tickets, errors
+        if batch:
+            nowm = now_minutes(self.initial_epoch)
+            missing = []
+            for svc in services:
+                plain = None if force else ticket_cache().get(sgt_key(self.client_name, svc), default=None)
+                if plain is not None and nowm <= plain["TS4"] + plain["Lifetime4"]:
+                    tickets[svc] = plain["Kc_v"], plain["Ticketv"], plain["Lifetime4"], plain["TS4"]
+                else:
+                    missing.append(svc)
+            results = tgs_batch_req(None, None, [(svc, tgt, Kc_tgs, self.client_name) for svc in missing],
+                                    self.adc, self.initial_epoch, conn=self.tgs_pool.get()) if missing else []
+            for svc, result in zip(missing, results):
+                if isinstance(result, Exception):
+                    errors[svc] = result
+                else:
+                    tickets[svc] = result
+            return tickets, errors
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(len(services), max_concurrency)) as pool:
+            futs = {svc: pool.submit(tgs_req, None, None, svc, tgt, Kc_tgs, self.client_name, self.adc,
+                                     self.initial_epoch, self.tgs_pool.get(), force)
+                    for svc in services}
+            for svc, fut in futs.items():
+                try:
+                    tickets[svc] = fut.result()
+                except Exception as e:
+                    errors[svc] = e
+        return tickets, errors
+
+    def close(self):
+        self.as_pool.close()
+        self.tgs_pool.close()
+
+# --- Background renewal: refresh cached tickets before TS + Lifetime ---
+
+
+def _due(ts, lifetime, nowm, refresh_ahead):
+    return nowm >= ts + lifetime - refresh_ahead
+
+
+def renew_tickets(client_name, client_pass, initial_epoch, refresh_ahead=1, as_host=AS_HOST, as_port=AS_PORT,
+                  tgs_host=TGS_HOST, tgs_port=TGS_PORT, idtgs=TGS_ID, adc=CLIENT_AD):
+    """Re-acquire the principal's TGT and cached service tickets that expire within refresh_ahead minutes.
+
+    Returns the number of tickets renewed.
+    """
+    c = ticket_cache()
+    nowm = now_minutes(initial_epoch)
+    renewed = 0
+
+    tgt = c.get(tgt_key(client_name))
+    if tgt is None or _due(tgt["TS2"], tgt["Lifetime2"], nowm, refresh_ahead):
+        try:
+            Kc_tgs, Tickettgs, _, _ = as_req(as_host, int(as_port), client_name, client_pass, idtgs, adc,
+                                             initial_epoch, force=True)
+        except Exception as e:
+            _count("renewal_errors")
+            log(f"[Renew:{client_name}] TGT renewal failed: {e}")
+            return renewed
+        _count("renewed_tgt")
+        renewed += 1
+    else:
+        Kc_tgs, Tickettgs = tgt["Kc_tgs"], tgt["Tickettgs"]
+
+    # Expired tickets have already dropped out of the cache, so only live ones are kept fresh
+    for key in list(c.iterkeys()):
+        if not (isinstance(key, tuple) and key[:2] == ("sgt", client_name)):
+            continue
+        sgt = c.get(key)
+        if not sgt or not _due(sgt["TS4"], sgt["Lifetime4"], nowm, refresh_ahead):
+            continue
+        try:
+            tgs_req(tgs_host, int(tgs_port), sgt["IDv"], Tickettgs, Kc_tgs, client_name, adc, initial_epoch,
+                    force=True)
+        except Exception as e:
+            _count("renewal_errors")
+            log(f"[Renew:{client_name}] {sgt['IDv']} renewal failed: {e}")
+            continue
+        _count("renewed_sgt")
+        renewed += 1
+    return renewed
+
+
+class RenewalDaemon:
+    """Runs renew_tickets every interval seconds (+ up to jitter seconds, so hosts don't sync up)."""
+
+    def __init__(self, client_name, client_pass, initial_epoch, refresh_ahead=1, interval=15.0, jitter=5.0,
+                 **endpoints):
+        self.args = (client_name, client_pass, initial_epoch, refresh_ahead)
+        self.endpoints = endpoints
+        self.interval = interval
+        self.jitter = jitter
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self
+
+    def run(self):
+        # Random first delay too: a fleet restarted together shouldn't renew in lockstep
+        while not self._stop.wait(random.uniform(0, self.jitter)):
+            n = renew_tickets(*self.args, **self.endpoints)
+            if n:
+                log(f"[Renew:{self.args[0]}] renewed {n} ticket(s)")
+            if self._stop.wait(self.interval):
+                break
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
 # --- Main ---
 
 
@@ -116,12 +462,48 @@ def main():
     ap.add_argument("--as-port", type=int, default=AS_PORT)
     ap.add_argument("--tgs-host", default=TGS_HOST)
     ap.add_argument("--tgs-port", type=int, default=TGS_PORT)
-    ap.add_argument("--service", required=True,
-                    help="Service principal to access")
+    ap.add_argument("--tgs-replicas", default=TGS_REPLICAS,
+                    help="host:port,host:port of TGS replicas to balance over (default $KERBEROS_TGS_REPLICAS)")
+    ap.add_argument("--service", help="Service principal to access")
     ap.add_argument("--message", default="Hello from client!")
     ap.add_argument("--initial-wall-clock", type=int, required=False)
+    ap.add_argument("--clock", default=os.getenv("KERBEROS_CLOCK", "wall"),
+                    help="Time source: wall, virtual[:RATE], file[:PATH] (shared, see time_synchronize.py) "
+                         "or control:PORT")
+    ap.add_argument("--session", action="store_true",
+                    help="Keep the connection open after the AP exchange and send each --send message over it")
+    ap.add_argument("--send", action="append", default=[], help="Extra message for --session (repeatable)")
+    ap.add_argument("--file", default=None, help="Stream this file to the service over a session")
+    ap.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK, help="File chunk size in bytes")
+    ap.add_argument("--window", type=int, default=DEFAULT_WINDOW,
+                    help="Most unacknowledged session frames in flight")
+    ap.add_argument("--wire", choices=["json", "binary"], default=None,
+                    help="Encoding for frames and tickets (default: KERBEROS_WIRE or json)")
+    ap.add_argument("--renew", action="store_true",
+                    help="Run in the foreground, renewing this principal's cached tickets before they expire")
+    ap.add_argument("--refresh-ahead", type=int, default=1,
+                    help="Renew tickets this many minutes before TS + Lifetime")
+    ap.add_argument("--renew-interval", type=float, default=15.0, help="Seconds between renewal scans")
+    ap.add_argument("--renew-jitter", type=float, default=5.0, help="Random extra delay per scan, in seconds")
+    ap.add_argument("--stats", action="store_true", help="Print renewal and inline-miss counters and exit")
     args = ap.parse_args()
 
+    if args.stats:
+        print(renewal_stats())
+        return
+    if not args.renew and not args.service:
+        ap.error("--service is required unless --renew or --stats is given")
+
+    if args.tgs_replicas:
+        use_tgs_replicas(args.tgs_replicas)
+    clock.use(args.clock)
+    if args.clock != "wall":
+        log(f"[Client:{CLIENT_NAME}] Clock: {clock.get().state()}")
+
+    if args.wire is not None:
+        global WIRE_VERSION
+        WIRE_VERSION = WIRE_BINARY if args.wire == "binary" else WIRE_JSON
+
     # Initial epoch
     if args.initial_wall_clock is None:
         try:
@@ -135,6 +517,17 @@ def main():
         except ValueError:
             raise ValueError("Invalid value in epoch.txt")
 
+    if args.renew:
+        daemon = RenewalDaemon(CLIENT_NAME, CLIENT_PASSWORD, args.initial_wall_clock, args.refresh_ahead,
+                               args.renew_interval, args.renew_jitter, as_host=args.as_host, as_port=args.as_port,
+                               tgs_host=args.tgs_host, tgs_port=args.tgs_port)
+        log(f"[Renew:{CLIENT_NAME}] renewing tickets {args.refresh_ahead}m before expiry")
+        try:
+            daemon.run()
+        except KeyboardInterrupt:
+            pass
+        return
+
     # 1) AS exchange
     k_c_tgs, tgt, tgt_life, ts2 = as_req(
         args.as_host, args.as_port, CLIENT_NAME, CLIENT_PASSWORD, TGS_ID, CLIENT_AD, args.initial_wall_clock
@@ -150,10 +543,24 @@ def main():
 
     # 3) App request
     SERVICE_PORT = int(os.getenv(f"{args.service.upper()}_PORT", 7001))
-    # print(f"{CLIENT_NAME}")
-    rep = app_req(server_host, SERVICE_PORT, ticket_s, k_c_s,
-                  CLIENT_NAME, CLIENT_AD, args.message, args.initial_wall_clock)
-    log(f"[Client:{CLIENT_NAME}] Server reply: {rep['ack']}")
+    if not (args.session or args.file):
+        rep = app_req(server_host, SERVICE_PORT, ticket_s, k_c_s,
+                      CLIENT_NAME, CLIENT_AD, args.message, args.initial_wall_clock)
+        log(f"[Client:{CLIENT_NAME}] Server reply: {rep['ack']}")
+        return
+
+    rep, session = open_session(server_host, SERVICE_PORT, ticket_s, k_c_s, CLIENT_NAME, CLIENT_AD,
+                                args.message, args.initial_wall_clock, args.window)
+    log(f"[Client:{CLIENT_NAME}] Server reply: {rep['ack']} (session open)")
+    try:
+        for msg in args.send:
+            log(f"[Client:{CLIENT_NAME}] Server reply: {session.message(msg)['ack']}")
+        if args.file:
+            with open(args.file, "rb") as f:
+                done = session.send_file(f, os.path.basename(args.file), args.chunk_size)
+            log(f"[Client:{CLIENT_NAME}] Sent {done['file']}: {done['bytes']} bytes, sha256 {done['sha256']}")
+    finally:
+        session.close()
 
 
 if __name__ == "__main__":
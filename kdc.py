@@ -1,149 +1,626 @@
 import argparse
+import os
+import signal
 import socket
 import threading
-from utils.crypto import encrypt_obj, decrypt_obj, send_json, recv_json, now_minutes, log
-from utils.kerberos_db import get_client, get_server, get_tgs, get_tgs_by_id
+import time
+from utils.crypto import (encrypt_obj, decrypt_obj, encrypt_many, decrypt_many, now_minutes, log, preload_key,
+                          set_max_frame, send_json)
+from utils.wire import WIRE_JSON, WIRE_BINARY
+from utils.mux import serve_conn, serve_conn_async
+from utils.replay_cache import ReplayCache, ReplayCacheFull
+from utils.admission import Admission, ticket_key
+from utils import metrics, eventlog, clock
+from utils.kerberos_db import (get_client, get_server, get_tgs, get_tgs_by_id, reconnect, configure_cache,
+                               cache_stats, start_watcher, use_store, warm_cache, iter_principals)
 
-# --- AS: Handles TGT requests ---
-def run_as(host: str, port: int, initial_epoch: int):
+DRAIN_TIMEOUT = 10.0  # seconds to let in-flight requests finish on SIGTERM
+MAX_BATCH = 1000  # items per TGS_BATCH_REQ; replaced from --max-batch, 0 refuses batches
+MAX_CONNECTIONS = 1024  # connections the threaded engine serves at once; replaced from --max-connections
+IDLE_TIMEOUT = 30.0  # seconds a threaded connection may go without sending; replaced from --idle-timeout
+
+# Set on SIGTERM/SIGINT: accept loops stop and the process drains
+_stopping = threading.Event()
+_inflight = 0
+_inflight_cv = threading.Condition()
+# One handler thread per connection, so this bounds the threads. At the limit a new connection
+# is still accepted, but only to answer ERR overloaded and close it, so the client learns to
+# back off at once instead of sitting in the listen backlog; idle connections are closed after
+# IDLE_TIMEOUT so they can't hold slots forever
+_conn_slots = threading.BoundedSemaphore(MAX_CONNECTIONS)
+
+# Seen TGS authenticators; replaced in serve() once the window/persistence flags are known
+replay_cache = ReplayCache()
+# Rate limits and overload shedding; no limits until serve() applies the --*-rate flags
+admission = Admission()
+
+
+def listen_socket(host: str, port: int, backlog: int, reuse_port: bool = False):
     srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        # Lets every KDC worker bind the same port; the kernel spreads connections across them
+        srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     srv.bind((host, port))
-    srv.listen(5)
+    srv.listen(backlog)
+    return srv
+
+
+def accept_loop(srv, handler, initial_epoch: int):
+    srv.settimeout(0.5)  # wake up periodically to notice _stopping
+    while not _stopping.is_set():
+        try:
+            conn, addr = srv.accept()
+        except socket.timeout:
+            continue
+        slots = _conn_slots
+        if slots is not None and not slots.acquire(blocking=False):
+            _refuse(conn)
+            continue
+        conn.settimeout(IDLE_TIMEOUT)
+        try:
+            threading.Thread(target=_tracked, args=(handler, conn, addr, initial_epoch, slots),
+                             daemon=True).start()
+        except RuntimeError:  # can't start new thread
+            conn.close()
+            if slots is not None:
+                slots.release()
+    srv.close()
+
+
+def _refuse(conn):
+    # The request isn't read, so its wire version is unknown; every client decodes JSON
+    try:
+        conn.setblocking(False)  # a short reply into an empty send buffer; never stall the accept loop
+        send_json(conn, admission.shed())
+        conn.shutdown(socket.SHUT_WR)
+    except OSError:
+        pass
+    finally:
+        conn.close()
+
+
+def _tracked(handler, conn, addr, initial_epoch: int, slots=None):
+    global _inflight
+    with _inflight_cv:
+        _inflight += 1
+    try:
+        handler(conn, addr, initial_epoch)
+    finally:
+        with _inflight_cv:
+            _inflight -= 1
+            _inflight_cv.notify_all()
+        if slots is not None:
+            slots.release()
+
+
+def drain(timeout: float = DRAIN_TIMEOUT) -> bool:
+    """Wait for in-flight threaded handlers; False if some were still running at the timeout."""
+    with _inflight_cv:
+        return _inflight_cv.wait_for(lambda: _inflight == 0, timeout)
+
+
+# --- AS: Handles TGT requests ---
+def run_as(host: str, port: int, initial_epoch: int, backlog: int = 128, reuse_port: bool = False):
+    srv = listen_socket(host, port, backlog, reuse_port)
     log(f"[AS] Listening on {host}:{port}")
-    
-    while True:
-        conn, addr = srv.accept()
-        threading.Thread(target=handle_as_conn, args=(conn, addr, initial_epoch), daemon=True).start()
+    accept_loop(srv, handle_as_conn, initial_epoch)
 
 
 def handle_as_conn(conn, addr, initial_epoch: int):
+    # One request per connection, or many pipelined ones in keep-alive mode
+    serve_conn(conn, addr, admit_as_req, initial_epoch, exchange="AS")
+
+
+# --- Admission: checked on the plaintext fields, before any DB lookup or decryption ---
+def principal_key(exchange: str, req):
+    """What the per-principal limit counts: IDc for AS; for TGS the presented TGT.
+    A TGS_BATCH_REQ has no single TGT: its items are charged one by one in _charge_batch.
+    Anything but a string IDc or a str/bytes TGT is refused here, before admission."""
+    if exchange == "AS":
+        IDc = req.get("IDc")
+        if not isinstance(IDc, str):
+            raise ValueError("bad IDc")
+        return ("AS", IDc)
+    if req.get("type") == "TGS_BATCH_REQ":
+        return None
+    ticket = req.get("Tickettgs")
+    if not isinstance(ticket, (str, bytes)):
+        raise ValueError("bad Tickettgs")
+    return ("TGS", ticket_key(ticket))
+
+
+def _admit(exchange: str, req, addr):
+    """(req, None) once admitted, to be followed by admission.release(); or (None, the ERR reply)."""
+    rejected = admission.admit(principal_key(exchange, req), addr[0] if addr else None)
+    if rejected is not None:
+        return None, rejected
+    if exchange == "TGS" and req.get("type") == "TGS_BATCH_REQ":
+        try:
+            req, rejected = _charge_batch(req)
+        except BaseException:
+            admission.release()
+            raise
+        if rejected is not None:
+            admission.release()
+            return None, rejected
+    return req, None
+
+
+def _charge_batch(req):
+    """Each batch item spends a token from its TGT's bucket, as the same TGS_REQ would. Items
+    over the limit are marked for process_tgs_batch_req to answer with the reason; a batch
+    with no item left under the limit is refused whole."""
+    items = req.get("Items")
+    if not isinstance(items, list) or not 0 < len(items) <= MAX_BATCH:
+        return req, None  # refused by process_tgs_batch_req before any work
+    keys = [("TGS", ticket_key(item["Tickettgs"]))
+            if isinstance(item, dict) and isinstance(item.get("Tickettgs"), (str, bytes)) else None
+            for item in items]
+    over, rejected = admission.admit_items(keys)
+    if rejected is not None or not over:
+        return req, rejected
+    return dict(req, Items=[{"_refused": "principal rate limited"} if i in over else item
+                            for i, item in enumerate(items)]), None
+
+
+def _admitted(exchange: str, process, req, addr, initial_epoch: int, wire_version: int):
+    req, rejected = _admit(exchange, req, addr)
+    if rejected is not None:
+        return rejected
     try:
-        req = recv_json(conn)
-        if req.get("type") != "AS_REQ":
-            return send_json(conn, {"type": "ERR", "reason": "bad type"})
-
-        IDc, IDtgs, TS1 = req["IDc"], req["IDtgs"], req["TS1"]
-        client = get_client(IDc)
-        tgs = get_tgs_by_id(IDtgs)
-
-        if not tgs:
-            return send_json(conn, {"type": "ERR", "reason": "unknown TGS"})
-
-        if not client:
-            return send_json(conn, {"type": "ERR", "reason": "unknown client"})
-
-        nowm = now_minutes(initial_epoch)
-        Kc_tgs = f"Kc_tgs::{IDc}::{nowm}"
-        Lifetime2 = tgs["default_lifetime_tgt"]
-        TS2 = nowm
-
-        ADc = addr[0]  # client IP
-        # Build TGT (encrypted with Ktgs)
-        Tickettgs = encrypt_obj({
-            "Kc_tgs": Kc_tgs,
-            "IDc": IDc,
-            "ADc": ADc,
-            "IDtgs": IDtgs,
-            "TS2": TS2,
-            "Lifetime2": Lifetime2
-        }, tgs["ktgs"])
-
-        # Encrypt response for client using client's password (long-term key)
-        enc_for_c = encrypt_obj({
-            "Kc_tgs": Kc_tgs,
-            "IDtgs": IDtgs,
-            "TS2": TS2,
-            "Lifetime2": Lifetime2,
-            "Tickettgs": Tickettgs
-        }, client["password"])
-
-        send_json(conn, {"type": "AS_REP", "data": enc_for_c})
-        log(f"[AS] TGT→{IDc} TS2={TS2} life={Lifetime2}m")
-    except Exception as e:
-        send_json(conn, {"type": "ERR", "reason": str(e)})
+        return process(req, addr, initial_epoch, wire_version=wire_version)
     finally:
-        conn.close()
+        admission.release()
+
+
+def admit_as_req(req, addr, initial_epoch: int, wire_version: int = WIRE_JSON):
+    return _admitted("AS", process_as_req, req, addr, initial_epoch, wire_version)
+
+
+def admit_tgs_req(req, addr, initial_epoch: int, wire_version: int = WIRE_JSON):
+    return _admitted("TGS", process_tgs_req, req, addr, initial_epoch, wire_version)
+
+
+def process_as_req(req, addr, initial_epoch: int, wire_version: int = WIRE_JSON):
+    t = metrics.timer("AS")
+    started = time.perf_counter()
+    if req.get("type") != "AS_REQ":
+        return {"type": "ERR", "reason": "bad type"}
+
+    IDc, IDtgs, TS1 = req["IDc"], req["IDtgs"], req["TS1"]
+    client = get_client(IDc)
+    tgs = get_tgs_by_id(IDtgs)
+    t.lap("db")
+
+    if not tgs:
+        return {"type": "ERR", "reason": "unknown TGS"}
+
+    if not client:
+        return {"type": "ERR", "reason": "unknown client"}
+
+    nowm = now_minutes(initial_epoch)
+    Kc_tgs = f"Kc_tgs::{IDc}::{nowm}"
+    Lifetime2 = tgs["default_lifetime_tgt"]
+    TS2 = nowm
+
+    ADc = addr[0]  # client IP
+    binary = wire_version == WIRE_BINARY  # raw ciphertext instead of base64 in binary frames
+    # Build TGT (encrypted with Ktgs)
+    Tickettgs = encrypt_obj({
+        "Kc_tgs": Kc_tgs,
+        "IDc": IDc,
+        "ADc": ADc,
+        "IDtgs": IDtgs,
+        "TS2": TS2,
+        "Lifetime2": Lifetime2
+    }, tgs["ktgs"], binary)
+
+    # Encrypt response for client using client's password (long-term key)
+    enc_for_c = encrypt_obj({
+        "Kc_tgs": Kc_tgs,
+        "IDtgs": IDtgs,
+        "TS2": TS2,
+        "Lifetime2": Lifetime2,
+        "Tickettgs": Tickettgs
+    }, client["password"], binary)
+    t.lap("encrypt")
+
+    eventlog.emit("AS", principal=IDc, result="TGT", peer=ADc, TS2=TS2, lifetime=Lifetime2,
+                  latency_ms=round((time.perf_counter() - started) * 1000, 3))
+    return {"type": "AS_REP", "data": enc_for_c}
 
 
 # --- TGS: Handles service ticket requests ---
-def run_tgs(host: str, port: int, initial_epoch: int):
-    srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    srv.bind((host, port))
-    srv.listen(5)
+def run_tgs(host: str, port: int, initial_epoch: int, backlog: int = 128, reuse_port: bool = False):
+    srv = listen_socket(host, port, backlog, reuse_port)
     log(f"[TGS] Listening on {host}:{port}")
-    
-    while True:
-        conn, addr = srv.accept()
-        threading.Thread(target=handle_tgs_conn, args=(conn, addr, initial_epoch), daemon=True).start()
+    accept_loop(srv, handle_tgs_conn, initial_epoch)
 
 
 def handle_tgs_conn(conn, addr, initial_epoch: int):
+    # One request per connection, or many pipelined ones in keep-alive mode
+    serve_conn(conn, addr, admit_tgs_req, initial_epoch, exchange="TGS")
+
+
+def process_tgs_req(req, addr, initial_epoch: int, wire_version: int = WIRE_JSON):
+    t = metrics.timer("TGS")
+    started = time.perf_counter()
+    if req.get("type") == "TGS_BATCH_REQ":
+        return process_tgs_batch_req(req, addr, initial_epoch, wire_version)
+    if req.get("type") != "TGS_REQ":
+        return {"type": "ERR", "reason": "bad type"}
+
+    IDv = req["IDv"]
+    Tickettgs = req["Tickettgs"]
+    Authc = req["Authenticatorc"]
+
+    tgs = get_tgs()
+    t.lap("db")
+    tgt_data = decrypt_obj(Tickettgs, tgs["ktgs"])
+    Kc_tgs, IDc, ADc_tgt, _, TS2, Lifetime2 = (
+        tgt_data["Kc_tgs"],
+        tgt_data["IDc"],
+        tgt_data["ADc"],
+        tgt_data["IDtgs"],
+        tgt_data["TS2"],
+        tgt_data["Lifetime2"],
+    )
+    t.lap("decrypt")
+
+    nowm = now_minutes(initial_epoch)
+    if not (TS2 <= nowm <= TS2 + Lifetime2):
+        return {"type": "ERR", "reason": "TGT expired"}
+
+    auth_data = decrypt_obj(Authc, Kc_tgs)
+    t.lap("decrypt")
+    refused = check_authenticator(tgt_data, auth_data, nowm)
+    if refused:
+        return {"type": "ERR", "reason": refused}
+    t.lap("validate")
+
+    service = get_server(IDv)
+    t.lap("db")
+    if not service:
+        return {"type": "ERR", "reason": "unknown service"}
+    Kv = service["password"]
+
+    Kc_v = f"Kc_v::{IDc}::{IDv}::{nowm}"
+    Lifetime4 = tgs["default_lifetime_st"]
+    TS4 = nowm
+    binary = wire_version == WIRE_BINARY
+
+    Ticketv = encrypt_obj({
+        "Kc_v": Kc_v,
+        "IDc": IDc,
+        "ADc": ADc_tgt,
+        "IDv": IDv,
+        "TS4": TS4,
+        "Lifetime4": Lifetime4
+    }, Kv, binary)
+
+    enc_for_c = encrypt_obj({
+        "Kc_v": Kc_v,
+        "IDv": IDv,
+        "TS4": TS4,
+        "Lifetime4":Lifetime4,
+        "Ticketv": Ticketv
+    }, Kc_tgs, binary)
+    t.lap("encrypt")
+
+    eventlog.emit("TGS", principal=IDc, result="SGT", service=IDv, peer=ADc_tgt, TS4=TS4, lifetime=Lifetime4,
+                  latency_ms=round((time.perf_counter() - started) * 1000, 3))
+    return {"type": "TGS_REP", "data": enc_for_c}
+
+
+def check_authenticator(tgt_data, auth_data, nowm: int):
+    """Why the authenticator doesn't go with the (unexpired) TGT, or None once it is recorded as seen."""
+    IDc, ADc_tgt = tgt_data["IDc"], tgt_data["ADc"]
+    if auth_data["IDc"] != IDc:
+        return "client mismatch"
+    if auth_data["ADc"] != ADc_tgt:
+        return "addr mismatch"
+    if auth_data["TS3"] > nowm or auth_data["TS3"] < tgt_data["TS2"]:
+        return "stale authenticator"
     try:
-        req = recv_json(conn)
-        if req.get("type") != "TGS_REQ":
-            return send_json(conn, {"type": "ERR", "reason": "bad type"})
-
-        IDv = req["IDv"]
-        Tickettgs = req["Tickettgs"]
-        Authc = req["Authenticatorc"]
-
-        tgs = get_tgs()
-        tgt_data = decrypt_obj(Tickettgs, tgs["ktgs"])
-        Kc_tgs, IDc, ADc_tgt, _, TS2, Lifetime2 = (
-            tgt_data["Kc_tgs"],
-            tgt_data["IDc"],
-            tgt_data["ADc"],
-            tgt_data["IDtgs"],
-            tgt_data["TS2"],
-            tgt_data["Lifetime2"],
-        )
-
-        nowm = now_minutes(initial_epoch)
-        if not (TS2 <= nowm <= TS2 + Lifetime2):
-            return send_json(conn, {"type": "ERR", "reason": "TGT expired"})
-
-        auth_data = decrypt_obj(Authc, Kc_tgs)
-        if auth_data["IDc"] != IDc:
-            return send_json(conn, {"type": "ERR", "reason": "client mismatch"})
-        if auth_data["ADc"] != ADc_tgt:
-            return send_json(conn, {"type": "ERR", "reason": "addr mismatch"})
-        if auth_data["TS3"] > nowm or auth_data["TS3"] < TS2:
-            return send_json(conn, {"type": "ERR", "reason": "stale authenticator"})
+        if not replay_cache.check_and_add(IDc, ADc_tgt, auth_data["TS3"], auth_data, nowm):
+            return "replayed authenticator"
+    except ReplayCacheFull as e:
+        return str(e)
+    return None
+
+
+# --- TGS batches: many service tickets per request, for batch jobs ---
+# Each item is a full TGS_REQ (its own TGT and authenticator) and gets exactly the checks
+# process_tgs_req makes; what the batch saves is per-request work. The TGTs are all under
+# Ktgs and the tickets for one service all under its Kv, so each group is decrypted or
+# encrypted with one cipher call over one buffer (encrypt_many/decrypt_many), each service
+# is looked up once, and the whole batch is one frame each way.
+BATCH_FIELDS = ("IDv", "Tickettgs", "Authenticatorc")
+TGT_FIELDS = ("Kc_tgs", "IDc", "ADc", "TS2", "Lifetime2")
+AUTH_FIELDS = ("IDc", "ADc", "TS3")
 
+
+def process_tgs_batch_req(req, addr, initial_epoch: int, wire_version: int = WIRE_JSON):
+    """{"type": "TGS_BATCH_REQ", "Items": [{IDv, Tickettgs, Authenticatorc}, ...]} ->
+    {"type": "TGS_BATCH_REP", "Items": [...]}, each item {"data": enc_for_c} or {"reason": why}, in order."""
+    t = metrics.timer("TGS")
+    started = time.perf_counter()
+    items = req.get("Items")
+    if not isinstance(items, list) or not items:
+        return {"type": "ERR", "reason": "empty batch"}
+    if len(items) > MAX_BATCH:
+        return {"type": "ERR", "reason": f"batch too large (max {MAX_BATCH})"}
+
+    tgs = get_tgs()
+    t.lap("db")
+    out = [None] * len(items)
+    live = []
+    for i, item in enumerate(items):
+        if isinstance(item, dict) and "_refused" in item:  # over its TGT's rate limit (_charge_batch)
+            out[i] = {"reason": item["_refused"]}
+        elif isinstance(item, dict) and all(k in item for k in BATCH_FIELDS):
+            live.append(i)
+        else:
+            out[i] = {"reason": "malformed item"}
+
+    nowm = now_minutes(initial_epoch)
+    tgts = dict(zip(live, decrypt_many([items[i]["Tickettgs"] for i in live], tgs["ktgs"])))
+    by_session_key = {}  # Kc_tgs -> item indexes (one TGT may ask for several services)
+    for i in live:
+        tgt_data = tgts[i]
+        if not isinstance(tgt_data, dict) or not all(k in tgt_data for k in TGT_FIELDS):
+            out[i] = {"reason": "bad TGT"}
+        elif not (tgt_data["TS2"] <= nowm <= tgt_data["TS2"] + tgt_data["Lifetime2"]):
+            out[i] = {"reason": "TGT expired"}
+        else:
+            by_session_key.setdefault(tgt_data["Kc_tgs"], []).append(i)
+
+    by_service = {}  # IDv -> item indexes that passed validation
+    for Kc_tgs, idxs in by_session_key.items():
+        auths = decrypt_many([items[i]["Authenticatorc"] for i in idxs], Kc_tgs)
+        for i, auth_data in zip(idxs, auths):
+            if isinstance(auth_data, dict) and all(k in auth_data for k in AUTH_FIELDS):
+                refused = check_authenticator(tgts[i], auth_data, nowm)
+            else:  # the decryption error, or not an authenticator under this TGT's session key
+                refused = "bad authenticator"
+            if refused:
+                out[i] = {"reason": refused}
+            else:
+                by_service.setdefault(items[i]["IDv"], []).append(i)
+    t.lap("validate")
+
+    Lifetime4 = tgs["default_lifetime_st"]
+    TS4 = nowm
+    binary = wire_version == WIRE_BINARY
+    for_client = {}  # item index -> enc_for_c plaintext
+    for IDv, idxs in by_service.items():
         service = get_server(IDv)
         if not service:
-            return send_json(conn, {"type": "ERR", "reason": "unknown service"})
-        Kv = service["password"]
-
-        Kc_v = f"Kc_v::{IDc}::{IDv}::{nowm}"
-        Lifetime4 = tgs["default_lifetime_st"]
-        TS4 = nowm
-
-        Ticketv = encrypt_obj({
-            "Kc_v": Kc_v,
-            "IDc": IDc,
-            "ADc": ADc_tgt,
-            "IDv": IDv,
-            "TS4": TS4,
-            "Lifetime4": Lifetime4
-        }, Kv)
-
-        enc_for_c = encrypt_obj({
-            "Kc_v": Kc_v,
-            "IDv": IDv,
-            "TS4": TS4,
-            "Lifetime4":Lifetime4,
-            "Ticketv": Ticketv
-        }, Kc_tgs)
-
-        send_json(conn, {"type": "TGS_REP", "data": enc_for_c})
-        log(f"[TGS] SGT→{IDc} for {IDv} TS4={TS4} life={Lifetime4}m")
-    except Exception as e:
-        send_json(conn, {"type": "ERR", "reason": str(e)})
-    finally:
-        conn.close()
+            for i in idxs:
+                out[i] = {"reason": "unknown service"}
+            continue
+        tickets = []
+        for i in idxs:
+            IDc = tgts[i]["IDc"]
+            Kc_v = f"Kc_v::{IDc}::{IDv}::{nowm}"
+            tickets.append({"Kc_v": Kc_v, "IDc": IDc, "ADc": tgts[i]["ADc"], "IDv": IDv, "TS4": TS4,
+                            "Lifetime4": Lifetime4})
+            for_client[i] = {"Kc_v": Kc_v, "IDv": IDv, "TS4": TS4, "Lifetime4": Lifetime4}
+        for i, Ticketv in zip(idxs, encrypt_many(tickets, service["password"], binary)):
+            for_client[i]["Ticketv"] = Ticketv
+    t.lap("encrypt")
+
+    for Kc_tgs, idxs in by_session_key.items():
+        idxs = [i for i in idxs if i in for_client]
+        if idxs:
+            for i, enc_for_c in zip(idxs, encrypt_many([for_client[i] for i in idxs], Kc_tgs, binary)):
+                out[i] = {"data": enc_for_c}
+    t.lap("encrypt")
+
+    latency_ms = round((time.perf_counter() - started) * 1000, 3)
+    for i, rep in enumerate(out):
+        if "data" in rep:
+            tgt_data = tgts[i]
+            eventlog.emit("TGS", principal=tgt_data["IDc"], result="SGT", service=items[i]["IDv"],
+                          peer=tgt_data["ADc"], TS4=TS4, lifetime=Lifetime4, batch=len(items),
+                          latency_ms=latency_ms)
+        else:
+            eventlog.emit("TGS", always=True, result="ERR", reason=rep["reason"], batch=len(items),
+                          peer=addr[0] if addr else None, latency_ms=latency_ms)
+    return {"type": "TGS_BATCH_REP", "Items": out}
+
+
+# --- asyncio engine: AS + TGS on one event loop ---
+# asyncio is imported where it is used, so the threaded engine never loads it
+async def handle_conn_async(reader, writer, process, exchange: str, initial_epoch: int, slots: "asyncio.Semaphore"):
+    import asyncio
+    addr = writer.get_extra_info("peername")
+    loop = asyncio.get_running_loop()
+
+    async def run(req, wire_version):
+        # Shed or rate-limited requests are answered on the loop, before taking a handler slot
+        req, rejected = _admit(exchange, req, addr)
+        if rejected is not None:
+            return rejected
+        try:
+            # Requests beyond max_handlers wait here instead of spawning more work;
+            # Mongo lookups and DES are blocking, so they run off the loop
+            async with slots:
+                return await loop.run_in_executor(None, process, req, addr, initial_epoch, wire_version)
+        finally:
+            admission.release()
+
+    await serve_conn_async(reader, writer, run, exchange)
+
+
+async def serve_async(host: str, as_port: int, tgs_port: int, initial_epoch: int,
+                      backlog: int = 1024, max_handlers: int = 256, reuse_port: bool = False,
+                      role: str = "both"):
+    import asyncio
+    slots = asyncio.Semaphore(max_handlers)
+    inflight = set()
+
+    def handler(process, exchange):
+        async def tracked(r, w):
+            task = asyncio.current_task()
+            inflight.add(task)
+            try:
+                await handle_conn_async(r, w, process, exchange, initial_epoch, slots)
+            finally:
+                inflight.discard(task)
+        return tracked
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    servers = []
+    if role in ("both", "as"):
+        servers.append(await asyncio.start_server(handler(process_as_req, "AS"), host, as_port,
+                                                  backlog=backlog, reuse_port=reuse_port))
+        log(f"[AS] Listening on {host}:{as_port} (asyncio)")
+    if role in ("both", "tgs"):
+        servers.append(await asyncio.start_server(handler(process_tgs_req, "TGS"), host, tgs_port,
+                                                  backlog=backlog, reuse_port=reuse_port))
+        log(f"[TGS] Listening on {host}:{tgs_port} (asyncio, backlog={backlog}, max_handlers={max_handlers})")
+
+    await stop.wait()
+    for srv in servers:
+        srv.close()
+    if inflight:
+        await asyncio.wait(set(inflight), timeout=DRAIN_TIMEOUT)
+
+
+def serve_threaded(host: str, as_port: int, tgs_port: int, initial_epoch: int,
+                   backlog: int = 128, reuse_port: bool = False, role: str = "both"):
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda signum, frame: _stopping.set())
+
+    loops = []
+    if role in ("both", "as"):
+        loops.append(threading.Thread(target=run_as, args=(host, as_port, initial_epoch, backlog, reuse_port),
+                                      daemon=True))
+    if role in ("both", "tgs"):
+        loops.append(threading.Thread(target=run_tgs, args=(host, tgs_port, initial_epoch, backlog, reuse_port),
+                                      daemon=True))
+    for t in loops:
+        t.start()
+    while not _stopping.wait(1.0):
+        if not all(t.is_alive() for t in loops):
+            raise SystemExit("[KDC] listener exited unexpectedly")
+    for t in loops:
+        t.join()
+    if not drain():
+        log("[KDC] Drain timed out with requests still in flight")
+
+
+def warmup():
+    """Fill the principal cache and derive the TGS/service key schedules before the ports open."""
+    t0 = time.perf_counter()
+    counts = warm_cache()
+    keys = 0
+    for kind, field in (("tgs", "ktgs"), ("server", "password")):
+        for doc in iter_principals(kind):
+            preload_key(doc[field])
+            keys += 1
+    log(f"[KDC] Warmed up {counts} principals and {keys} keys in {(time.perf_counter() - t0) * 1000:.0f}ms")
+
+
+def serve(args, reuse_port: bool = False, worker_index: int = None):
+    global replay_cache, admission, MAX_BATCH, _conn_slots, IDLE_TIMEOUT
+    MAX_BATCH = args.max_batch
+    IDLE_TIMEOUT = args.idle_timeout or None
+    _conn_slots = threading.BoundedSemaphore(args.max_connections) if args.max_connections > 0 else None
+    admission = Admission(args.principal_rate, args.principal_burst, args.source_rate, args.source_burst,
+                          args.max_concurrent)
+    # Workers all open the same file, so they check replays against one shared table
+    replay_cache = ReplayCache(window=args.replay_window, path=args.replay_file,
+                               max_entries=args.replay_max_entries, initial_epoch=args.initial_wall_clock)
+    event_log = args.event_log
+    if event_log not in (None, "-") and worker_index is not None:
+        event_log = f"{event_log}.{worker_index}"  # one writer per file
+    events = eventlog.configure(path=event_log, max_bytes=args.event_log_max_bytes,
+                                sample=eventlog.parse_sample(args.event_sample))
+
+    configure_cache(max_size=args.principal_cache_size, ttl=args.principal_cache_ttl,
+                    enabled=args.principal_cache_size > 0)
+    if args.warmup:
+        warmup()
+    if args.principal_watch != "none":
+        start_watcher(args.principal_watch)
+    if args.metrics_port:
+        # Workers share one --metrics-port base; each gets its own port after it
+        port = args.metrics_port + (worker_index or 0)
+        metrics.gauge("kerberos_principal_cache_hits", lambda: cache_stats()["hits"])
+        metrics.gauge("kerberos_principal_cache_misses", lambda: cache_stats()["misses"])
+        metrics.gauge("kerberos_principal_cache_evictions", lambda: cache_stats()["evictions"])
+        metrics.gauge("kerberos_events_dropped", lambda: events.dropped)
+        metrics.gauge("kerberos_admission_inflight", lambda: admission.inflight)
+        metrics.start_http_server(port)
+        log(f"[KDC] Metrics on http://127.0.0.1:{port}/metrics")
+
+    if args.engine == "asyncio":
+        import asyncio
+        asyncio.run(serve_async(args.host, args.as_port, args.tgs_port, args.initial_wall_clock,
+                                args.backlog, args.max_handlers, reuse_port, args.role))
+    else:
+        serve_threaded(args.host, args.as_port, args.tgs_port, args.initial_wall_clock,
+                       args.backlog, reuse_port, args.role)
+    log(f"[KDC] principal cache: {cache_stats()}")
+    log(f"[KDC] admission: {admission.stats()}")
+    replay_cache.close()
+    events.close()
+
+
+# --- Multi-process mode: N forked workers sharing the ports via SO_REUSEPORT ---
+def _spawn_worker(args, index: int) -> int:
+    pid = os.fork()
+    if pid:
+        return pid
+    # Child: own signal handling and its own principal-store connection
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    code = 0
+    try:
+        reconnect()
+        serve(args, reuse_port=True, worker_index=index)
+    except BaseException as e:
+        log(f"[KDC worker {os.getpid()}] crashed: {e!r}")
+        code = 1
+    os._exit(code)
+
+
+def supervise(args):
+    workers = {_spawn_worker(args, i): i for i in range(args.workers)}  # pid -> worker index
+    log(f"[KDC] Supervising {len(workers)} workers: {sorted(workers)}")
+    stopping = False
+
+    def on_signal(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = workers.pop(pid, None)
+        if stopping or index is None:
+            continue
+        log(f"[KDC] Worker {pid} exited (status {status}), restarting")
+        time.sleep(0.5)  # avoid a tight crash loop
+        workers[_spawn_worker(args, index)] = index
+    log("[KDC] All workers drained")
 
 
 # --- Main ---
@@ -152,6 +629,61 @@ def main():
     ap.add_argument("--host", default="127.0.0.1")
     ap.add_argument("--as-port", type=int, default=6000)
     ap.add_argument("--tgs-port", type=int, default=6001)
+    ap.add_argument("--role", choices=["both", "as", "tgs"], default="both",
+                    help="Serve AS and TGS, or only one of them (e.g. TGS replicas behind lb.py)")
+    ap.add_argument("--engine", choices=["threaded", "asyncio"], default="threaded",
+                    help="threaded: one OS thread per connection; asyncio: single event loop")
+    ap.add_argument("--backlog", type=int, default=128, help="listen() backlog for the AS and TGS sockets")
+    ap.add_argument("--max-handlers", type=int, default=256,
+                    help="Max requests processed concurrently (asyncio engine)")
+    ap.add_argument("--max-connections", type=int, default=MAX_CONNECTIONS,
+                    help="Max connections served at once, one thread each (threaded engine); more are answered "
+                         "ERR overloaded and closed. 0 = unlimited")
+    ap.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT,
+                    help="Seconds a connection may wait on the client before it is closed (threaded engine); "
+                         "0 = never")
+    ap.add_argument("--max-frame", type=int, default=16 * 1024 * 1024,
+                    help="Largest request frame accepted, in bytes; a longer length header drops the connection")
+    ap.add_argument("--workers", type=int, default=0,
+                    help="Fork N worker processes sharing the AS/TGS ports (SO_REUSEPORT); 0 = single process")
+    ap.add_argument("--store", default=None,
+                    help="Principal store: mongodb://..., sqlite:PATH or snapshot:PATH (default $KERBEROS_STORE or local Mongo)")
+    ap.add_argument("--warmup", action="store_true",
+                    help="Preload principals and key schedules from the store before binding the ports")
+    ap.add_argument("--principal-cache-size", type=int, default=10000,
+                    help="Max cached client/server/TGS records; 0 disables the cache")
+    ap.add_argument("--principal-cache-ttl", type=float, default=300.0, help="Seconds a cached record stays valid")
+    ap.add_argument("--principal-watch", choices=["none", "poll", "change-stream"], default="none",
+                    help="Invalidate the principal cache on DB writes made by other processes")
+    ap.add_argument("--principal-rate", type=float, default=0.0,
+                    help="Requests/s allowed per client name (AS) and per TGT (TGS); 0 = unlimited (the default)")
+    ap.add_argument("--principal-burst", type=float, default=0.0,
+                    help="Burst size for --principal-rate (default: the rate)")
+    ap.add_argument("--source-rate", type=float, default=0.0,
+                    help="Requests/s allowed per source address; 0 = unlimited (keep it off behind lb.py or NAT)")
+    ap.add_argument("--source-burst", type=float, default=0.0, help="Burst size for --source-rate")
+    ap.add_argument("--max-concurrent", type=int, default=256,
+                    help="Requests processed at once before new ones are shed with ERR overloaded; 0 = unlimited")
+    ap.add_argument("--max-batch", type=int, default=MAX_BATCH,
+                    help="Max service tickets per TGS_BATCH_REQ; 0 refuses batches")
+    ap.add_argument("--replay-window", type=int, default=10,
+                    help="Minutes to remember TGS authenticators (>= the longest TGT lifetime)")
+    ap.add_argument("--replay-file", default=None,
+                    help="mmap file holding the replay cache, shared by --workers and by TGS replicas on this "
+                         "host, and kept across restarts (required with --workers)")
+    ap.add_argument("--replay-max-entries", type=int, default=1 << 20,
+                    help="Authenticators the replay cache holds; new ones are refused once it is full")
+    ap.add_argument("--metrics-port", type=int, default=0,
+                    help="Serve /metrics and /profile/start|stop on this local port (worker i uses port+i)")
+    ap.add_argument("--event-log", default="-",
+                    help="Request event log file ('-' = stdout); worker i writes FILE.i")
+    ap.add_argument("--event-log-max-bytes", type=int, default=10 * 1024 * 1024,
+                    help="Rotate the event log file at this size (keeps 3 old files)")
+    ap.add_argument("--event-sample", default="",
+                    help="Fraction of successful requests logged per exchange, e.g. AS=1,TGS=0.1")
+    ap.add_argument("--clock", default=os.getenv("KERBEROS_CLOCK", "wall"),
+                    help="Time source: wall, virtual[:RATE], file[:PATH] (shared, see time_synchronize.py) "
+                         "or control:PORT")
     ap.add_argument(
         "--initial-wall-clock",
         type=int,
@@ -159,6 +691,15 @@ def main():
         help="Shared initial epoch (UNIX seconds). Will read from epoch.txt.",
     )
     args = ap.parse_args()
+    set_max_frame(args.max_frame)
+    if args.workers > 0 and not args.replay_file:
+        ap.error("--workers needs --replay-file: without a shared replay cache, an authenticator "
+                 "replayed to another worker would be accepted")
+    if args.workers > 0 and args.clock.startswith("control"):
+        ap.error("--clock control:PORT steers one process; use --clock file:PATH with --workers")
+    clock.use(args.clock)
+    if args.clock != "wall":
+        log(f"[KDC] Clock: {clock.get().state()}")
 
     if args.initial_wall_clock is None:
         try:
@@ -170,8 +711,12 @@ def main():
         except ValueError:
             raise ValueError("Invalid value in epoch.txt")
 
-    threading.Thread(target=run_as, args=(args.host, args.as_port, args.initial_wall_clock), daemon=True).start()
-    run_tgs(args.host, args.tgs_port, args.initial_wall_clock)
+    if args.store:
+        use_store(args.store)  # opened lazily, so forked workers each get their own connection
+    if args.workers > 0:
+        supervise(args)
+    else:
+        serve(args)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,104 @@
+import argparse
+import signal
+import socket
+import threading
+from utils.balancer import Balancer
+from utils.crypto import recv_raw_frame, send_raw_frame, set_max_frame, _parse_body, send_json, log
+from utils.mux import PONG
+
+# Small TCP load balancer for KDC replicas (usually TGS replicas started with --role tgs):
+#   python lb.py --port 6001 --backend 127.0.0.1:6101 --backend 127.0.0.1:6102
+# One-shot requests (no "rid") are read as a frame, forwarded to the replica with the fewest
+# requests in flight and the reply relayed back; if the replica fails before replying, the
+# same frame is retried on another one, so the client never notices. Keep-alive connections
+# are pinned to one replica and piped through as bytes. Replicas are health-checked with PING,
+# and the balancer answers PING itself while at least one replica is healthy.
+
+
+def _pipe(src: socket.socket, dst: socket.socket):
+    try:
+        while True:
+            data = src.recv(65536)
+            if not data:
+                break
+            dst.sendall(data)
+    except OSError:
+        pass
+    finally:
+        try:
+            dst.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+
+def handle(conn: socket.socket, balancer: Balancer):
+    try:
+        hdr, body, wire_version = recv_raw_frame(conn)
+        req = _parse_body(body, wire_version)
+        if req.get("type") == "PING":
+            if balancer.healthy():
+                send_json(conn, PONG, wire_version)
+            return
+        if "rid" not in req:
+            def exchange(s):
+                send_raw_frame(s, hdr, body)
+                return recv_raw_frame(s)[:2]
+            send_raw_frame(conn, *balancer.call(exchange))
+            return
+
+        backend, upstream = balancer.connect()
+        error = None
+        try:
+            upstream.settimeout(None)
+            send_raw_frame(upstream, hdr, body)
+            back = threading.Thread(target=_pipe, args=(upstream, conn), daemon=True)
+            back.start()
+            _pipe(conn, upstream)
+            back.join()
+        except OSError as e:
+            error = e
+        finally:
+            upstream.close()
+            balancer.release(backend, error)
+    except Exception as e:
+        try:
+            send_json(conn, {"type": "ERR", "reason": str(e)})
+        except OSError:
+            pass
+    finally:
+        conn.close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Least-outstanding-requests TCP load balancer for KDC replicas")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=6001, help="Port clients connect to (e.g. the usual TGS port)")
+    ap.add_argument("--backend", action="append", required=True,
+                    help="host:port of a replica (repeat, or comma-separate)")
+    ap.add_argument("--check-interval", type=float, default=1.0, help="Seconds between health checks")
+    ap.add_argument("--timeout", type=float, default=5.0, help="Connect/reply timeout per replica, in seconds")
+    ap.add_argument("--backlog", type=int, default=128)
+    ap.add_argument("--max-frame", type=int, default=16 * 1024 * 1024,
+                    help="Largest request frame accepted, in bytes; a longer length header drops the connection")
+    args = ap.parse_args()
+    set_max_frame(args.max_frame)
+
+    balancer = Balancer(",".join(args.backend), args.check_interval, args.timeout).start()
+    srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    srv.bind((args.host, args.port))
+    srv.listen(args.backlog)
+    signal.signal(signal.SIGTERM, lambda signum, frame: srv.close())
+    log(f"[LB] Listening on {args.host}:{args.port} -> "
+        f"{', '.join(f'{b.host}:{b.port}' for b in balancer.backends)}")
+    while True:
+        try:
+            conn, _ = srv.accept()
+        except OSError:
+            break
+        threading.Thread(target=handle, args=(conn, balancer), daemon=True).start()
+    log(f"[LB] Stopped: {balancer.stats()}")
+
+
+if __name__ == "__main__":
+    main()
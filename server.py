@@ -1,61 +1,152 @@
 import socket
 import threading
+import hashlib
 import os
+import time
 from dotenv import load_dotenv
-from utils.crypto import encrypt_obj, decrypt_obj, send_json, recv_json, now_minutes, within_lifetime, log
+from utils.crypto import KeyHandle, encrypt_obj, decrypt_obj, now_minutes, within_lifetime, log, set_max_frame
+from utils.mux import serve_conn
+from utils.replay_cache import ReplayCache, ReplayCacheFull
+from utils.verified_tickets import VerifiedTicket, VerifiedTicketCache
+from utils.session import DEFAULT_WINDOW, serve_session, chunk_bytes
+from utils import metrics, eventlog, clock
+from utils.wire import WIRE_JSON, WIRE_BINARY
 
 load_dotenv()  # Load .env variables
 
-def handle_client(conn: socket.socket, addr, server_name: str, server_pass: str, initial_epoch: int):
-    try:
-        req = recv_json(conn)
-        if req.get("type") != "APP_REQ":
-            send_json(conn, {"type": "ERR", "reason": "bad type"})
-            return
+# Seen authenticators; replaced in main() once the window/persistence flags are known
+replay_cache = ReplayCache()
+# Tickets already decrypted with the server key; sized by --ticket-cache-size in main()
+ticket_cache = VerifiedTicketCache()
+# Session mode limits; set from --session-window / --upload-dir in main()
+session_window = DEFAULT_WINDOW
+upload_dir = None
 
-        
-        Ticketv = req["Ticketv"]
-        Authenticatorc = req["Authenticatorc"]
-        enc_msg = req["Message"]
-
-        # Decrypt service ticket with server's secret
+def handle_client(conn: socket.socket, addr, server_name: str, server_pass: str, initial_epoch: int):
+    # One request per connection, or many pipelined ones in keep-alive mode
+    serve_conn(conn, addr, process_app_req, server_name, server_pass, initial_epoch, exchange="AP")
+
+
+def process_app_req(req, addr, server_name: str, server_pass: str, initial_epoch: int,
+                    wire_version: int = WIRE_JSON):
+    t = metrics.timer("AP")
+    started = time.perf_counter()
+    if req.get("type") != "APP_REQ":
+        return {"type": "ERR", "reason": "bad type"}
+
+    Ticketv = req["Ticketv"]
+    Authenticatorc = req["Authenticatorc"]
+    enc_msg = req["Message"]
+
+    # Decrypt service ticket with server's secret, unless this exact ticket was seen before
+    nowm = now_minutes(initial_epoch)
+    digest = ticket_cache.digest(Ticketv)
+    ticket = ticket_cache.get(digest, nowm)
+    if ticket is None:
         ticket_data = decrypt_obj(Ticketv, server_pass)
-        Kc_v = ticket_data["Kc_v"]
-        client_id = ticket_data["IDc"]
-        ts_ticket = ticket_data["TS4"]
-        lifetime = ticket_data["Lifetime4"]
-
-        nowm = now_minutes(initial_epoch)
-        if not within_lifetime(ts_ticket, lifetime, nowm):
-            send_json(conn, {"type": "ERR", "reason": "service ticket expired"})
-            return
-
-        # Decrypt authenticator with session key
-        auth_data = decrypt_obj(Authenticatorc, Kc_v)
-        if auth_data.get("IDc") != client_id:
-            send_json(conn, {"type": "ERR", "reason": "client mismatch"})
-            return
-        if auth_data.get("ADc") != addr[0]:
-            send_json(conn, {"type": "ERR", "reason": "client IP mismatch"})
-            return
-
-        # Decrypt message
-        msgobj = decrypt_obj(enc_msg, Kc_v)
-        message = msgobj.get("msg", "")
-        log(f"[{server_name}] Received secure message from {client_id}: {message}")
-
-        # Respond encrypted with session key
-        resp = encrypt_obj({"ack": f"Hello {client_id}, message received by {server_name}.",
-                            "TS5+1": nowm + 1}, Kc_v)
-        send_json(conn, {"type": "APP_REP", "data": resp})
-
-    except Exception as e:
-        try:
-            send_json(conn, {"type": "ERR", "reason": str(e)})
-        except:
-            pass
+        ticket = VerifiedTicket(ticket_data["IDc"], KeyHandle(ticket_data["Kc_v"]),
+                                ticket_data["TS4"], ticket_data["Lifetime4"])
+        t.lap("decrypt")
+        if within_lifetime(ticket.ts, ticket.lifetime, nowm):
+            ticket_cache.put(digest, ticket, nowm)
+    if not within_lifetime(ticket.ts, ticket.lifetime, nowm):
+        return {"type": "ERR", "reason": "service ticket expired"}
+    Kc_v = ticket.Kc_v
+    client_id = ticket.client_id
+    ts_ticket = ticket.ts
+
+    # Decrypt authenticator with session key
+    auth_data = decrypt_obj(Authenticatorc, Kc_v)
+    t.lap("decrypt")
+    if auth_data.get("IDc") != client_id:
+        return {"type": "ERR", "reason": "client mismatch"}
+    if auth_data.get("ADc") != addr[0]:
+        return {"type": "ERR", "reason": "client IP mismatch"}
+    # Bounding TS5 by the ticket start keeps replays inside the cache's window
+    TS5 = auth_data.get("TS5")
+    if not isinstance(TS5, int) or TS5 > nowm or TS5 < ts_ticket:
+        return {"type": "ERR", "reason": "stale authenticator"}
+    try:
+        if not replay_cache.check_and_add(client_id, addr[0], TS5, auth_data, nowm):
+            return {"type": "ERR", "reason": "replayed authenticator"}
+    except ReplayCacheFull as e:
+        return {"type": "ERR", "reason": str(e)}
+    t.lap("validate")
+
+    # Decrypt message
+    msgobj = decrypt_obj(enc_msg, Kc_v)
+    t.lap("decrypt")
+    message = msgobj.get("msg", "")
+
+    # Respond encrypted with session key
+    resp = encrypt_obj({"ack": f"Hello {client_id}, message received by {server_name}.",
+                        "TS5+1": nowm + 1}, Kc_v, wire_version == WIRE_BINARY)
+    t.lap("encrypt")
+    eventlog.emit("AP", principal=client_id, result="OK", service=server_name, peer=addr[0], message=message,
+                  latency_ms=round((time.perf_counter() - started) * 1000, 3))
+    rep = {"type": "APP_REP", "data": resp}
+    if isinstance(req.get("Session"), dict):
+        # Keep the connection open for a framed message stream under Kc_v (utils/session.py)
+        window = max(1, min(int(req["Session"].get("window", DEFAULT_WINDOW)), session_window))
+        rep["session"] = {"window": window}
+        rep["_upgrade"] = lambda conn, wire_version: run_session(conn, addr, ticket, server_name,
+                                                                 initial_epoch, wire_version)
+    return rep
+
+
+# --- Session mode ---
+class SessionHandler:
+    """Answers session frames: messages get the usual ack; file chunks are hashed (and written
+    under --upload-dir if set) and the last chunk of a file is answered with its size and sha256."""
+
+    def __init__(self, client_id: str, server_name: str):
+        self.client_id = client_id
+        self.server_name = server_name
+        self.files = {}  # name -> [sha256, bytes so far, open file or None]
+
+    def __call__(self, body):
+        if "file" not in body:
+            return {"ack": f"Hello {self.client_id}, message received by {self.server_name}."}
+        name = os.path.basename(str(body["file"]))
+        if not name:
+            raise ValueError("bad file name")
+        state = self.files.get(name)
+        if state is None:
+            out = None
+            if upload_dir:
+                out = open(os.path.join(upload_dir, os.path.basename(f"{self.client_id}_{name}")), "wb")
+            state = self.files[name] = [hashlib.sha256(), 0, out]
+        if body.get("offset") != state[1]:
+            raise ValueError("file chunk out of order")
+        chunk = chunk_bytes(body["chunk"])
+        state[0].update(chunk)
+        state[1] += len(chunk)
+        if state[2] is not None:
+            state[2].write(chunk)
+        if not body.get("eof"):
+            return {"received": state[1]}
+        del self.files[name]
+        if state[2] is not None:
+            state[2].close()
+        return {"file": name, "bytes": state[1], "sha256": state[0].hexdigest()}
+
+    def close(self):
+        for _, _, out in self.files.values():
+            if out is not None:
+                out.close()
+        self.files.clear()
+
+
+def run_session(conn, addr, ticket: VerifiedTicket, server_name: str, initial_epoch: int, wire_version: int):
+    started = time.perf_counter()
+    handler = SessionHandler(ticket.client_id, server_name)
+    try:
+        counts = serve_session(conn, ticket.Kc_v, wire_version, handler, ticket.ts, ticket.lifetime, initial_epoch)
     finally:
-        conn.close()
+        handler.close()
+    eventlog.emit("AP", principal=ticket.client_id, result="SESSION", service=server_name, peer=addr[0],
+                  frames=counts["frames"], bytes=counts["bytes"],
+                  duration_ms=round((time.perf_counter() - started) * 1000, 3))
 
 
 def run_server(server_name: str, server_pass: str, port: int, initial_epoch: int, host: str = "127.0.0.1"):
@@ -76,7 +167,35 @@ def main():
     ap.add_argument("--server", required=True,
                     help="Server name (e.g., fileServer or mailServer)")
     ap.add_argument("--initial-wall-clock", type=int, required=False)
+    ap.add_argument("--clock", default=os.getenv("KERBEROS_CLOCK", "wall"),
+                    help="Time source: wall, virtual[:RATE], file[:PATH] (shared, see time_synchronize.py) "
+                         "or control:PORT")
+    ap.add_argument("--replay-window", type=int, default=10,
+                    help="Minutes to remember authenticators (>= the longest service ticket lifetime)")
+    ap.add_argument("--replay-file", default=None,
+                    help="mmap file holding the replay cache, shared by processes serving the same name on "
+                         "this host, and kept across restarts")
+    ap.add_argument("--replay-max-entries", type=int, default=1 << 20,
+                    help="Authenticators the replay cache holds; new ones are refused once it is full")
+    ap.add_argument("--ticket-cache-size", type=int, default=65536,
+                    help="Decrypted service tickets to keep for repeat requests (0 disables)")
+    ap.add_argument("--session-window", type=int, default=DEFAULT_WINDOW,
+                    help="Most unacknowledged frames a session client may have in flight")
+    ap.add_argument("--upload-dir", default=None,
+                    help="Write files streamed over sessions here (default: only hash and count them)")
+    ap.add_argument("--max-frame", type=int, default=16 * 1024 * 1024,
+                    help="Largest request frame accepted, in bytes; a longer length header drops the connection")
+    ap.add_argument("--metrics-port", type=int, default=0,
+                    help="Serve /metrics and /profile/start|stop on this local port")
+    ap.add_argument("--event-log", default="-", help="Request event log file ('-' = stdout)")
+    ap.add_argument("--event-log-max-bytes", type=int, default=10 * 1024 * 1024,
+                    help="Rotate the event log file at this size (keeps 3 old files)")
+    ap.add_argument("--event-sample", default="", help="Fraction of successful requests logged, e.g. AP=0.1")
     args = ap.parse_args()
+    set_max_frame(args.max_frame)
+    clock.use(args.clock)
+    if args.clock != "wall":
+        log(f"[{args.server}] Clock: {clock.get().state()}")
 
     if args.initial_wall_clock is None:
         try:
@@ -95,6 +214,22 @@ def main():
     if not server_pass or not port:
         raise SystemExit(f"Server password or port not defined for {server_name} in .env")
 
+    global replay_cache, ticket_cache, session_window, upload_dir
+    replay_cache = ReplayCache(window=args.replay_window, path=args.replay_file,
+                               max_entries=args.replay_max_entries, initial_epoch=args.initial_wall_clock)
+    ticket_cache = VerifiedTicketCache(args.ticket_cache_size)
+    session_window = args.session_window
+    upload_dir = args.upload_dir
+    if upload_dir:
+        os.makedirs(upload_dir, exist_ok=True)
+    events = eventlog.configure(path=args.event_log, max_bytes=args.event_log_max_bytes,
+                                sample=eventlog.parse_sample(args.event_sample))
+    if args.metrics_port:
+        metrics.gauge("kerberos_events_dropped", lambda: events.dropped)
+        metrics.gauge("kerberos_ticket_cache_hits", lambda: ticket_cache.hits)
+        metrics.gauge("kerberos_ticket_cache_misses", lambda: ticket_cache.misses)
+        metrics.start_http_server(args.metrics_port)
+        log(f"[{server_name}] Metrics on http://127.0.0.1:{args.metrics_port}/metrics")
     run_server(server_name, server_pass, port, args.initial_wall_clock)
 
 
@@ -1,14 +1,24 @@
-from utils.kerberos_db import add_client, add_server, add_tgs
+from utils.kerberos_db import bulk_import, ensure_indexes
+
+# Unique indexes on name/idtgs; upserts below keep re-running this script safe
+ensure_indexes()
 
 # Add clients
-add_client("Karthikeya_Mittapalli", "22csb0c14_kincorrect")
-add_client("Sai_Kartik", "22csb0a05_sk2202")
+bulk_import("client", [
+    {"name": "Karthikeya_Mittapalli", "password": "22csb0c14_kincorrect"},
+    {"name": "Sai_Kartik", "password": "22csb0a05_sk2202"},
+])
 
 # Add servers
-add_server("ftpServer", "fileserverkey", 7002)
-add_server("mailServer", "mailserverkey", 7001)
+bulk_import("server", [
+    {"name": "ftpServer", "password": "fileserverkey", "port": 7002},
+    {"name": "mailServer", "password": "mailserverkey", "port": 7001},
+])
 
 # Add TGS
-add_tgs("tgs1", "22csb0c14_22csb0a05_kerberos_v4_tgs", lifetime_tgt=10, lifetime_st=5)
+bulk_import("tgs", [
+    {"idtgs": "tgs1", "ktgs": "22csb0c14_22csb0a05_kerberos_v4_tgs",
+     "default_lifetime_tgt": 10, "default_lifetime_st": 5},
+])
 
 print("Database initialized.")
@@ -0,0 +1,33 @@
+import argparse
+import os
+import time
+from utils.principal_store import KINDS, open_store, write_snapshot
+
+# Writes a read-only principal snapshot for edge KDC replicas:
+#   python snapshot_db.py principals.snap --store mongodb://localhost:27017/
+#   python kdc.py --store snapshot:principals.snap --principal-watch poll
+# TGS replicas only need the TGS and service keys:
+#   python snapshot_db.py tgs-keys.snap --kinds tgs,server
+#   python kdc.py --role tgs --tgs-port 6101 --store snapshot:tgs-keys.snap --warmup
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Dump every principal into an mmap snapshot file")
+    ap.add_argument("out", help="Snapshot file to write (replaced atomically)")
+    ap.add_argument("--store", default=None, help="Source store URL (default $KERBEROS_STORE or local Mongo)")
+    ap.add_argument("--kinds", default=",".join(KINDS),
+                    help="Comma-separated principal kinds to include (default: all)")
+    args = ap.parse_args()
+    kinds = [k.strip() for k in args.kinds.split(",") if k.strip()]
+    unknown = set(kinds) - set(KINDS)
+    if unknown:
+        ap.error(f"unknown kinds: {', '.join(sorted(unknown))}")
+
+    source = open_store(args.store or os.getenv("KERBEROS_STORE"))
+    t0 = time.perf_counter()
+    counts = write_snapshot(args.out, source, kinds)
+    print(f"[SNAPSHOT] {counts} written to {args.out} in {time.perf_counter() - t0:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,75 @@
+import argparse
+import os
 import time
+from utils.clock import (DEFAULT_CLOCK_FILE, read_clock_file, write_clock_file, control, parse_duration)
 
-epoch = int(time.time())
-print(f"Initial wall clock epoch: {epoch}")
+# Without options: writes the shared initial epoch to epoch.txt, as before.
+# With --clock-file: also starts a shared virtual clock there (processes run with --clock file:PATH),
+# or, if it already exists and --advance/--rate/--set-minutes are given, steers it without touching epoch.txt.
+# With --control PORT: steers a process started with --clock control:PORT instead.
 
-with open("epoch.txt", "w") as f:
-    f.write(str(epoch))
+
+def main():
+    ap = argparse.ArgumentParser(description="Write epoch.txt and start or steer a virtual clock")
+    ap.add_argument("--clock-file", nargs="?", const=DEFAULT_CLOCK_FILE, default=None,
+                    help=f"Shared virtual clock file (default {DEFAULT_CLOCK_FILE})")
+    ap.add_argument("--control", default=None, help="[host:]port of a process running --clock control:PORT")
+    ap.add_argument("--advance", type=parse_duration, default=None,
+                    help="Move virtual time forward, e.g. 600, 10m, 2h")
+    ap.add_argument("--set-minutes", type=float, default=None,
+                    help="Set virtual time to this many Kerberos minutes after the epoch in epoch.txt")
+    ap.add_argument("--rate", type=float, default=None, help="Virtual seconds per real second from now on")
+    args = ap.parse_args()
+    steering = args.advance is not None or args.rate is not None or args.set_minutes is not None
+
+    if args.control:
+        host, _, port = args.control.rpartition(":")
+        host = host or "127.0.0.1"
+        state = control(int(port), host)
+        if args.set_minutes is not None:
+            state = control(int(port), host, op="set", now=_epoch() + args.set_minutes * 60)
+        if args.advance is not None:
+            state = control(int(port), host, op="advance", seconds=args.advance)
+        if args.rate is not None:
+            state = control(int(port), host, op="rate", rate=args.rate)
+        _show(state["now"], state["rate"])
+        return
+
+    if args.clock_file and steering and os.path.exists(args.clock_file):
+        base, wall, rate = read_clock_file(args.clock_file)
+        now = base + (time.time() - wall) * rate
+        if args.set_minutes is not None:
+            now = _epoch() + args.set_minutes * 60
+        now += args.advance or 0
+        rate = rate if args.rate is None else args.rate
+        write_clock_file(args.clock_file, now, rate)
+        _show(now, rate)
+        return
+
+    epoch = int(time.time())
+    print(f"Initial wall clock epoch: {epoch}")
+
+    with open("epoch.txt", "w") as f:
+        f.write(str(epoch))
+
+    if args.clock_file:
+        now = epoch + (args.set_minutes or 0) * 60 + (args.advance or 0)
+        write_clock_file(args.clock_file, now, 1.0 if args.rate is None else args.rate)
+        print(f"Virtual clock in {args.clock_file}; start processes with --clock file:{args.clock_file}")
+
+
+def _epoch() -> int:
+    with open("epoch.txt") as f:
+        return int(f.read().strip())
+
+
+def _show(now: float, rate: float):
+    try:
+        minutes = f", Kerberos minute {int((now - _epoch()) // 60)}"
+    except (OSError, ValueError):
+        minutes = ""
+    print(f"Virtual time {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now))}{minutes}, rate {rate:g}")
+
+
+if __name__ == "__main__":
+    main()
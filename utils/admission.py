@@ -0,0 +1,131 @@
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Union
+from utils.crypto import ciphertext_of
+
+# Admission control for the KDC, checked before any DB lookup or decryption:
+#   - a global limit on requests being processed at once (overload shedding)
+#   - a token bucket per source address
+#   - a token bucket per principal: the client name for AS_REQ; for TGS_REQ the presented
+#     TGT, since the client name inside it is only known after decrypting it
+# A rejected request gets {"type": "ERR", "reason": ..., "retry_after_ms": milliseconds} straight
+# away; an integer, so it packs in the binary wire format (which has no float type) as well.
+# A rate or limit of 0 turns that check off.
+
+OVERLOAD_RETRY_AFTER = 0.1  # seconds suggested to clients shed for overload
+
+
+def ticket_key(ticket: Union[str, bytes]) -> bytes:
+    """Bucket key for a TGT: its ciphertext, so base64 or raw bytes count as the same ticket.
+    Tickets that aren't canonical base64 (which the TGS refuses anyway) all share one bucket."""
+    try:
+        ct = ciphertext_of(ticket)
+    except ValueError:
+        return b"malformed"
+    return hashlib.blake2b(ct, digest_size=16).digest()
+
+
+class _Shard:
+    __slots__ = ("lock", "buckets")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()  # key -> [tokens, last refill (monotonic seconds)]
+
+
+class TokenBuckets:
+    """One token bucket per key: `rate` tokens/s up to `burst`. The least recently used keys
+    beyond max_keys are forgotten (they start over with a full bucket)."""
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 100000, shards: int = 16):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._shards = [_Shard() for _ in range(shards)]
+        self.per_shard = max(1, max_keys // shards)
+
+    def take(self, key, now: float = None) -> float:
+        """Spend a token for key: 0.0 if there was one, else seconds until there will be."""
+        now = time.monotonic() if now is None else now
+        shard = self._shards[hash(key) % len(self._shards)]
+        with shard.lock:
+            bucket = shard.buckets.get(key)
+            if bucket is None:
+                bucket = shard.buckets[key] = [self.burst, now]
+                if len(shard.buckets) > self.per_shard:
+                    shard.buckets.popitem(last=False)
+            else:
+                shard.buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1.0:
+                bucket[0] -= 1.0
+                return 0.0
+            return (1.0 - bucket[0]) / self.rate
+
+
+class Admission:
+    def __init__(self, principal_rate: float = 0, principal_burst: float = 0, source_rate: float = 0,
+                 source_burst: float = 0, max_concurrent: int = 0):
+        self.principals = TokenBuckets(principal_rate, principal_burst or principal_rate) if principal_rate > 0 else None
+        self.sources = TokenBuckets(source_rate, source_burst or source_rate) if source_rate > 0 else None
+        self.max_concurrent = max_concurrent
+        self.inflight = 0
+        self.rejected = {"overloaded": 0, "source rate limited": 0, "principal rate limited": 0}
+        self._lock = threading.Lock()
+
+    def _reject(self, reason: str, retry_after: float) -> Dict[str, Any]:
+        with self._lock:
+            self.rejected[reason] += 1
+        return {"type": "ERR", "reason": reason, "retry_after_ms": max(1, math.ceil(retry_after * 1000))}
+
+    def admit(self, principal, source: Optional[str]) -> Optional[Dict[str, Any]]:
+        """None if the request may proceed (call release() when done), else the ERR reply."""
+        # The buckets come first: nothing is held yet if one of them refuses (or raises)
+        wait = self.sources.take(source) if self.sources is not None and source is not None else 0.0
+        reason = "source rate limited"
+        if not wait and self.principals is not None and principal is not None:
+            wait = self.principals.take(principal)
+            reason = "principal rate limited"
+        if wait:
+            return self._reject(reason, wait)
+        with self._lock:
+            if self.max_concurrent and self.inflight >= self.max_concurrent:
+                overloaded = True
+            else:
+                overloaded = False
+                self.inflight += 1
+        if overloaded:
+            return self._reject("overloaded", OVERLOAD_RETRY_AFTER)
+        return None
+
+    def shed(self) -> Dict[str, Any]:
+        """The ERR overloaded reply for a request refused before admit() could see it (the
+        threaded KDC out of connection slots), counted with the other overload rejections."""
+        return self._reject("overloaded", OVERLOAD_RETRY_AFTER)
+
+    def admit_items(self, keys):
+        """For a request carrying many principals (a TGS batch), after admit(): one principal
+        token per item from its key's bucket (None: not limited). Returns the indexes of items
+        over their limit, and the ERR reply for the whole request if that is all of them."""
+        if self.principals is None or not keys:
+            return set(), None
+        waits = [self.principals.take(key) if key is not None else 0.0 for key in keys]
+        over = {i for i, wait in enumerate(waits) if wait}
+        if len(over) == len(keys):
+            return over, self._reject("principal rate limited", min(waits))
+        if over:
+            with self._lock:
+                self.rejected["principal rate limited"] += len(over)
+        return over, None
+
+    def release(self):
+        with self._lock:
+            self.inflight -= 1
+
+    def stats(self):
+        with self._lock:
+            return {"inflight": self.inflight, **{f"rejected_{k.replace(' ', '_')}": v
+                                                  for k, v in self.rejected.items()}}
@@ -0,0 +1,155 @@
+import itertools
+import socket
+import threading
+from typing import Any, Callable, Dict, List, Tuple, Union
+from utils.crypto import send_json, recv_json
+from utils.wire import WIRE_JSON
+
+# Spreads one-shot requests over equivalent replicas (e.g. TGS replicas serving the same key
+# snapshot). Each request goes to the healthy backend with the fewest requests outstanding
+# from this process, ties rotating. A backend whose connect or exchange fails is marked down
+# and the request is retried on another, so callers only see an error once every backend has
+# failed it. A background thread PINGs every backend each check_interval to take dead ones
+# out before a request trips over them and to bring recovered ones back.
+
+
+def parse_endpoints(spec: Union[str, List]) -> List[Tuple[str, int]]:
+    """Accepts "host:port,host:port", or a list of such strings or (host, port) pairs."""
+    items = spec.split(",") if isinstance(spec, str) else spec
+    endpoints = []
+    for item in items:
+        if isinstance(item, str):
+            host, _, port = item.strip().rpartition(":")
+            item = (host or "127.0.0.1", int(port))
+        endpoints.append((item[0], int(item[1])))
+    return endpoints
+
+
+class Backend:
+    __slots__ = ("host", "port", "outstanding", "healthy", "failures", "served", "last_error")
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0      # requests that failed here and were retried elsewhere
+        self.served = 0
+        self.last_error = None
+
+
+class Balancer:
+    """Least-outstanding-requests routing with failover and health checks."""
+
+    def __init__(self, endpoints, check_interval: float = 1.0, timeout: float = 5.0):
+        self.backends = [Backend(h, p) for h, p in parse_endpoints(endpoints)]
+        if not self.backends:
+            raise ValueError("no backends given")
+        self.check_interval = check_interval
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._rr = itertools.count()
+        self._stop = threading.Event()
+        self._checker = None
+
+    # ---------- Routing ----------
+    def _acquire(self, tried) -> Backend:
+        with self._lock:
+            candidates = [b for b in self.backends if b.healthy and b not in tried]
+            if not candidates:
+                # Everything is marked down: still try the rest, one may have just come back
+                candidates = [b for b in self.backends if b not in tried]
+            if not candidates:
+                return None
+            least = min(b.outstanding for b in candidates)
+            candidates = [b for b in candidates if b.outstanding == least]
+            backend = candidates[next(self._rr) % len(candidates)]
+            backend.outstanding += 1
+            return backend
+
+    def _release(self, backend: Backend, error: Exception = None):
+        with self._lock:
+            backend.outstanding -= 1
+            if error is None:
+                backend.served += 1
+                return
+            backend.healthy = False
+            backend.failures += 1
+            backend.last_error = repr(error)
+
+    def call(self, exchange: Callable[[socket.socket], Any]):
+        """Run exchange(sock) on a fresh connection to a backend, failing over on socket errors."""
+        tried = []
+        while True:
+            backend = self._acquire(tried)
+            if backend is None:
+                errors = "; ".join(f"{b.host}:{b.port}: {b.last_error}" for b in tried)
+                raise ConnectionError(f"all backends failed ({errors})")
+            tried.append(backend)
+            try:
+                with socket.create_connection((backend.host, backend.port), timeout=self.timeout) as s:
+                    result = exchange(s)
+            except (OSError, ValueError) as e:  # ConnectionError and timeouts are OSErrors
+                self._release(backend, e)
+                continue
+            self._release(backend)
+            return result
+
+    def request(self, req: Dict[str, Any], wire_version: int = WIRE_JSON) -> Dict[str, Any]:
+        def exchange(s):
+            send_json(s, req, wire_version)
+            return recv_json(s)
+        return self.call(exchange)
+
+    def connect(self) -> Tuple[Backend, socket.socket]:
+        """A connection pinned to one backend (for keep-alive traffic); release() it when done."""
+        tried = []
+        while True:
+            backend = self._acquire(tried)
+            if backend is None:
+                raise ConnectionError("no backend accepted the connection")
+            tried.append(backend)
+            try:
+                return backend, socket.create_connection((backend.host, backend.port), timeout=self.timeout)
+            except OSError as e:
+                self._release(backend, e)
+
+    def release(self, backend: Backend, error: Exception = None):
+        self._release(backend, error)
+
+    # ---------- Health checks ----------
+    def check(self, backend: Backend) -> bool:
+        try:
+            with socket.create_connection((backend.host, backend.port), timeout=self.timeout) as s:
+                send_json(s, {"type": "PING"})
+                ok = recv_json(s).get("type") == "PONG"
+        except (OSError, ValueError) as e:
+            backend.last_error = repr(e)
+            ok = False
+        with self._lock:
+            backend.healthy = ok
+        return ok
+
+    def start(self):
+        if self._checker is None:
+            self._checker = threading.Thread(target=self._run_checks, daemon=True)
+            self._checker.start()
+        return self
+
+    def _run_checks(self):
+        while not self._stop.wait(self.check_interval):
+            for backend in self.backends:
+                self.check(backend)
+
+    def healthy(self) -> bool:
+        return any(b.healthy for b in self.backends)
+
+    def stats(self):
+        with self._lock:
+            return [{"backend": f"{b.host}:{b.port}", "healthy": b.healthy, "outstanding": b.outstanding,
+                     "served": b.served, "failures": b.failures} for b in self.backends]
+
+    def close(self):
+        self._stop.set()
+        if self._checker is not None:
+            self._checker.join()
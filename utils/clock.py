@@ -0,0 +1,197 @@
+import json
+import os
+import socket
+import threading
+import time
+
+# Where "now" comes from for Kerberos timestamps (crypto.now_minutes) and ticket-cache expiry.
+# Pick one with --clock on kdc.py/server.py/client.py (or KERBEROS_CLOCK):
+#   wall            time.time(), the default
+#   virtual[:RATE]  in-process virtual time starting at the wall clock and running RATE times
+#                   as fast (default 1); code steps it with set()/advance(), e.g. a simulator
+#                   (RATE 0 stands still between steps)
+#   file[:PATH]     virtual time shared through a small JSON file (default clock.json) that
+#                   time_synchronize.py --clock-file writes and steers; every process on the
+#                   host computes the same time from it, so AS, TGS, servers and clients agree
+#   control:PORT    a virtual clock steered over a TCP control socket on 127.0.0.1:PORT
+#                   (time_synchronize.py --control PORT --advance 10m); one process only
+# Jumping a shared clock past TS + Lifetime makes every process see the ticket expire at
+# once, so lifetime behaviour can be tested without waiting minutes of real time.
+
+DEFAULT_CLOCK_FILE = "clock.json"
+FILE_RECHECK = 0.1  # seconds between mtime checks of a clock file
+
+
+class WallClock:
+    def now(self) -> float:
+        return time.time()
+
+    def state(self):
+        return {"clock": "wall", "now": time.time(), "rate": 1.0}
+
+
+class VirtualClock:
+    """base virtual seconds at the anchor, then rate x the real seconds since."""
+
+    def __init__(self, start: float = None, rate: float = 1.0):
+        self._lock = threading.Lock()
+        self._state = (time.time() if start is None else start, time.monotonic(), rate)
+
+    def now(self) -> float:
+        base, anchor, rate = self._state  # one tuple, so readers never see half an update
+        return base + (time.monotonic() - anchor) * rate if rate else base
+
+    def set(self, t: float, rate: float = None):
+        with self._lock:
+            self._state = (t, time.monotonic(), self._state[2] if rate is None else rate)
+
+    def advance(self, seconds: float):
+        with self._lock:
+            self._state = (self.now() + seconds, time.monotonic(), self._state[2])
+
+    def set_rate(self, rate: float):
+        self.set(self.now(), rate)
+
+    def state(self):
+        return {"clock": "virtual", "now": self.now(), "rate": self._state[2]}
+
+
+def read_clock_file(path: str):
+    """(base, wall anchor, rate) from a clock file."""
+    with open(path) as f:
+        doc = json.load(f)
+    return float(doc["base"]), float(doc["wall"]), float(doc.get("rate", 1.0))
+
+
+def write_clock_file(path: str, base: float, rate: float = 1.0):
+    """Make virtual time `base` now, running at `rate`; replaced atomically so readers never see half a file."""
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump({"base": base, "wall": time.time(), "rate": rate}, f)
+    os.replace(tmp, path)
+
+
+class FileClock:
+    """Virtual time from a clock file: base + (time.time() - wall) * rate, re-read when it changes."""
+
+    def __init__(self, path: str = DEFAULT_CLOCK_FILE):
+        self.path = path
+        self._mtime = None
+        self._checked = 0.0
+        self._state = (time.time(), time.time(), 1.0)
+        self._reload()
+
+    def _reload(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime != self._mtime:
+            self._state = read_clock_file(self.path)
+            self._mtime = mtime
+
+    def now(self) -> float:
+        mono = time.monotonic()
+        if mono - self._checked >= FILE_RECHECK:
+            self._checked = mono
+            try:
+                self._reload()
+            except (OSError, ValueError, KeyError):
+                pass  # keep the last good reading while the file is being replaced
+        base, wall, rate = self._state
+        return base + (time.time() - wall) * rate
+
+    def state(self):
+        return {"clock": f"file:{self.path}", "now": self.now(), "rate": self._state[2]}
+
+
+class ControlClock(VirtualClock):
+    """A VirtualClock that also answers {"op": "now"|"set"|"advance"|"rate", ...} frames on a local port."""
+
+    def __init__(self, port: int, host: str = "127.0.0.1", start: float = None, rate: float = 1.0):
+        super().__init__(start, rate)
+        self.srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.srv.bind((host, port))
+        self.srv.listen(8)
+        self.address = self.srv.getsockname()
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        from utils.crypto import send_json, recv_json  # crypto imports this module
+        while True:
+            try:
+                conn, _ = self.srv.accept()
+            except OSError:
+                return
+            with conn:
+                try:
+                    req = recv_json(conn)
+                    op = req.get("op", "now")
+                    if op == "set":
+                        self.set(float(req["now"]), req.get("rate"))
+                    elif op == "advance":
+                        self.advance(float(req["seconds"]))
+                    elif op == "rate":
+                        self.set_rate(float(req["rate"]))
+                    elif op != "now":
+                        raise ValueError(f"unknown op {op!r}")
+                    send_json(conn, {"type": "CLOCK", **self.state()})
+                except Exception as e:
+                    try:
+                        send_json(conn, {"type": "ERR", "reason": str(e)})
+                    except OSError:
+                        pass
+
+    def state(self):
+        return {**super().state(), "clock": f"control:{self.address[1]}"}
+
+    def close(self):
+        self.srv.close()
+
+
+def control(port: int, host: str = "127.0.0.1", **op):
+    """Send one op to a ControlClock, e.g. control(7900, op="advance", seconds=600); returns its state."""
+    from utils.crypto import send_json, recv_json
+    with socket.create_connection((host, port), timeout=5.0) as s:
+        send_json(s, op or {"op": "now"})
+        rep = recv_json(s)
+    if rep.get("type") != "CLOCK":
+        raise RuntimeError(f"clock control error: {rep}")
+    return rep
+
+
+def parse_duration(text: str) -> float:
+    """'90' or '90s', '10m', '2h' -> seconds."""
+    text = str(text).strip()
+    scale = {"s": 1, "m": 60, "h": 3600}.get(text[-1:], None)
+    return float(text[:-1]) * scale if scale else float(text)
+
+
+def from_spec(spec: str):
+    kind, _, arg = (spec or "wall").partition(":")
+    if kind == "wall":
+        return WallClock()
+    if kind == "virtual":
+        return VirtualClock(rate=float(arg) if arg else 1.0)
+    if kind == "file":
+        return FileClock(arg or DEFAULT_CLOCK_FILE)
+    if kind == "control":
+        return ControlClock(int(arg))
+    raise ValueError(f"unknown clock {spec!r} (wall, virtual[:RATE], file[:PATH], control:PORT)")
+
+
+# ---------- Process-wide clock ----------
+_clock = WallClock()
+
+
+def now() -> float:
+    return _clock.now()
+
+
+def get():
+    return _clock
+
+
+def use(clock):
+    """Switch this process to a clock object or spec string; returns the clock."""
+    global _clock
+    _clock = from_spec(clock) if isinstance(clock, str) or clock is None else clock
+    return _clock
@@ -1,107 +1,299 @@
-
 from Crypto.Cipher import DES
-from typing import Dict, Any
+from collections import OrderedDict
+from typing import Dict, Any, Union
 import hashlib
 import json
 import base64
+import os
 import socket
 import struct
-import time
+import threading
+from utils import wire, clock
+from utils.wire import WIRE_JSON, WIRE_BINARY
 
 def _des_key_from_password(password: str) -> bytes:
     # Derive a valid 8-byte DES key from password
     return hashlib.md5(password.encode()).digest()[:8]
 
-def encrypt_obj(obj: Dict[str, Any], key: str) -> str:
-    data = json.dumps(obj, separators=(',', ':')).encode('utf-8')
-    des_key = _des_key_from_password(key)
 
-    cipher = DES.new(des_key, DES.MODE_ECB)
+# ---------- Key schedules ----------
+class KeyHandle:
+    """A DES key derived once, with its cipher object, for reuse across requests."""
+    __slots__ = ("_key", "cipher")
+
+    def __init__(self, password: str):
+        self._key = bytearray(_des_key_from_password(password))
+        self.cipher = DES.new(self._key, DES.MODE_ECB)
+
+    def zeroize(self):
+        """Overwrite the derived key and drop the cipher (callers already holding it keep working).
+
+        pycryptodome's cipher object keeps its own copy of the key schedule, which lives until
+        the last reference to the cipher is gone; this only clears the copy the handle holds."""
+        for i in range(len(self._key)):
+            self._key[i] = 0
+        self.cipher = None
+
+
+# Bounded LRU of KeyHandles keyed by a per-process salted BLAKE2b of the password. Not the MD5
+# digest: its first 8 bytes are the DES key itself, so keying on it would keep the raw key in the dict.
+_key_cache = OrderedDict()
+_key_cache_salt = os.urandom(16)
+_key_cache_lock = threading.Lock()
+_key_cache_size = 256
+
+def set_key_cache_size(size: int) -> None:
+    """Resize the key schedule cache; 0 disables it (derive + DES.new on every call)."""
+    global _key_cache_size
+    with _key_cache_lock:
+        _key_cache_size = size
+        _evict_keys()
+
+def _evict_keys():
+    while len(_key_cache) > _key_cache_size:
+        _, handle = _key_cache.popitem(last=False)
+        handle.zeroize()
+
+def _cipher_for(key: Union[str, KeyHandle]):
+    if isinstance(key, KeyHandle):
+        return key.cipher
+    digest = hashlib.blake2b(key.encode(), digest_size=16, salt=_key_cache_salt).digest()
+    with _key_cache_lock:
+        handle = _key_cache.get(digest)
+        if handle is not None:
+            _key_cache.move_to_end(digest)
+            return handle.cipher
+    handle = KeyHandle(key)
+    cipher = handle.cipher
+    with _key_cache_lock:
+        if _key_cache_size > 0:
+            _key_cache[digest] = handle
+            _evict_keys()
+    return cipher
+
+def preload_key(key: str) -> None:
+    """Derive and cache key's schedule now rather than on its first request."""
+    _cipher_for(key)
+
+
+def encrypt_obj(obj: Dict[str, Any], key: Union[str, KeyHandle], binary: bool = False) -> Union[str, bytes]:
+    """Encrypt obj under key: base64 of encrypted JSON, or raw ciphertext of the packed object if binary."""
+    if binary:
+        data = wire.pack(obj)
+    else:
+        data = json.dumps(obj, separators=(',', ':')).encode('utf-8')
+    cipher = _cipher_for(key)
 
     # Pad to 8 bytes (PKCS#7)
     pad_len = 8 - (len(data) % 8)
     data += bytes([pad_len]) * pad_len
 
     ct = cipher.encrypt(data)
+    if binary:
+        return ct
     return base64.b64encode(ct).decode('ascii')
 
-def decrypt_obj(token: str, key: str) -> Dict[str, Any]:
-    ct = base64.b64decode(token)
-    des_key = _des_key_from_password(key)
+def ciphertext_of(token: Union[str, bytes]) -> bytes:
+    """Raw bytes came from a binary frame; a str must be the canonical base64 of the ciphertext.
+
+    b64decode alone skips characters outside the alphabet and ignores stray padding bits, so
+    many strings would decode to one ciphertext; anything but the one b64encode gives is refused.
+    """
+    if isinstance(token, (bytes, bytearray)):
+        return token
+    ct = base64.b64decode(token, validate=True)
+    if base64.b64encode(ct) != token.encode('ascii'):
+        raise ValueError("non-canonical base64 ciphertext")
+    return ct
 
-    cipher = DES.new(des_key, DES.MODE_ECB)
+def decrypt_obj(token: Union[str, bytes], key: Union[str, KeyHandle]) -> Dict[str, Any]:
+    ct = ciphertext_of(token)
+    cipher = _cipher_for(key)
     pt = cipher.decrypt(ct)
 
     # Unpad
     pad_len = pt[-1]
     pt = pt[:-pad_len]
 
-    return json.loads(pt.decode('utf-8'))
+    # JSON plaintext always starts with '{'; anything else is the packed encoding
+    if pt[:1] == b'{':
+        return json.loads(pt.decode('utf-8'))
+    return wire.unpack(pt)
 
 
-# ---------- Framed JSON over TCP ----------
-def send_json(sock: socket.socket, obj: Dict[str, Any]) -> None:
-    data = json.dumps(obj).encode('utf-8')
-    hdr = struct.pack('!I', len(data))
-    sock.sendall(hdr + data)
+# ---------- Many objects under one key ----------
+# ECB encrypts each 8-byte block independently, so padded plaintexts laid end to end in one
+# buffer encrypt (or decrypt) in a single cipher call to exactly the per-object ciphertexts.
 
-def recv_json(sock: socket.socket) -> Dict[str, Any]:
-    hdr = _recvall(sock, 4)
-    if not hdr:
-        raise ConnectionError("Connection closed")
-    (n,) = struct.unpack('!I', hdr)
-    data = _recvall(sock, n)
-    return json.loads(data.decode('utf-8'))
-
-def _recvall(sock: socket.socket, n: int) -> bytes:
+def encrypt_many(objs, key: Union[str, KeyHandle], binary: bool = False) -> list:
+    """encrypt_obj for every object in objs, with one cipher call over a single buffer."""
     buf = bytearray()
-    while len(buf) < n:
-        chunk = sock.recv(n - len(buf))
-        if not chunk:
-            raise ConnectionError("Connection closed during recv")
-        buf.extend(chunk)
-    return bytes(buf)
+    bounds = []
+    for obj in objs:
+        data = wire.pack(obj) if binary else json.dumps(obj, separators=(',', ':')).encode('utf-8')
+        start = len(buf)
+        buf += data
+        pad_len = 8 - (len(data) % 8)
+        buf += bytes([pad_len]) * pad_len
+        bounds.append((start, len(buf)))
+    ct = memoryview(_cipher_for(key).encrypt(buf))
+    if binary:
+        return [bytes(ct[a:b]) for a, b in bounds]
+    return [base64.b64encode(ct[a:b]).decode('ascii') for a, b in bounds]
 
-# ---------- Time helpers ----------
-def now_minutes(initial_epoch: int) -> int:
-    """Return current timestamp in minutes since the shared initial_wall_clock epoch."""
-    return int((time.time() - initial_epoch) // 60)
+def decrypt_many(tokens, key: Union[str, KeyHandle]) -> list:
+    """decrypt_obj for every token in tokens under one key; a token that fails yields its exception."""
+    out = [None] * len(tokens)
+    buf = bytearray()
+    bounds = []
+    for i, token in enumerate(tokens):
+        try:
+            ct = ciphertext_of(token)
+            if not ct or len(ct) % 8:
+                raise ValueError("ciphertext is not a whole number of blocks")
+        except Exception as e:
+            out[i] = e
+            continue
+        bounds.append((i, len(buf), len(buf) + len(ct)))
+        buf += ct
+    pt = memoryview(_cipher_for(key).decrypt(buf)) if buf else None
+    for i, a, b in bounds:
+        try:
+            data = pt[a:b]
+            data = bytes(data[:len(data) - data[-1]])
+            out[i] = json.loads(data.decode('utf-8')) if data[:1] == b'{' else wire.unpack(data)
+        except Exception as e:
+            out[i] = e
+    return out
 
-def within_lifetime(start_ts: int, lifetime_min: int, now_min: int) -> bool:
-    return now_min >= start_ts and now_min <= start_ts + lifetime_min
 
-# ---------- Convenience ----------
-def log(*args):
-    print(*args, flush=True)
+# ---------- Framed JSON over TCP ----------
+# Header: 4-byte big-endian length for JSON frames (unchanged). Binary frames set the top
+# bit of the first byte: [0x80 | version][3-byte length], so old peers never see them
+# unless they send one first; replies use the wire version of the request.
+# Frames go out in one sendmsg: JSON as header + body without concatenating them, binary
+# packed straight into one buffer behind its reserved header. They come in with recv_into
+# straight into a buffer allocated once at the body's final size, which is parsed in place.
+# The length in a header is checked against the frame limit before anything is allocated,
+# so a bogus header can't make us reserve (and wait for) gigabytes.
+MAX_BINARY_FRAME = (1 << 24) - 1
+_max_frame = 16 * 1024 * 1024
+_HAVE_SENDMSG = hasattr(socket.socket, "sendmsg")  # not on Windows
 
+def set_max_frame(size: int) -> None:
+    """Largest frame body, in bytes, accepted from a peer; a longer one raises ValueError."""
+    global _max_frame
+    _max_frame = size
 
-# ---------- Framed JSON over TCP ----------
-def send_json(sock: socket.socket, obj: Dict[str, Any]) -> None:
-    data = json.dumps(obj).encode('utf-8')
-    hdr = struct.pack('!I', len(data))
-    sock.sendall(hdr + data)
+def _json_default(o):
+    # Raw ciphertext (e.g. a ticket issued over a binary frame) goes back to base64 in JSON
+    if isinstance(o, (bytes, bytearray)):
+        return base64.b64encode(o).decode('ascii')
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+def _frame_parts(obj: Dict[str, Any], wire_version: int = WIRE_JSON) -> tuple:
+    """obj's frame as buffers to send back to back."""
+    if wire_version == WIRE_JSON:
+        data = json.dumps(obj, default=_json_default).encode('utf-8')
+        return struct.pack('!I', len(data)), data
+    out = bytearray(4)
+    wire.pack_into(out, obj)
+    n = len(out) - 4
+    if n > MAX_BINARY_FRAME:
+        raise ValueError("frame too large for binary encoding")
+    out[0] = 0x80 | wire_version
+    out[1:4] = n.to_bytes(3, 'big')
+    return (out,)
+
+def _frame(obj: Dict[str, Any], wire_version: int = WIRE_JSON) -> bytes:
+    return b''.join(_frame_parts(obj, wire_version))
+
+def _parse_header(hdr: bytes):
+    if hdr[0] & 0x80:
+        wire_version, n = hdr[0] & 0x7F, int.from_bytes(hdr[1:4], 'big')
+    else:
+        wire_version, n = WIRE_JSON, struct.unpack('!I', hdr)[0]
+    if n > _max_frame:
+        raise ValueError(f"frame of {n} bytes exceeds the {_max_frame}-byte limit")
+    return wire_version, n
+
+def _parse_body(data, wire_version: int) -> Dict[str, Any]:
+    if wire_version == WIRE_JSON:
+        return json.loads(data.decode('utf-8'))
+    if wire_version == WIRE_BINARY:
+        return wire.unpack(data)
+    raise ValueError(f"unsupported wire version {wire_version}")
+
+def send_raw_frame(sock: socket.socket, *parts) -> None:
+    """Send a frame given as consecutive buffers (e.g. header, body) with one gathered write."""
+    if not _HAVE_SENDMSG:
+        sock.sendall(b''.join(parts))
+        return
+    sent = sock.sendmsg(parts)
+    for part in parts:  # after a partial write, the rest goes from views into the parts
+        if sent >= len(part):
+            sent -= len(part)
+            continue
+        sock.sendall(memoryview(part)[sent:])
+        sent = 0
+
+def send_json(sock: socket.socket, obj: Dict[str, Any], wire_version: int = WIRE_JSON) -> None:
+    send_raw_frame(sock, *_frame_parts(obj, wire_version))
+
+def recv_raw_frame(sock: socket.socket):
+    """Receive one frame without decoding it; returns (header, body, wire_version)."""
+    hdr = bytearray(4)
+    _recv_into(sock, hdr)
+    wire_version, n = _parse_header(hdr)
+    body = bytearray(n)
+    _recv_into(sock, body)
+    return hdr, body, wire_version
+
+def recv_frame(sock: socket.socket):
+    """Receive one frame in either encoding; returns (obj, wire_version)."""
+    _, data, wire_version = recv_raw_frame(sock)
+    return _parse_body(data, wire_version), wire_version
 
 def recv_json(sock: socket.socket) -> Dict[str, Any]:
-    hdr = _recvall(sock, 4)
-    if not hdr:
-        raise ConnectionError("Connection closed")
-    (n,) = struct.unpack('!I', hdr)
-    data = _recvall(sock, n)
-    return json.loads(data.decode('utf-8'))
-
-def _recvall(sock: socket.socket, n: int) -> bytes:
-    buf = bytearray()
-    while len(buf) < n:
-        chunk = sock.recv(n - len(buf))
-        if not chunk:
-            raise ConnectionError("Connection closed during recv")
-        buf.extend(chunk)
-    return bytes(buf)
+    return recv_frame(sock)[0]
+
+# Same framing for asyncio streams (used by the KDC's asyncio engine)
+async def send_json_async(writer, obj: Dict[str, Any], wire_version: int = WIRE_JSON) -> None:
+    writer.writelines(_frame_parts(obj, wire_version))
+    await writer.drain()
+
+async def recv_raw_frame_async(reader):
+    """Receive one frame without decoding it; returns (body, wire_version)."""
+    try:
+        hdr = await reader.readexactly(4)
+        wire_version, n = _parse_header(hdr)
+        return await reader.readexactly(n), wire_version
+    except EOFError:  # asyncio.IncompleteReadError
+        raise ConnectionError("Connection closed during recv")
+
+async def recv_frame_async(reader):
+    data, wire_version = await recv_raw_frame_async(reader)
+    return _parse_body(data, wire_version), wire_version
+
+async def recv_json_async(reader) -> Dict[str, Any]:
+    return (await recv_frame_async(reader))[0]
+
+def _recv_into(sock: socket.socket, buf: bytearray) -> None:
+    """Fill buf from sock; usually one recv_into, a view over the rest only if it comes in pieces."""
+    size = len(buf)
+    got = sock.recv_into(buf) if size else 0
+    if got < size:
+        view = memoryview(buf)
+        while got < size:
+            n = sock.recv_into(view[got:]) if got else 0
+            if not n:
+                raise ConnectionError("Connection closed during recv")
+            got += n
 
 # ---------- Time helpers ----------
 def now_minutes(initial_epoch: int) -> int:
-    """Return current timestamp in minutes since the shared initial_wall_clock epoch."""
-    return int((time.time() - initial_epoch) // 60)
+    """Return current timestamp in minutes since the shared initial_wall_clock epoch (utils/clock.py time)."""
+    return int((clock.now() - initial_epoch) // 60)
 
 def within_lifetime(start_ts: int, lifetime_min: int, now_min: int) -> bool:
     return now_min >= start_ts and now_min <= start_ts + lifetime_min
@@ -109,3 +301,4 @@ def within_lifetime(start_ts: int, lifetime_min: int, now_min: int) -> bool:
 # ---------- Convenience ----------
 def log(*args):
     print(*args, flush=True)
+
@@ -0,0 +1,146 @@
+import atexit
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+# Structured request events (principal, exchange, result, latency, ...) are queued by the
+# handlers and written in batches by a background thread, so no print/flush syscall runs
+# while a client is waiting. When the queue is full, events are dropped and counted.
+
+
+class EventLog:
+    def __init__(self, path: str = None, fmt: str = None, max_queue: int = 10000, batch_size: int = 512,
+                 max_bytes: int = 10 * 1024 * 1024, backups: int = 3, sample: dict = None):
+        self.path = None if path in (None, "-") else path
+        self.fmt = fmt or ("text" if self.path is None else "json")
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.sample = sample or {}          # exchange -> fraction of successful events kept
+        self.dropped = 0
+        self.sampled_out = 0
+        self.written = 0
+        self._q = queue.Queue(maxsize=max_queue)
+        self._out = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def emit(self, exchange: str, always: bool = False, **fields):
+        """Queue one event; never blocks. always=True bypasses sampling (used for errors)."""
+        rate = self.sample.get(exchange, 1.0)
+        if not always and rate < 1.0 and random.random() >= rate:
+            self.sampled_out += 1
+            return
+        fields["exchange"] = exchange
+        fields["ts"] = time.time()
+        try:
+            self._q.put_nowait(fields)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout: float = 2.0):
+        """Flush what is queued and stop the writer."""
+        if not self._thread.is_alive():
+            return
+        self._q.put(None)
+        self._thread.join(timeout)
+
+    # ---------- writer thread ----------
+    def _run(self):
+        while True:
+            batch = [self._q.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._q.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            lines = "".join(self._format(e) for e in batch if e is not None)
+            if lines:
+                try:
+                    self._write(lines)
+                    self.written += len(batch) - stop
+                except OSError:
+                    self.dropped += len(batch) - stop
+            if stop:
+                if self._out is not None and self._out is not sys.stdout:
+                    self._out.close()
+                return
+
+    def _format(self, e: dict) -> str:
+        if self.fmt == "json":
+            return json.dumps(e, default=str, ensure_ascii=False) + "\n"
+        head = f"[{e.pop('exchange')}]"
+        e.pop("ts")
+        return head + " " + " ".join(f"{k}={v}" for k, v in e.items()) + "\n"
+
+    def _write(self, lines: str):
+        if self.path is None:
+            sys.stdout.write(lines)
+            sys.stdout.flush()
+            return
+        if self._out is None:
+            self._out = open(self.path, "a", encoding="utf-8")
+        self._out.write(lines)
+        self._out.flush()
+        if self._out.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        self._out.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._out = open(self.path, "a", encoding="utf-8")
+
+
+def parse_sample(spec: str) -> dict:
+    """'AS=1,TGS=0.1,AP=0.01' -> {'AS': 1.0, 'TGS': 0.1, 'AP': 0.01}"""
+    out = {}
+    for part in filter(None, (spec or "").split(",")):
+        name, _, rate = part.partition("=")
+        out[name.strip()] = float(rate)
+    return out
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def configure(**kwargs) -> EventLog:
+    """Replace the process-wide event log (see EventLog for the options)."""
+    global _default
+    with _default_lock:
+        old, _default = _default, EventLog(**kwargs)
+    if old is not None:
+        old.close()
+    return _default
+
+
+def get() -> EventLog:
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = EventLog()
+    return _default
+
+
+def emit(exchange: str, always: bool = False, **fields):
+    get().emit(exchange, always, **fields)
+
+
+def close():
+    if _default is not None:
+        _default.close()
+
+
+atexit.register(close)
@@ -1,48 +1,254 @@
-from pymongo import MongoClient
 from datetime import datetime,timezone
+from collections import OrderedDict
+from itertools import islice
+import os
+import threading
+import time
+from utils.principal_store import MONGO_URI, MongoStore, open_store
+
+# --- Store selection (see utils/principal_store.py) ---
+# KERBEROS_STORE (or use_store) picks the backend: mongodb://..., sqlite:PATH or snapshot:PATH.
+# Nothing is opened until the first lookup.
+STORE_URL = os.getenv("KERBEROS_STORE", MONGO_URI)
+_store = None
+_store_lock = threading.Lock()
+
+def store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = open_store(STORE_URL)
+    return _store
+
+def use_store(url_or_store):
+    """Switch backends: a store URL (opened lazily) or a ready store object."""
+    global STORE_URL, _store
+    with _store_lock:
+        if isinstance(url_or_store, str):
+            STORE_URL, _store = url_or_store, None
+        else:
+            _store = url_or_store
+    principal_cache.clear()
+
+def reconnect():
+    """Reopen the store's connections; forked KDC workers call this (MongoClient is not fork-safe)."""
+    if _store is not None:
+        _store.reopen()
+
+def set_database(database):
+    """Point the helpers at a Mongo-shaped database object (e.g. an in-process fake for benchmarks)."""
+    use_store(MongoStore(db=database))
+
+
+# --- Principal cache (read-through, TTL + LRU, bounded) ---
+class PrincipalCache:
+    def __init__(self, max_size: int = 10000, ttl: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.enabled = True
+        self._data = OrderedDict()   # (kind, name) -> (expires_at, doc)
+        self._lock = threading.Lock()
+        self._generation = 0         # bumped on invalidation so in-flight loads don't re-insert stale docs
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_load(self, key, loader):
+        if not self.enabled:
+            return loader()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._data[key]
+                self.evictions += 1
+            self.misses += 1
+            gen = self._generation
+
+        doc = loader()
+        # Unknown principals are not cached, so they can't crowd out real ones
+        if doc is None:
+            return None
+        with self._lock:
+            if gen == self._generation:
+                self._insert(key, doc, now)
+        return doc
+
+    def put(self, key, doc):
+        """Insert a record directly (cache warmup); not counted as a hit or miss."""
+        if self.enabled:
+            with self._lock:
+                self._insert(key, doc, time.monotonic())
+
+    def _insert(self, key, doc, now):
+        self._data[key] = (now + self.ttl, doc)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._data)
+
+    def invalidate(self, kind: str, name=None):
+        """Drop one principal, or every cached principal of that kind when name is None."""
+        with self._lock:
+            self._generation += 1
+            if name is not None:
+                self._data.pop((kind, name), None)
+            else:
+                for key in [k for k in self._data if k[0] == kind]:
+                    del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "size": len(self._data)}
+
+
+principal_cache = PrincipalCache()
+
+def configure_cache(max_size: int = None, ttl: float = None, enabled: bool = None):
+    if max_size is not None:
+        principal_cache.max_size = max_size
+    if ttl is not None:
+        principal_cache.ttl = ttl
+    if enabled is not None:
+        principal_cache.enabled = enabled
+    principal_cache.clear()
+
+def cache_stats():
+    return principal_cache.stats()
+
+def warm_cache(kinds=("tgs", "server", "client")):
+    """Load principals from the store into the cache, stopping once it is full; returns counts per kind."""
+    counts = {}
+    for kind in kinds:
+        counts[kind] = 0
+        for doc in store().iter_all(kind):
+            if len(principal_cache) >= principal_cache.max_size:
+                break
+            name = doc["idtgs"] if kind == "tgs" else doc["name"]
+            if kind == "tgs" and counts[kind] == 0:
+                principal_cache.put(("tgs", None), doc)  # what get_tgs() returns
+            principal_cache.put((kind, name), doc)
+            counts[kind] += 1
+    return counts
+
+def iter_principals(kind: str):
+    return store().iter_all(kind)
 
-# --- DB Connection ---
-client = MongoClient("mongodb://localhost:27017/")
-db = client["kerberos_db"]
 
 # --- Clients Collection ---
 def get_client(name: str):
-    return db.clients.find_one({"name": name})
+    return principal_cache.get_or_load(("client", name), lambda: store().get_client(name))
 
 def add_client(name: str, password: str):
-    db.clients.insert_one({
+    store().insert("client", {
         "name": name,             # IDc
         "password": password,     # long-term key (hashed ideally)
         "created_at": datetime.now(timezone.utc)
     })
+    principal_cache.invalidate("client", name)
 
 
 # --- Servers Collection ---
 def get_server(name: str):
-    return db.servers.find_one({"name": name})
+    return principal_cache.get_or_load(("server", name), lambda: store().get_server(name))
 
 def add_server(name: str, key: str, port: int):
-    db.servers.insert_one({
+    store().insert("server", {
         "name": name,            # IDv
         "password": key,         # Kv
         "port": port,
         "created_at": datetime.now(timezone.utc)
     })
+    principal_cache.invalidate("server", name)
 
 
 # --- TGS Collection ---
 def get_tgs():
-    return db.tgs.find_one({})
+    return principal_cache.get_or_load(("tgs", None), lambda: store().get_tgs())
 
 def get_tgs_by_id(idtgs: str):
-    return db.tgs.find_one({"idtgs": idtgs})
+    return principal_cache.get_or_load(("tgs", idtgs), lambda: store().get_tgs_by_id(idtgs))
 
 def add_tgs(idtgs: str, ktgs: str, lifetime_tgt: int, lifetime_st: int):
-    db.tgs.insert_one({
+    store().insert("tgs", {
         "idtgs": idtgs,                   # e.g. "tgs1"
         "ktgs": ktgs,                     # shared secret key
         "default_lifetime_tgt": lifetime_tgt,
         "default_lifetime_st": lifetime_st,
         "created_at": datetime.now(timezone.utc)
     })
+    # get_tgs() caches "any TGS", so drop every TGS entry
+    principal_cache.invalidate("tgs")
+
+
+# --- Indexes and bulk provisioning ---
+def ensure_indexes():
+    """Unique indexes on the lookup fields (fails if the collections already hold duplicates)."""
+    store().ensure_indexes()
+
+def bulk_import(kind: str, docs, chunk_size: int = 5000, upsert: bool = True, progress=None) -> int:
+    """Write an iterable of principal documents in chunks; only one chunk is held in memory.
+
+    kind is "client", "server" or "tgs"; docs use the same fields as add_client/add_server/add_tgs
+    store. With upsert=True existing principals (matched on name/idtgs) are updated in place,
+    otherwise the chunk goes through insert_many. progress(rows_so_far) is called after each chunk.
+    """
+    docs = iter(docs)
+    total = 0
+    while True:
+        chunk = list(islice(docs, chunk_size))
+        if not chunk:
+            break
+        store().bulk(kind, chunk, upsert)
+        total += len(chunk)
+        principal_cache.invalidate(kind)
+        if progress:
+            progress(total)
+    return total
+
+
+# --- Invalidation from writes made by other processes (e.g. setup_db.py) ---
+_KINDS = ("client", "server", "tgs")
+
+def _watch_change_stream():
+    # Mongo only; every insert/update/delete on a principal collection drops that kind
+    for kind in store().changes():
+        principal_cache.invalidate(kind)
+
+def _watch_poll(interval: float):
+    # Each store has a cheap per-kind fingerprint (e.g. count + newest id); in-place updates
+    # are still bounded by the cache TTL
+    seen = {}
+    while True:
+        for kind in _KINDS:
+            fp = store().fingerprint(kind)
+            if kind in seen and seen[kind] != fp:
+                principal_cache.invalidate(kind)
+            seen[kind] = fp
+        time.sleep(interval)
 
+def start_watcher(mode: str = "poll", interval: float = 5.0):
+    """Start a daemon thread that invalidates the principal cache on DB changes ("poll" or "change-stream")."""
+    if mode == "change-stream":
+        target, args = _watch_change_stream, ()
+    elif mode == "poll":
+        target, args = _watch_poll, (interval,)
+    else:
+        raise ValueError(f"unknown watcher mode: {mode}")
+    t = threading.Thread(target=target, args=args, daemon=True)
+    t.start()
+    return t
@@ -0,0 +1,185 @@
+import bisect
+import collections
+import sys
+import threading
+import time
+
+# Stage timings and error counters for the request handlers, exposed in the Prometheus
+# text format on a local /metrics port. Disabled until start_http_server() (or enable())
+# is called; while disabled, timer() hands out a no-op timer.
+
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+enabled = False
+_lock = threading.Lock()
+_histograms = {}                       # (exchange, stage) -> [bucket counts..., sum]
+_counters = collections.Counter()      # (name, labels) -> count
+_gauges = {}                           # name -> callable sampled at scrape time
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def observe(exchange: str, stage: str, seconds: float):
+    i = bisect.bisect_left(BUCKETS, seconds)
+    with _lock:
+        h = _histograms.get((exchange, stage))
+        if h is None:
+            h = _histograms[(exchange, stage)] = [0] * (len(BUCKETS) + 2)
+        h[i] += 1
+        h[-1] += seconds
+
+
+def inc(name: str, **labels):
+    if enabled:
+        with _lock:
+            _counters[(name, tuple(sorted(labels.items())))] += 1
+
+
+def gauge(name: str, fn):
+    """Register a callable sampled at scrape time (e.g. cache sizes, hit counters)."""
+    _gauges[name] = fn
+
+
+class StageTimer:
+    """Times consecutive stages of one request: call lap(stage) at the end of each stage."""
+    __slots__ = ("exchange", "_last")
+
+    def __init__(self, exchange: str):
+        self.exchange = exchange
+        self._last = time.perf_counter()
+
+    def lap(self, stage: str):
+        now = time.perf_counter()
+        observe(self.exchange, stage, now - self._last)
+        self._last = now
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def lap(self, stage: str):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(exchange: str):
+    return StageTimer(exchange) if enabled else _NULL_TIMER
+
+
+def _labels(pairs):
+    return ",".join(f'{k}="{str(v).replace(chr(34), chr(39))}"' for k, v in pairs)
+
+
+def render() -> str:
+    lines = ["# TYPE kerberos_stage_seconds histogram"]
+    with _lock:
+        hists = {k: list(v) for k, v in _histograms.items()}
+        counters = dict(_counters)
+    for (exchange, stage), h in sorted(hists.items()):
+        base = _labels((("exchange", exchange), ("stage", stage)))
+        cumulative = 0
+        for bound, n in zip(BUCKETS, h):
+            cumulative += n
+            lines.append(f'kerberos_stage_seconds_bucket{{{base},le="{bound}"}} {cumulative}')
+        cumulative += h[len(BUCKETS)]
+        lines.append(f'kerberos_stage_seconds_bucket{{{base},le="+Inf"}} {cumulative}')
+        lines.append(f"kerberos_stage_seconds_sum{{{base}}} {h[-1]:.6f}")
+        lines.append(f"kerberos_stage_seconds_count{{{base}}} {cumulative}")
+    seen = set()
+    for (name, labels), n in sorted(counters.items()):
+        if name not in seen:
+            lines.append(f"# TYPE {name} counter")
+            seen.add(name)
+        lines.append(f"{name}{{{_labels(labels)}}} {n}")
+    for name, fn in sorted(_gauges.items()):
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {fn()}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------- Sampling profiler ----------
+class SamplingProfiler:
+    """Samples every thread's stack at a fixed interval and aggregates collapsed stacks."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.samples.clear()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> str:
+        """Stop sampling; returns 'frame;frame;frame count' lines (flamegraph input)."""
+        if self._thread is None:
+            return ""
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        return "\n".join(f"{stack} {n}" for stack, n in self.samples.most_common()) + "\n"
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+
+profiler = SamplingProfiler()
+
+
+# ---------- HTTP endpoint ----------
+def _page(path: str):
+    if path == "/metrics":
+        return render(), "text/plain; version=0.0.4"
+    if path == "/profile/start":
+        profiler.start()
+        return "profiling\n", "text/plain"
+    if path == "/profile/stop":
+        return profiler.stop(), "text/plain"
+    return None
+
+
+def start_http_server(port: int, host: str = "127.0.0.1"):
+    """Enable instrumentation and serve /metrics, /profile/start and /profile/stop on host:port."""
+    # http.server is only imported by processes that actually expose metrics
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            page = _page(self.path)
+            if page is None:
+                self.send_error(404)
+                return
+            data = page[0].encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", page[1])
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    enable()
+    srv = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
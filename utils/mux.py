@@ -0,0 +1,353 @@
+import itertools
+import queue
+import socket
+import threading
+import time
+from typing import Dict, Any
+from utils.crypto import (send_json, recv_frame, recv_raw_frame, send_json_async, recv_frame_async,
+                          recv_raw_frame_async, _parse_body)
+from utils.wire import WIRE_JSON, WIRE_BINARY
+from utils import metrics, eventlog
+
+# Keep-alive mode: frames keep the 4-byte length prefix, and a request that carries a
+# "rid" keeps the connection open. Replies echo the rid and may come back in any order.
+# A request without "rid" gets exactly one reply and the connection closes, as before.
+# Each reply goes out in the wire version (JSON or binary) of its request.
+# A handler may put a callable under "_upgrade" in its reply to take the connection over
+# once that reply is sent (session mode, utils/session.py); that only works on a one-shot
+# connection, so keep-alive replies carrying it are turned into errors.
+
+MAX_INFLIGHT = 32  # per connection; the reader stops pulling frames beyond this
+# Threaded servers answer keep-alive requests on one pool of worker threads shared by every
+# connection in the process, so N connections cost N reader threads plus this many, not
+# N * MAX_INFLIGHT. Requests queue for a free worker; MAX_INFLIGHT still bounds each connection.
+KEEPALIVE_WORKERS = 64
+
+# Health checks (utils/balancer.py) send a one-shot PING; it is answered before any handler
+# runs and isn't counted as a request
+PONG = {"type": "PONG"}
+
+_jobs = queue.SimpleQueue()
+_workers = 0
+_workers_lock = threading.Lock()
+
+
+def _err(e: Exception) -> Dict[str, Any]:
+    return {"type": "ERR", "reason": str(e)}
+
+
+def _decode(data, wire_version: int) -> Dict[str, Any]:
+    req = _parse_body(data, wire_version)
+    if not isinstance(req, dict):
+        raise ValueError("request is not an object")
+    return req
+
+
+def _reply_version(wire_version: int) -> int:
+    # An error about a frame goes back in that frame's encoding, unless it was one we don't speak
+    return wire_version if wire_version in (WIRE_JSON, WIRE_BINARY) else WIRE_JSON
+
+
+def _no_upgrade(rep: Dict[str, Any]) -> Dict[str, Any]:
+    if rep.pop("_upgrade", None) is not None:
+        return {"type": "ERR", "reason": "sessions need their own connection"}
+    return rep
+
+
+def _count(exchange, rep: Dict[str, Any], addr, started: float):
+    if exchange is None:
+        return
+    if rep.get("type") == "ERR" and "retry_after_ms" not in rep:
+        # Handlers emit their own success events (they know the principal); errors are
+        # logged here, unsampled. Requests shed by admission control are only counted, so a
+        # flood doesn't turn into a flood of log lines.
+        eventlog.emit(exchange, always=True, result="ERR", reason=rep.get("reason"),
+                      peer=addr[0] if addr else None,
+                      latency_ms=round((time.perf_counter() - started) * 1000, 3))
+    if not metrics.enabled:
+        return
+    metrics.inc("kerberos_requests_total", exchange=exchange)
+    if rep.get("type") == "ERR":
+        metrics.inc("kerberos_errors_total", exchange=exchange, reason=rep.get("reason"))
+
+
+# ---------- Server side ----------
+def _keepalive_worker():
+    while True:
+        fn, args = _jobs.get()
+        try:
+            fn(*args)
+        except Exception:
+            pass  # answer() replies with its own errors; keep the worker for the next one
+
+
+def _run_keepalive(fn, *args):
+    """Queue fn(*args) for the shared keep-alive workers, starting them on first use."""
+    global _workers
+    if _workers < KEEPALIVE_WORKERS:
+        with _workers_lock:
+            while _workers < KEEPALIVE_WORKERS:
+                try:
+                    threading.Thread(target=_keepalive_worker, daemon=True).start()
+                except RuntimeError:  # can't start new thread: make do with the ones running
+                    if not _workers:
+                        raise
+                    break
+                _workers += 1
+    _jobs.put((fn, args))
+
+
+def serve_conn(conn: socket.socket, addr, process, *args, exchange: str = None):
+    """Serve one accepted connection with process(req, addr, *args, wire_version=...) -> reply.
+
+    exchange ("AS", "TGS", "AP") labels the recv/handle/send timings and error counters.
+    """
+    try:
+        t = metrics.timer(exchange)
+        req, wire_version = recv_frame(conn)
+        t.lap("recv")
+        if req.get("type") == "PING":
+            send_json(conn, PONG, wire_version)
+            return
+        if "rid" not in req:
+            started = time.perf_counter()
+            try:
+                rep = process(req, addr, *args, wire_version=wire_version)
+            except Exception as e:
+                rep = _err(e)
+            t.lap("handle")
+            upgrade = rep.pop("_upgrade", None)
+            send_json(conn, rep, wire_version)
+            t.lap("send")
+            _count(exchange, rep, addr, started)
+            if upgrade is not None:
+                upgrade(conn, wire_version)
+            return
+        _serve_keepalive(conn, addr, req, wire_version, process, args, exchange)
+    except Exception as e:
+        try:
+            send_json(conn, _err(e))
+        except Exception:
+            pass
+    finally:
+        conn.close()
+
+
+def _serve_keepalive(conn, addr, req, wire_version, process, args, exchange):
+    send_lock = threading.Lock()
+    slots = threading.BoundedSemaphore(MAX_INFLIGHT)
+
+    def answer(req, wire_version):
+        try:
+            t = metrics.timer(exchange)
+            started = time.perf_counter()
+            try:
+                rep = process(req, addr, *args, wire_version=wire_version)
+            except Exception as e:
+                rep = _err(e)
+            t.lap("handle")
+            rep = _no_upgrade(rep)
+            rep["rid"] = req["rid"]
+            with send_lock:
+                send_json(conn, rep, wire_version)
+            t.lap("send")
+            _count(exchange, rep, addr, started)
+        except OSError:
+            pass  # peer went away; the reader loop will notice
+        finally:
+            slots.release()
+
+    try:
+        while True:
+            slots.acquire()
+            try:
+                _run_keepalive(answer, req, wire_version)
+            except BaseException:
+                slots.release()  # answer() will never run to give it back
+                raise
+            req = None
+            while req is None:
+                try:
+                    _, data, wire_version = recv_raw_frame(conn)
+                except (ConnectionError, OSError, ValueError):
+                    return
+                try:
+                    req = _decode(data, wire_version)
+                except Exception as e:
+                    # The frame was read whole, so the stream is still in step: answer this
+                    # one with an error (no rid to echo) and keep reading
+                    rep = dict(_err(e), rid=None)
+                    with send_lock:
+                        send_json(conn, rep, _reply_version(wire_version))
+                    _count(exchange, rep, addr, time.perf_counter())
+            if "rid" not in req:
+                req["rid"] = None
+    finally:
+        # Let outstanding replies go out before the caller closes the socket
+        for _ in range(MAX_INFLIGHT):
+            slots.acquire()
+
+
+async def serve_conn_async(reader, writer, run, exchange: str = None):
+    """asyncio counterpart of serve_conn; run(req, wire_version) is a coroutine returning the reply."""
+    import asyncio  # already loaded by the running loop; kept out of the module's import cost
+    addr = writer.get_extra_info("peername")
+    try:
+        t = metrics.timer(exchange)
+        req, wire_version = await recv_frame_async(reader)
+        t.lap("recv")
+        if req.get("type") == "PING":
+            await send_json_async(writer, PONG, wire_version)
+            return
+        if "rid" not in req:
+            started = time.perf_counter()
+            try:
+                rep = await run(req, wire_version)
+            except Exception as e:
+                rep = _err(e)
+            t.lap("handle")
+            rep = _no_upgrade(rep)
+            await send_json_async(writer, rep, wire_version)
+            t.lap("send")
+            _count(exchange, rep, addr, started)
+            return
+
+        send_lock = asyncio.Lock()
+        slots = asyncio.Semaphore(MAX_INFLIGHT)
+        tasks = set()
+
+        async def answer(req, wire_version):
+            try:
+                t = metrics.timer(exchange)
+                started = time.perf_counter()
+                try:
+                    rep = await run(req, wire_version)
+                except Exception as e:
+                    rep = _err(e)
+                t.lap("handle")
+                rep = _no_upgrade(rep)
+                rep["rid"] = req.get("rid")
+                async with send_lock:
+                    await send_json_async(writer, rep, wire_version)
+                t.lap("send")
+                _count(exchange, rep, addr, started)
+            except OSError:
+                pass
+            finally:
+                slots.release()
+
+        try:
+            while True:
+                await slots.acquire()
+                task = asyncio.ensure_future(answer(req, wire_version))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                req = None
+                while req is None:
+                    try:
+                        data, wire_version = await recv_raw_frame_async(reader)
+                    except (ConnectionError, OSError, ValueError):
+                        return
+                    try:
+                        req = _decode(data, wire_version)
+                    except Exception as e:
+                        rep = dict(_err(e), rid=None)
+                        async with send_lock:
+                            await send_json_async(writer, rep, _reply_version(wire_version))
+                        _count(exchange, rep, addr, time.perf_counter())
+        finally:
+            if tasks:
+                await asyncio.wait(set(tasks))
+    except Exception as e:
+        try:
+            await send_json_async(writer, _err(e))
+        except Exception:
+            pass
+    finally:
+        writer.close()
+
+
+# ---------- Client side ----------
+class MuxConnection:
+    """One TCP connection carrying many pipelined requests, matched to replies by rid."""
+
+    def __init__(self, host: str, port: int, timeout: float = None):
+        self.sock = socket.create_connection((host, port), timeout)
+        self.sock.settimeout(None)
+        self._rids = itertools.count(1)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self.closed = False
+        threading.Thread(target=self._read_loop, daemon=True).start()
+
+    def submit(self, req: Dict[str, Any], wire_version: int = WIRE_JSON) -> "Future":
+        from concurrent.futures import Future  # pulls in logging; only clients that pipeline pay for it
+        fut = Future()
+        with self._lock:
+            if self.closed:
+                raise ConnectionError("Connection closed")
+            rid = next(self._rids)
+            self._pending[rid] = fut
+        try:
+            with self._send_lock:
+                send_json(self.sock, dict(req, rid=rid), wire_version)
+        except OSError:
+            self._fail_all(ConnectionError("Connection closed during send"))
+            raise
+        return fut
+
+    def request(self, req: Dict[str, Any], timeout: float = None, wire_version: int = WIRE_JSON) -> Dict[str, Any]:
+        return self.submit(req, wire_version).result(timeout)
+
+    def _read_loop(self):
+        try:
+            while True:
+                rep, _ = recv_frame(self.sock)
+                with self._lock:
+                    fut = self._pending.pop(rep.pop("rid", None), None)
+                if fut is not None:
+                    fut.set_result(rep)
+        except Exception as e:
+            self._fail_all(e if isinstance(e, ConnectionError) else ConnectionError(str(e)))
+
+    def _fail_all(self, exc: Exception):
+        with self._lock:
+            self.closed = True
+            pending, self._pending = self._pending, {}
+        for fut in pending.values():
+            if not fut.done():
+                fut.set_exception(exc)
+
+    def close(self):
+        self._fail_all(ConnectionError("Connection closed"))
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class ConnectionPool:
+    """A few MuxConnections to one endpoint, handed out round-robin and reopened when they drop."""
+
+    def __init__(self, host: str, port: int, size: int = 2, timeout: float = None):
+        self.host, self.port, self.timeout = host, port, timeout
+        self._conns = [None] * size
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+
+    def get(self) -> MuxConnection:
+        i = next(self._next) % len(self._conns)
+        with self._lock:
+            conn = self._conns[i]
+            if conn is None or conn.closed:
+                conn = self._conns[i] = MuxConnection(self.host, self.port, self.timeout)
+            return conn
+
+    def close(self):
+        with self._lock:
+            for conn in self._conns:
+                if conn is not None:
+                    conn.close()
+            self._conns = [None] * len(self._conns)
@@ -0,0 +1,329 @@
+import bisect
+import hashlib
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+import threading
+from datetime import datetime, timezone
+from utils import wire
+
+# Principal-store backends behind utils/kerberos_db. Every store answers the four KDC lookups
+# (get_client, get_server, get_tgs, get_tgs_by_id) with plain dicts shaped like the Mongo
+# documents, plus the writes used by the add_* helpers and bulk import. Pick one with
+# open_store(url):
+#   mongodb://host:27017/        Mongo (the original store)
+#   sqlite:PATH                  embedded SQLite file, WAL mode, no server process
+#   snapshot:PATH                read-only mmap snapshot written by write_snapshot()
+
+MONGO_URI = "mongodb://localhost:27017/"
+
+KINDS = ("client", "server", "tgs")
+COLLECTIONS = {"client": "clients", "server": "servers", "tgs": "tgs"}
+KEY_FIELDS = {"client": "name", "server": "name", "tgs": "idtgs"}
+FIELDS = {
+    "client": ("name", "password"),
+    "server": ("name", "password", "port"),
+    "tgs": ("idtgs", "ktgs", "default_lifetime_tgt", "default_lifetime_st"),
+}
+
+
+def open_store(url: str = None):
+    url = url or MONGO_URI
+    if url.startswith(("mongodb://", "mongodb+srv://")):
+        return MongoStore(url)
+    if url.startswith("sqlite:"):
+        path = url[len("sqlite:"):]
+        return SQLiteStore(path[2:] if path.startswith("//") else path)  # sqlite:///abs/path or sqlite:rel
+    if url.startswith("snapshot:"):
+        return SnapshotStore(url[len("snapshot:"):])
+    raise ValueError(f"unknown principal store: {url}")
+
+
+# ---------- Mongo ----------
+class MongoStore:
+    def __init__(self, uri: str = MONGO_URI, database: str = "kerberos_db", db=None):
+        self.uri = uri if db is None else None
+        self.database = database
+        self.client = None
+        self.db = db            # a ready database object (e.g. the bench fake) skips MongoClient
+        if db is None:
+            self.reopen()
+
+    def reopen(self):
+        """Fresh connection; MongoClient is not fork-safe, so forked KDC workers call this."""
+        if self.uri is None:
+            return
+        from pymongo import MongoClient
+        self.client = MongoClient(self.uri)
+        self.db = self.client[self.database]
+
+    def get_client(self, name: str):
+        return self.db.clients.find_one({"name": name})
+
+    def get_server(self, name: str):
+        return self.db.servers.find_one({"name": name})
+
+    def get_tgs(self):
+        return self.db.tgs.find_one({})
+
+    def get_tgs_by_id(self, idtgs: str):
+        return self.db.tgs.find_one({"idtgs": idtgs})
+
+    def insert(self, kind: str, doc: dict):
+        self.db[COLLECTIONS[kind]].insert_one(doc)
+
+    def bulk(self, kind: str, docs: list, upsert: bool = True):
+        from pymongo import UpdateOne
+        coll, key = self.db[COLLECTIONS[kind]], KEY_FIELDS[kind]
+        now = datetime.now(timezone.utc)
+        if upsert:
+            coll.bulk_write([UpdateOne({key: d[key]}, {"$set": d, "$setOnInsert": {"created_at": now}}, upsert=True)
+                             for d in docs], ordered=False)
+        else:
+            coll.insert_many([dict(d, created_at=now) for d in docs], ordered=False)
+
+    def ensure_indexes(self):
+        from pymongo import ASCENDING
+        for kind in KINDS:
+            self.db[COLLECTIONS[kind]].create_index([(KEY_FIELDS[kind], ASCENDING)], unique=True)
+
+    def iter_all(self, kind: str):
+        return self.db[COLLECTIONS[kind]].find({}, {"_id": 0})
+
+    def fingerprint(self, kind: str):
+        # (count, newest _id); in-place updates are still bounded by the principal cache TTL
+        coll = self.db[COLLECTIONS[kind]]
+        newest = coll.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+        return coll.estimated_document_count(), newest and newest["_id"]
+
+    def changes(self):
+        """Yield the kind of every write (change streams need a replica set)."""
+        kinds = {coll: kind for kind, coll in COLLECTIONS.items()}
+        with self.db.watch() as stream:
+            for change in stream:
+                kind = kinds.get(change.get("ns", {}).get("coll"))
+                if kind:
+                    yield kind
+
+
+# ---------- SQLite ----------
+class SQLiteStore:
+    """One table per kind keyed on name/idtgs, WAL journal, one connection per thread.
+
+    The SQL strings are constants, so sqlite3's per-connection statement cache prepares each
+    lookup once and reuses it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._sql = {}
+        for kind in KINDS:
+            table, key, cols = COLLECTIONS[kind], KEY_FIELDS[kind], FIELDS[kind] + ("created_at",)
+            self._sql[kind] = {
+                "get": f"SELECT {', '.join(cols)} FROM {table} WHERE {key} = ?",
+                "first": f"SELECT {', '.join(cols)} FROM {table} ORDER BY rowid LIMIT 1",
+                "all": f"SELECT {', '.join(cols)} FROM {table} ORDER BY rowid",
+                "insert": f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+                "upsert": (f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))}) "
+                           f"ON CONFLICT({key}) DO UPDATE SET "
+                           + ", ".join(f"{c} = excluded.{c}" for c in FIELDS[kind] if c != key)),
+                "fingerprint": f"SELECT COUNT(*), MAX(rowid) FROM {table}",
+            }
+        self.ensure_indexes()
+
+    def reopen(self):
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, cached_statements=64)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _one(self, kind: str, stmt: str, params=()):
+        row = self._conn().execute(self._sql[kind][stmt], params).fetchone()
+        return dict(zip(FIELDS[kind] + ("created_at",), row)) if row else None
+
+    def get_client(self, name: str):
+        return self._one("client", "get", (name,))
+
+    def get_server(self, name: str):
+        return self._one("server", "get", (name,))
+
+    def get_tgs(self):
+        return self._one("tgs", "first")
+
+    def get_tgs_by_id(self, idtgs: str):
+        return self._one("tgs", "get", (idtgs,))
+
+    def _row(self, kind: str, doc: dict, created_at):
+        created_at = doc.get("created_at", created_at)
+        if isinstance(created_at, datetime):
+            created_at = created_at.isoformat()
+        return tuple(doc.get(f) for f in FIELDS[kind]) + (created_at,)
+
+    def insert(self, kind: str, doc: dict):
+        with self._conn() as conn:
+            conn.execute(self._sql[kind]["insert"], self._row(kind, doc, None))
+
+    def bulk(self, kind: str, docs: list, upsert: bool = True):
+        now = datetime.now(timezone.utc).isoformat()
+        with self._conn() as conn:
+            conn.executemany(self._sql[kind]["upsert" if upsert else "insert"],
+                             [self._row(kind, d, now) for d in docs])
+
+    def ensure_indexes(self):
+        # The key column is the PRIMARY KEY, so creating the tables is all there is to do
+        with self._conn() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS clients "
+                         "(name TEXT PRIMARY KEY, password TEXT NOT NULL, created_at TEXT)")
+            conn.execute("CREATE TABLE IF NOT EXISTS servers "
+                         "(name TEXT PRIMARY KEY, password TEXT NOT NULL, port INTEGER, created_at TEXT)")
+            conn.execute("CREATE TABLE IF NOT EXISTS tgs (idtgs TEXT PRIMARY KEY, ktgs TEXT NOT NULL, "
+                         "default_lifetime_tgt INTEGER, default_lifetime_st INTEGER, created_at TEXT)")
+
+    def iter_all(self, kind: str):
+        cols = FIELDS[kind] + ("created_at",)
+        for row in self._conn().execute(self._sql[kind]["all"]):
+            yield dict(zip(cols, row))
+
+    def fingerprint(self, kind: str):
+        return tuple(self._conn().execute(self._sql[kind]["fingerprint"]).fetchone())
+
+    def changes(self):
+        raise ValueError("change streams need the Mongo store; use the poll watcher")
+
+
+# ---------- Read-only mmap snapshot ----------
+# Layout: header, then per kind the records ([4-byte length][wire.pack(doc)]) followed by a
+# sorted array of 64-bit key hashes and the matching array of record offsets (little-endian).
+# Opening maps the file and reads the header, so an edge replica is ready in milliseconds
+# whatever the principal count; a lookup is a bisect over the mapped hash array plus one unpack.
+_SNAP_MAGIC = b"KRBSNP02"
+_SNAP_HEADER = struct.Struct("<8s" + "QQQ" * len(KINDS))   # per kind: count, index offset, first record
+_SNAP_LEN = struct.Struct("<I")
+
+
+def _key_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def write_snapshot(path: str, source, kinds=KINDS) -> dict:
+    """Dump the principals of another store into a snapshot file (atomically replaced).
+
+    Kinds left out of `kinds` are written as empty tables, e.g. ("tgs", "server") for TGS
+    replicas that never need client passwords.
+    """
+    counts = {}
+    tables = []
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(bytes(_SNAP_HEADER.size))
+        for kind in KINDS:
+            entries, first = [], 0
+            for doc in (source.iter_all(kind) if kind in kinds else ()):
+                doc = {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in doc.items() if k != "_id"}
+                offset = f.tell()
+                first = first or offset
+                data = wire.pack(doc)
+                f.write(_SNAP_LEN.pack(len(data)))
+                f.write(data)
+                entries.append((_key_hash(doc[KEY_FIELDS[kind]]), offset))
+            entries.sort()
+            index_offset = f.tell()
+            f.write(b"".join(h.to_bytes(8, "little") for h, _ in entries))
+            f.write(b"".join(o.to_bytes(8, "little") for _, o in entries))
+            tables += [len(entries), index_offset, first]
+            counts[kind] = len(entries)
+        f.seek(0)
+        f.write(_SNAP_HEADER.pack(_SNAP_MAGIC, *tables))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return counts
+
+
+class SnapshotStore:
+    def __init__(self, path: str):
+        if sys.byteorder != "little":
+            raise ValueError("snapshot files are mapped as little-endian arrays")
+        self.path = path
+        self.reopen()
+
+    def reopen(self):
+        with open(self.path, "rb") as f:
+            st = os.fstat(f.fileno())
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, *header = _SNAP_HEADER.unpack_from(mm, 0)
+        if magic != _SNAP_MAGIC:
+            raise ValueError(f"{self.path} is not a principal snapshot")
+        view = memoryview(mm)
+        tables = {}
+        for i, kind in enumerate(KINDS):
+            count, index, first = header[3 * i:3 * i + 3]
+            hashes = view[index:index + 8 * count].cast("Q")
+            offsets = view[index + 8 * count:index + 16 * count].cast("Q")
+            tables[kind] = (hashes, offsets, first)
+        # Swap in one assignment; lookups already running keep the old map alive until they finish
+        self._state = (mm, tables)
+        self._stat = (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _record(self, mm, offset: int):
+        (n,) = _SNAP_LEN.unpack_from(mm, offset)
+        return wire.unpack(mm[offset + 4:offset + 4 + n])
+
+    def _lookup(self, kind: str, key: str):
+        mm, tables = self._state
+        hashes, offsets, _ = tables[kind]
+        h = _key_hash(key)
+        i = bisect.bisect_left(hashes, h)
+        # Walk entries with an equal hash (collisions are possible, just rare)
+        while i < len(hashes) and hashes[i] == h:
+            doc = self._record(mm, offsets[i])
+            if doc[KEY_FIELDS[kind]] == key:
+                return doc
+            i += 1
+        return None
+
+    def get_client(self, name: str):
+        return self._lookup("client", name)
+
+    def get_server(self, name: str):
+        return self._lookup("server", name)
+
+    def get_tgs(self):
+        mm, tables = self._state
+        hashes, _, first = tables["tgs"]
+        return self._record(mm, first) if len(hashes) else None
+
+    def get_tgs_by_id(self, idtgs: str):
+        return self._lookup("tgs", idtgs)
+
+    def insert(self, kind: str, doc: dict):
+        raise RuntimeError("snapshot store is read-only; write to the source store and re-snapshot")
+
+    def bulk(self, kind: str, docs: list, upsert: bool = True):
+        self.insert(kind, None)
+
+    def ensure_indexes(self):
+        pass
+
+    def iter_all(self, kind: str):
+        mm, tables = self._state
+        for offset in sorted(tables[kind][1]):
+            yield self._record(mm, offset)
+
+    def fingerprint(self, kind: str):
+        # A replaced snapshot file is remapped here, so the poll watcher picks up new snapshots
+        st = os.stat(self.path)
+        if (st.st_mtime_ns, st.st_size, st.st_ino) != self._stat:
+            self.reopen()
+        return self._stat
+
+    def changes(self):
+        raise ValueError("change streams need the Mongo store; use the poll watcher")
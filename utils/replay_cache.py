@@ -0,0 +1,215 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+from typing import Any, Dict
+from utils.crypto import now_minutes
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locks, so one process per replay file
+    fcntl = None
+
+# Authenticators are remembered per timestamp minute. An authenticator with timestamp ts
+# can only pass the lifetime checks while now - ts <= window, so once a minute falls out
+# of the window its whole bucket is dropped at once instead of expiring entries one by one.
+#
+# With a path, the cache is a hash table in a memory-mapped file instead, and every process
+# that opens the same file (kdc.py --workers, TGS replicas on one host) checks and records
+# in the same table, so an authenticator accepted by one of them is a replay to all of them.
+# It also survives restarts. Each shard is a region of open-addressed slots, taken under a
+# thread lock plus an fcntl lock on that region; a slot whose minute has left the window is
+# free again, so nothing needs sweeping.
+#
+# Either way a shard holds at most max_entries / shards authenticators (a file shard fills up
+# a little sooner, at roughly 80%, when no free slot turns up within MAX_PROBE of a digest's
+# home). When a new one doesn't fit, check_and_add raises ReplayCacheFull and the request is
+# refused: forgetting a live authenticator to make room would let it be replayed.
+
+_MAGIC = b"KRBRPL02"
+_HEADER = struct.Struct("!8sII")      # magic, shards, slots per shard
+_RECORD = struct.Struct("!q16s")      # ts minute, digest
+_EMPTY = bytes(16)
+MAX_PROBE = 256                       # slots looked at before a file shard counts as full
+
+
+class ReplayCacheFull(Exception):
+    def __init__(self):
+        super().__init__("replay cache full")
+
+
+class _Shard:
+    __slots__ = ("lock", "buckets", "count", "expired_before", "offset")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}           # ts minute -> set of digests
+        self.count = 0              # digests across the buckets
+        self.expired_before = None  # buckets below this minute are already gone
+        self.offset = 0             # start of this shard's slots in the file
+
+
+class ReplayCache:
+    """Bounded, time-bucketed, sharded cache of seen authenticators.
+
+    If path is given, the entries live in a memory-mapped file shared with every other process
+    opening it (see above) rather than in this process. initial_epoch lets len() tell which
+    entries are still inside the window by the clock; without it, by the last check_and_add.
+    """
+
+    def __init__(self, window: int = 10, shards: int = 16, path: str = None, max_entries: int = 1 << 20,
+                 initial_epoch: int = None):
+        self.window = window
+        self.initial_epoch = initial_epoch
+        self._shards = [_Shard() for _ in range(shards)]
+        self._per_shard = max(1, max_entries // shards)
+        self._mm = None
+        self._fd = None
+        self._nowm = None  # minute of the last check_and_add
+        if path:
+            self._open(path)
+
+    @staticmethod
+    def digest(idc: str, adc: str, ts: int, authenticator: Dict[str, Any]) -> bytes:
+        # Over the decrypted fields, not the ciphertext as sent: the same authenticator can
+        # arrive as base64 or raw bytes, in a JSON or binary frame, and must digest the same
+        h = hashlib.blake2b(f"{idc}\0{adc}\0{ts}\0".encode("utf-8"), digest_size=16)
+        h.update(json.dumps(authenticator, sort_keys=True, separators=(",", ":"), default=repr).encode("utf-8"))
+        return h.digest()
+
+    def check_and_add(self, idc: str, adc: str, ts: int, authenticator: Dict[str, Any], nowm: int) -> bool:
+        """Record the decrypted authenticator; False if it was already seen (a replay).
+
+        Raises ReplayCacheFull if its shard has no room for it.
+        """
+        digest = self.digest(idc, adc, ts, authenticator)
+        shard = self._shards[digest[0] % len(self._shards)]
+        self._nowm = nowm
+        with shard.lock:
+            if self._mm is not None:
+                return self._check_and_add_file(shard, digest, ts, nowm)
+            self._expire(shard, nowm)
+            bucket = shard.buckets.get(ts)
+            if bucket is not None and digest in bucket:
+                return False
+            if shard.count >= self._per_shard:
+                raise ReplayCacheFull()
+            if bucket is None:
+                bucket = shard.buckets[ts] = set()
+            bucket.add(digest)
+            shard.count += 1
+        return True
+
+    def _expire(self, shard: _Shard, nowm: int):
+        cutoff = nowm - self.window
+        if shard.expired_before == cutoff:
+            return
+        shard.expired_before = cutoff
+        for ts in [t for t in shard.buckets if t < cutoff]:
+            shard.count -= len(shard.buckets.pop(ts))
+
+    def __len__(self):
+        """Authenticators recorded and still inside the window."""
+        nowm = now_minutes(self.initial_epoch) if self.initial_epoch is not None else self._nowm
+        if self._mm is not None:
+            return self._file_len(nowm)
+        total = 0
+        for shard in self._shards:
+            with shard.lock:
+                if nowm is not None:
+                    self._expire(shard, nowm)
+                total += shard.count
+        return total
+
+    # ---------- shared file ----------
+    def _open(self, path: str):
+        size = _HEADER.size + len(self._shards) * self._per_shard * _RECORD.size
+        header = (_MAGIC, len(self._shards), self._per_shard)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            # Whole-file lock while checking the header, so processes starting together
+            # don't both decide the file is new and wipe each other's entries
+            self._lockf(fd, True, 0, 0)
+            try:
+                fresh = os.fstat(fd).st_size == 0
+                if fresh:
+                    os.ftruncate(fd, size)
+                elif os.fstat(fd).st_size != size:
+                    # Resizing it would pull the file out from under processes still mapping it
+                    raise ValueError(f"{path} holds a replay cache of another size; remove it or "
+                                     f"open it with the same shards and max entries")
+                self._mm = mmap.mmap(fd, size)
+                if fresh:
+                    _HEADER.pack_into(self._mm, 0, *header)
+                    self._mm.flush()
+                elif _HEADER.unpack_from(self._mm, 0) != header:
+                    self._mm.close()
+                    self._mm = None
+                    raise ValueError(f"{path} is not a replay cache file of this layout")
+            finally:
+                self._lockf(fd, False, 0, 0)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+        for i, shard in enumerate(self._shards):
+            shard.offset = _HEADER.size + i * self._per_shard * _RECORD.size
+
+    @staticmethod
+    def _lockf(fd: int, exclusive: bool, start: int, length: int):
+        if fcntl is not None:
+            fcntl.lockf(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_UN, length, start)
+
+    def _check_and_add_file(self, shard: _Shard, digest: bytes, ts: int, nowm: int) -> bool:
+        cutoff = nowm - self.window
+        slots = self._per_shard
+        home = int.from_bytes(digest[1:9], "little") % slots
+        region = slots * _RECORD.size
+        self._lockf(self._fd, True, shard.offset, region)
+        try:
+            free = None
+            # Slots are never emptied (expired ones are reused in place), so an empty slot
+            # ends the probe: the digest can't sit further along
+            for k in range(min(MAX_PROBE, slots)):
+                slot = shard.offset + (home + k) % slots * _RECORD.size
+                seen_ts, seen = _RECORD.unpack_from(self._mm, slot)
+                if seen == _EMPTY:
+                    if free is None:
+                        free = slot
+                    break
+                if seen_ts < cutoff:
+                    if free is None:
+                        free = slot
+                elif seen == digest:
+                    return False
+            if free is None:
+                raise ReplayCacheFull()
+            _RECORD.pack_into(self._mm, free, ts, digest)
+            return True
+        finally:
+            self._lockf(self._fd, False, shard.offset, region)
+
+    def _records(self):
+        for shard in self._shards:
+            for r in range(self._per_shard):
+                seen_ts, seen = _RECORD.unpack_from(self._mm, shard.offset + r * _RECORD.size)
+                if seen != _EMPTY:
+                    yield seen_ts
+
+    def _file_len(self, nowm: int = None) -> int:
+        if nowm is None:
+            # No clock and nothing checked yet (a file just opened): the newest entry stands in
+            # for now, since expired slots are never cleared and can't simply be counted
+            nowm = max(self._records(), default=0)
+        cutoff = nowm - self.window
+        return sum(1 for seen_ts in self._records() if seen_ts >= cutoff)
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.flush()
+            self._mm.close()
+            self._mm = None
+            os.close(self._fd)
+            self._fd = None
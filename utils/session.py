@@ -0,0 +1,184 @@
+import base64
+import socket
+import threading
+from typing import Any, Callable, Dict, Union
+from utils.crypto import (KeyHandle, encrypt_obj, decrypt_obj, send_json, recv_frame, now_minutes,
+                          within_lifetime, log)
+from utils.wire import WIRE_JSON, WIRE_BINARY
+
+# Session mode: an APP_REQ carrying "Session" that succeeds leaves its connection open for a
+# stream of SESSION_DATA frames instead of closing after the APP_REP. Each frame's payload is
+# encrypted under Kc_v and carries a sequence number counting up from 1; the server handles
+# frames strictly in order and answers each with an encrypted SESSION_ACK echoing that seq.
+# The sender keeps at most `window` frames unacknowledged, so a slow server throttles the
+# client instead of letting frames pile up. A seq out of order, an expired ticket, a bad frame
+# or SESSION_END ends the session. Frames use the wire version of the opening APP_REQ; in
+# JSON mode file chunks travel as base64 inside the encrypted payload.
+
+DEFAULT_WINDOW = 16
+DEFAULT_CHUNK = 64 * 1024
+MAX_CHUNK = 1 << 20          # keeps an encrypted chunk well inside one binary frame
+
+
+def chunk_bytes(chunk: Union[str, bytes]) -> bytes:
+    return base64.b64decode(chunk) if isinstance(chunk, str) else chunk
+
+
+def payload_len(body: Dict[str, Any]) -> int:
+    """Bytes of file chunk or message text in a decrypted frame, the same in either wire version."""
+    if "chunk" in body:
+        chunk = body["chunk"]
+        if isinstance(chunk, str):  # len(chunk_bytes(chunk)) without decoding it a second time
+            return len(chunk) * 3 // 4 - chunk[-2:].count("=")
+        return len(chunk)
+    return len(str(body.get("msg", "")).encode("utf-8"))
+
+
+# ---------- Server side ----------
+def serve_session(conn: socket.socket, Kc_v: KeyHandle, wire_version: int, handle: Callable,
+                  ts: int, lifetime: int, initial_epoch: int) -> Dict[str, int]:
+    """Run a session on conn until it ends; handle(body) -> reply dict. Returns frame/byte counts
+    (payload bytes of the frames handled, see payload_len)."""
+    binary = wire_version == WIRE_BINARY
+    seq = 0
+    received = 0
+
+    def fail(reason):
+        try:
+            send_json(conn, {"type": "ERR", "reason": reason}, wire_version)
+        except OSError:
+            pass
+
+    while True:
+        try:
+            req, _ = recv_frame(conn)
+        except (ConnectionError, OSError, ValueError):
+            break
+        kind = req.get("type")
+        if kind == "SESSION_END":
+            break
+        if kind != "SESSION_DATA":
+            fail("bad type")
+            break
+        if not within_lifetime(ts, lifetime, now_minutes(initial_epoch)):
+            fail("service ticket expired")
+            break
+        try:
+            body = decrypt_obj(req["data"], Kc_v)
+        except Exception:
+            fail("bad session frame")
+            break
+        if body.get("seq") != seq + 1:
+            fail("out of sequence")
+            break
+        seq += 1
+        try:
+            reply = handle(body)
+        except Exception as e:
+            # Details stay in the server log; the peer only learns that the frame was refused
+            log(f"[session] frame {seq} refused: {e!r}")
+            fail("session frame refused")
+            break
+        received += payload_len(body)
+        reply["seq"] = seq
+        try:
+            send_json(conn, {"type": "SESSION_ACK", "data": encrypt_obj(reply, Kc_v, binary)}, wire_version)
+        except OSError:
+            break
+    return {"frames": seq, "bytes": received}
+
+
+# ---------- Client side ----------
+class AppSession:
+    """Client end of an open session: send() frames with at most `window` unacknowledged."""
+
+    def __init__(self, sock: socket.socket, Kc_v: Union[str, KeyHandle], wire_version: int = WIRE_JSON,
+                 window: int = DEFAULT_WINDOW):
+        self.sock = sock
+        self.Kc_v = Kc_v if isinstance(Kc_v, KeyHandle) else KeyHandle(Kc_v)
+        self.wire_version = wire_version
+        self.binary = wire_version == WIRE_BINARY
+        self.window = max(1, window)
+        self._seq = 0
+        self._acked = 0
+        self._error = None
+        self._waiting = {}      # seq -> reply (None until acked) for callers that asked for it
+        self._send_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._reader = threading.Thread(target=self._read_acks, daemon=True)
+        self._reader.start()
+
+    def _read_acks(self):
+        while True:
+            try:
+                rep, _ = recv_frame(self.sock)
+                if rep.get("type") != "SESSION_ACK":
+                    raise RuntimeError(f"session error: {rep}")
+                reply = decrypt_obj(rep["data"], self.Kc_v)
+                if reply.get("seq") != self._acked + 1:
+                    raise RuntimeError("session ack out of sequence")
+            except Exception as e:
+                with self._cond:
+                    self._error = e if not isinstance(e, (ConnectionError, OSError, ValueError)) \
+                        else RuntimeError("session closed")
+                    self._cond.notify_all()
+                return
+            with self._cond:
+                self._acked = reply["seq"]
+                if self._acked in self._waiting:
+                    self._waiting[self._acked] = reply
+                self._cond.notify_all()
+
+    def send(self, body: Dict[str, Any], want_reply: bool = False) -> int:
+        """Queue one frame, blocking while the window is full; returns its seq."""
+        with self._send_lock:
+            with self._cond:
+                while self._error is None and self._seq - self._acked >= self.window:
+                    self._cond.wait()
+                if self._error is not None:
+                    raise self._error
+                self._seq += 1
+                seq = self._seq
+                if want_reply:
+                    self._waiting[seq] = None
+            body["seq"] = seq
+            frame = {"type": "SESSION_DATA", "data": encrypt_obj(body, self.Kc_v, self.binary)}
+            send_json(self.sock, frame, self.wire_version)
+        return seq
+
+    def wait(self, seq: int) -> Dict[str, Any]:
+        """Block until frame seq is acknowledged; returns its reply if send() asked for it."""
+        with self._cond:
+            while self._acked < seq:
+                if self._error is not None:
+                    raise self._error
+                self._cond.wait()
+            return self._waiting.pop(seq, None)
+
+    def message(self, text: str) -> Dict[str, Any]:
+        return self.wait(self.send({"msg": text}, want_reply=True))
+
+    def send_file(self, f, name: str, chunk_size: int = DEFAULT_CHUNK) -> Dict[str, Any]:
+        """Stream a binary file object in chunks; returns the server's reply to the last one."""
+        chunk_size = min(chunk_size, MAX_CHUNK)
+        offset = 0
+        while True:
+            data = f.read(chunk_size)
+            eof = len(data) < chunk_size
+            chunk = data if self.binary else base64.b64encode(data).decode("ascii")
+            seq = self.send({"file": name, "offset": offset, "chunk": chunk, "eof": eof}, want_reply=eof)
+            offset += len(data)
+            if eof:
+                return self.wait(seq)
+
+    def flush(self):
+        self.wait(self._seq)
+
+    def close(self):
+        try:
+            with self._send_lock:
+                send_json(self.sock, {"type": "SESSION_END"}, self.wire_version)
+        except OSError:
+            pass
+        finally:
+            self.sock.close()
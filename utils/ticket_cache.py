@@ -0,0 +1,153 @@
+import threading
+import time
+from collections import OrderedDict
+from utils import clock
+
+# Two-tier client ticket store. L1 is in-process: lock-striped shards, each a bounded LRU
+# whose entries carry the ticket's expiry. L2 is the shared on-disk diskcache, written with
+# the same expiry so diskcache drops expired tickets on its own. Reads are served from L1
+# when possible; a miss there falls through to L2 and is promoted.
+#
+# L1 expiry follows utils/clock.py, so tickets drop out when (virtual) time passes them;
+# diskcache keeps wall-clock expiry, converted when an entry is promoted.
+#
+# Keys are tuples, so no two (client, service) pairs can collide:
+#   ("tgt", client)   ("sgt", client, service)   ("stats", name)
+
+
+def tgt_key(client: str):
+    return ("tgt", client)
+
+
+def sgt_key(client: str, service: str):
+    return ("sgt", client, service)
+
+
+def ticket_expire(initial_epoch: int, ts: int, lifetime: int) -> float:
+    """Seconds until a ticket stamped ts (Kerberos minutes) stops passing nowm <= ts + lifetime."""
+    return max(1.0, initial_epoch + (ts + lifetime + 1) * 60 - clock.now())
+
+
+class _Stripe:
+    __slots__ = ("lock", "data", "l1_hits", "l1_misses", "l2_hits", "l2_misses")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data = OrderedDict()   # key -> (expire_at clock.now() seconds or None, value)
+        self.l1_hits = self.l1_misses = self.l2_hits = self.l2_misses = 0
+
+
+class TicketCache:
+    """get/set/delete/incr like diskcache.Cache, with an in-memory L1 in front of it.
+
+    path=None keeps everything in L1 (single process, nothing on disk).
+    """
+
+    def __init__(self, path: str = None, l1_size: int = 4096, stripes: int = 16):
+        self.stripes = [_Stripe() for _ in range(stripes)]
+        self.per_stripe = max(1, l1_size // stripes)
+        self.l2 = None
+        self._counters = {}          # used only without an L2
+        self._counters_lock = threading.Lock()
+        if path is not None:
+            from diskcache import Cache
+            self.l2 = Cache(path)
+
+    def _stripe(self, key) -> _Stripe:
+        return self.stripes[hash(key) % len(self.stripes)]
+
+    def _l1_put(self, stripe: _Stripe, key, value, expire_at):
+        data = stripe.data
+        data[key] = (expire_at, value)
+        data.move_to_end(key)
+        # Expired entries are dropped from the cold end as new ones arrive, then the LRU bound applies
+        now = clock.now()
+        while data:
+            oldest_expire, _ = next(iter(data.values()))
+            if len(data) > self.per_stripe or (oldest_expire is not None and oldest_expire <= now):
+                data.popitem(last=False)
+            else:
+                break
+
+    def get(self, key, default=None):
+        stripe = self._stripe(key)
+        with stripe.lock:
+            entry = stripe.data.get(key)
+            if entry is not None:
+                if entry[0] is None or entry[0] > clock.now():
+                    stripe.data.move_to_end(key)
+                    stripe.l1_hits += 1
+                    return entry[1]
+                del stripe.data[key]
+            stripe.l1_misses += 1
+        if self.l2 is None:
+            return default
+        value, expire_at = self.l2.get(key, default=None, expire_time=True)
+        with stripe.lock:
+            if value is None:
+                stripe.l2_misses += 1
+                return default
+            stripe.l2_hits += 1
+            if expire_at is not None:
+                expire_at = clock.now() + (expire_at - time.time())
+            self._l1_put(stripe, key, value, expire_at)
+        return value
+
+    def set(self, key, value, expire: float = None):
+        expire_at = None if expire is None else clock.now() + expire
+        stripe = self._stripe(key)
+        with stripe.lock:
+            self._l1_put(stripe, key, value, expire_at)
+        if self.l2 is not None:
+            self.l2.set(key, value, expire=expire)
+
+    def delete(self, key, **kwargs):
+        stripe = self._stripe(key)
+        with stripe.lock:
+            found = stripe.data.pop(key, None) is not None
+        if self.l2 is not None:
+            found = self.l2.delete(key, **kwargs) or found
+        return found
+
+    # Counters are shared between processes, so with an L2 they bypass L1 entirely
+    # (cross-process locks likewise use self.l2 directly)
+    def incr(self, key, delta: int = 1, default: int = 0):
+        if self.l2 is not None:
+            return self.l2.incr(key, delta, default)
+        with self._counters_lock:
+            value = self._counters[key] = self._counters.get(key, default) + delta
+            return value
+
+    def counter(self, key, default: int = 0):
+        if self.l2 is not None:
+            return self.l2.get(key, default)
+        with self._counters_lock:
+            return self._counters.get(key, default)
+
+    def iterkeys(self):
+        if self.l2 is not None:
+            yield from self.l2.iterkeys()
+            return
+        for stripe in self.stripes:
+            with stripe.lock:
+                keys = list(stripe.data)
+            yield from keys
+
+    def clear(self):
+        with self._counters_lock:
+            self._counters.clear()
+        for stripe in self.stripes:
+            with stripe.lock:
+                stripe.data.clear()
+        if self.l2 is not None:
+            self.l2.clear()
+
+    def stats(self):
+        """Per-tier hit rates for this process (an L2 lookup happens only after an L1 miss)."""
+        t = {name: sum(getattr(s, name) for s in self.stripes)
+             for name in ("l1_hits", "l1_misses", "l2_hits", "l2_misses")}
+        for tier in ("l1", "l2"):
+            lookups = t[f"{tier}_hits"] + t[f"{tier}_misses"]
+            t[f"{tier}_hit_rate"] = round(t[f"{tier}_hits"] / lookups, 4) if lookups else None
+        t["l1_size"] = sum(len(s.data) for s in self.stripes)
+        return t
@@ -0,0 +1,111 @@
+import hashlib
+import threading
+from typing import Union
+
+# Service tickets a server has already decrypted, keyed on a digest of the ticket ciphertext.
+# The same ciphertext always decrypts to the same contents under the server's key, so a
+# repeat presentation can skip the ticket decryption and go straight to the authenticator.
+# Entries are bucketed by their last valid minute (TS4 + Lifetime4): once the clock passes
+# it the whole bucket is dropped, so nothing outlives the ticket it came from.
+
+
+class VerifiedTicket:
+    __slots__ = ("client_id", "Kc_v", "ts", "lifetime")
+
+    def __init__(self, client_id: str, Kc_v, ts: int, lifetime: int):
+        self.client_id = client_id
+        self.Kc_v = Kc_v          # KeyHandle, so the session key schedule is reused too
+        self.ts = ts
+        self.lifetime = lifetime
+
+
+class _Shard:
+    __slots__ = ("lock", "entries", "buckets", "expired_before", "hits", "misses", "evictions")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}           # digest -> VerifiedTicket
+        self.buckets = {}           # last valid minute -> set of digests
+        self.expired_before = None
+        self.hits = self.misses = self.evictions = 0  # updated under lock, summed on read
+
+
+class VerifiedTicketCache:
+    """Bounded, sharded cache of decrypted service tickets; max_entries=0 disables it."""
+
+    def __init__(self, max_entries: int = 65536, shards: int = 16):
+        # Fewer shards than entries, so a small max_entries doesn't round down to no cache at all
+        shards = max(1, min(shards, max_entries))
+        self._shards = [_Shard() for _ in range(shards)]
+        self.per_shard = max_entries // shards if max_entries > 0 else 0
+
+    @staticmethod
+    def digest(ticket: Union[str, bytes]) -> bytes:
+        if isinstance(ticket, str):
+            ticket = ticket.encode("ascii")
+        return hashlib.blake2b(ticket, digest_size=16).digest()
+
+    def _shard(self, digest: bytes) -> _Shard:
+        return self._shards[digest[0] % len(self._shards)]
+
+    def get(self, digest: bytes, nowm: int):
+        if not self.per_shard:
+            return None
+        shard = self._shard(digest)
+        with shard.lock:
+            self._expire(shard, nowm)
+            entry = shard.entries.get(digest)
+            if entry is None:
+                shard.misses += 1
+            else:
+                shard.hits += 1
+        return entry
+
+    def put(self, digest: bytes, entry: VerifiedTicket, nowm: int):
+        if not self.per_shard:
+            return
+        end = entry.ts + entry.lifetime
+        shard = self._shard(digest)
+        with shard.lock:
+            self._expire(shard, nowm)
+            if digest in shard.entries:
+                return
+            while len(shard.entries) >= self.per_shard:
+                self._evict_soonest(shard)
+            shard.entries[digest] = entry
+            shard.buckets.setdefault(end, set()).add(digest)
+
+    def _expire(self, shard: _Shard, nowm: int):
+        if shard.expired_before == nowm:
+            return
+        shard.expired_before = nowm
+        for end in [e for e in shard.buckets if e < nowm]:
+            for digest in shard.buckets.pop(end):
+                del shard.entries[digest]
+
+    def _evict_soonest(self, shard: _Shard):
+        # Full: give up the tickets closest to expiry, they have the least reuse left in them
+        end = min(shard.buckets)
+        bucket = shard.buckets[end]
+        del shard.entries[bucket.pop()]
+        if not bucket:
+            del shard.buckets[end]
+        shard.evictions += 1
+
+    @property
+    def hits(self) -> int:
+        return sum(s.hits for s in self._shards)
+
+    @property
+    def misses(self) -> int:
+        return sum(s.misses for s in self._shards)
+
+    @property
+    def evictions(self) -> int:
+        return sum(s.evictions for s in self._shards)
+
+    def __len__(self):
+        return sum(len(s.entries) for s in self._shards)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self)}
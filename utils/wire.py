@@ -0,0 +1,133 @@
+import struct
+from typing import Any
+
+# Frame header versions. A JSON frame is the original 4-byte big-endian length (top bit
+# clear); any other version sets the top bit of the first byte, followed by a 3-byte length.
+WIRE_JSON = 0
+WIRE_BINARY = 1
+
+# ---------- Compact binary codec (msgpack-style subset) ----------
+# Covers what tickets, authenticators and envelopes contain: None, bool, int, str,
+# raw bytes (ciphertext), lists and dicts. Ciphertext travels as bytes, so nothing is
+# base64-encoded and nested tickets are not re-inflated.
+_NIL, _FALSE, _TRUE = 0xC0, 0xC2, 0xC3
+_BIN8, _BIN32 = 0xC4, 0xC6
+_INT64 = 0xD3
+_STR32, _ARR32, _MAP32 = 0xDB, 0xDD, 0xDF
+
+_pack_q = struct.Struct('!q').pack
+_pack_I = struct.Struct('!I').pack
+_unpack_q = struct.Struct('!q').unpack_from
+_unpack_I = struct.Struct('!I').unpack_from
+
+
+def pack(obj: Any) -> bytes:
+    out = bytearray()
+    _pack_into(out, obj)
+    return bytes(out)
+
+
+def pack_into(out: bytearray, obj: Any) -> None:
+    """Append obj's packed form to out (e.g. behind a frame header already in it)."""
+    _pack_into(out, obj)
+
+
+def _pack_into(out: bytearray, obj: Any) -> None:
+    if obj is None:
+        out.append(_NIL)
+    elif obj is True:
+        out.append(_TRUE)
+    elif obj is False:
+        out.append(_FALSE)
+    elif isinstance(obj, int):
+        if 0 <= obj < 0x80:
+            out.append(obj)
+        else:
+            out.append(_INT64)
+            out += _pack_q(obj)
+    elif isinstance(obj, str):
+        data = obj.encode('utf-8')
+        if len(data) < 32:
+            out.append(0xA0 | len(data))
+        else:
+            out.append(_STR32)
+            out += _pack_I(len(data))
+        out += data
+    elif isinstance(obj, (bytes, bytearray, memoryview)):
+        if len(obj) < 256:
+            out.append(_BIN8)
+            out.append(len(obj))
+        else:
+            out.append(_BIN32)
+            out += _pack_I(len(obj))
+        out += obj
+    elif isinstance(obj, dict):
+        if len(obj) < 16:
+            out.append(0x80 | len(obj))
+        else:
+            out.append(_MAP32)
+            out += _pack_I(len(obj))
+        for k, v in obj.items():
+            _pack_into(out, k)
+            _pack_into(out, v)
+    elif isinstance(obj, (list, tuple)):
+        out.append(_ARR32)
+        out += _pack_I(len(obj))
+        for v in obj:
+            _pack_into(out, v)
+    else:
+        raise TypeError(f"cannot pack {type(obj).__name__}")
+
+
+def unpack(buf) -> Any:
+    obj, pos = _unpack_from(memoryview(buf), 0)
+    if pos != len(buf):
+        raise ValueError("trailing bytes after packed object")
+    return obj
+
+
+def _unpack_from(buf: memoryview, pos: int):
+    tag = buf[pos]
+    pos += 1
+    if tag < 0x80:
+        return tag, pos
+    if 0xA0 <= tag < 0xC0:
+        n = tag & 0x1F
+        return str(buf[pos:pos + n], 'utf-8'), pos + n
+    if 0x80 <= tag < 0x90:
+        return _unpack_map(buf, pos, tag & 0x0F)
+    if tag == _NIL:
+        return None, pos
+    if tag == _TRUE:
+        return True, pos
+    if tag == _FALSE:
+        return False, pos
+    if tag == _INT64:
+        return _unpack_q(buf, pos)[0], pos + 8
+    if tag == _BIN8:
+        n = buf[pos]
+        pos += 1
+        return bytes(buf[pos:pos + n]), pos + n
+    if tag in (_BIN32, _STR32, _ARR32, _MAP32):
+        (n,) = _unpack_I(buf, pos)
+        pos += 4
+        if tag == _BIN32:
+            return bytes(buf[pos:pos + n]), pos + n
+        if tag == _STR32:
+            return str(buf[pos:pos + n], 'utf-8'), pos + n
+        if tag == _MAP32:
+            return _unpack_map(buf, pos, n)
+        items = []
+        for _ in range(n):
+            v, pos = _unpack_from(buf, pos)
+            items.append(v)
+        return items, pos
+    raise ValueError(f"bad type tag 0x{tag:02x}")
+
+
+def _unpack_map(buf: memoryview, pos: int, n: int):
+    d = {}
+    for _ in range(n):
+        k, pos = _unpack_from(buf, pos)
+        d[k], pos = _unpack_from(buf, pos)
+    return d, pos